@@ -1,36 +1,111 @@
+import os
 import sys
-from simpl_parser import Lexer, Parser
-from simpl_interpreter import InitialState, Mem, Int, RuntimeError
-from simpl_typing import TypeError, TypeCircularityError
-from simpl_lib import initial_runtime_env, initial_type_env
-sys.setrecursionlimit(10000)
+from simpl_api import Interpreter, backend
 
 
-def run(filename):
-    try:
-        with open(filename, 'r') as f:
-            content = f.read()
+def interpret(content, *, checkpoint=None, interval=None, **options):
+    return Interpreter(**options).interpret(content, checkpoint, interval)
 
-        lexer = Lexer(content)
-        parser = Parser(lexer)
-        program = parser.parse()
 
-        program.typecheck(initial_type_env())
+def resume(path, interval=None):
+    return Interpreter().resume(path, interval)
 
-        v = program.eval(InitialState.of(initial_runtime_env(), Mem(), Int(0)))
 
-        print(v)
-
-    except RuntimeError as e:
-        print("runtime error")
-    except (TypeError, TypeCircularityError) as e:
-        print("type error")
+def run(filename, *, checkpoint=None, interval=None, **options):
+    it = Interpreter(base=os.path.dirname(filename) or ".", **options)
+    try:
+        with open(filename, 'r') as f:
+            content = f.read()
     except Exception as e:
-        print("syntax error")
+        error = "io error" if isinstance(e, OSError) else "syntax error"
+        if it.telemetry:
+            it.telemetry.emit({"backend": backend(it.workers, it.jit, checkpoint, it.vm)}, error)
+        print(error)
+        return
+    value, error = it.interpret(content, checkpoint, interval)
+    print(error or value)
+
+
+def main(argv):
+    import argparse
+    ap = argparse.ArgumentParser(prog="simpl.py")
+    ap.add_argument("file", nargs="?")
+    ap.add_argument("-j", "--jobs", type=int, default=0,
+                    help="evaluate independent pure subexpressions on N worker processes")
+    ap.add_argument("--jit", action="store_true",
+                    help="compile hot while loops to Python and report tier-up events")
+    ap.add_argument("--checkpoint", metavar="PATH",
+                    help="evaluate on the step machine, snapshotting its state to PATH "
+                         "(calls into map/foldl run to completion between snapshots)")
+    ap.add_argument("--interval", type=int, default=None,
+                    help="steps between checkpoints (default 100000)")
+    ap.add_argument("--resume", metavar="PATH",
+                    help="continue an evaluation from a checkpoint")
+    ap.add_argument("--vm", action="store_true",
+                    help="compile to bytecode and run it on the stack VM")
+    ap.add_argument("--deep", action="store_true",
+                    help="typecheck with an explicit work stack and evaluate on a large thread "
+                         "stack; let, ;, :: and + chains nest to about 10^5")
+    ap.add_argument("--hoisted", action="store_true",
+                    help="report loop-invariant expressions hoisted out of while loops")
+    ap.add_argument("--profile", metavar="PATH",
+                    help="sample the SimPL call stack and write collapsed stacks to PATH (- for stderr)")
+    ap.add_argument("--sample-rate", type=int, default=100,
+                    help="profiler samples per CPU second (default 100)")
+    ap.add_argument("--type-stats", choices=("text", "json"),
+                    help="report unification, substitution and typecheck metrics to stderr")
+    ap.add_argument("--memory-stats", choices=("text", "json"),
+                    help="report live interpreter objects and heap usage per phase to stderr")
+    ap.add_argument("--memory-limit", type=int, metavar="BYTES",
+                    help="abort evaluation with \"memory limit\" once accounted objects exceed BYTES")
+    ap.add_argument("--telemetry", metavar="TARGET",
+                    help="append one JSON record per run to a file, udp://host:port or tcp://host:port")
+    ap.add_argument("--telemetry-steps", action="store_true",
+                    help="also count evaluated nodes in the telemetry record (slows evaluation; "
+                         "omitted on backends that bypass the tree walker)")
+    args = ap.parse_args(argv)
+    if args.vm and args.memory_limit is not None:
+        ap.error("--memory-limit is not accounted on the --vm backend")
+    if args.memory_stats:
+        import simpl_memory
+        simpl_memory.enable(trace=True)
+    if args.type_stats:
+        import simpl_typestats
+        simpl_typestats.enable()
+    if args.resume:
+        value, error = resume(args.resume, args.interval)
+        print(error or value)
+    elif args.file:
+        profiler = None
+        if args.profile:
+            from simpl_profile import Profiler
+            profiler = Profiler(1 / args.sample_rate)
+        telemetry = None
+        if args.telemetry:
+            from simpl_telemetry import Telemetry
+            telemetry = Telemetry(args.telemetry, args.telemetry_steps)
+        events = [] if args.jit or args.hoisted else None
+        run(args.file, checkpoint=args.checkpoint, interval=args.interval, workers=args.jobs,
+            jit=args.jit, vm=args.vm, profiler=profiler, memory_limit=args.memory_limit,
+            telemetry=telemetry, deep=args.deep, events=events)
+        if profiler:
+            profiler.write(args.profile)
+        if args.jit:
+            from simpl_jit import report
+            report(events)
+        if args.hoisted:
+            from simpl_licm import report
+            report(events)
+    else:
+        print("no input file")
+    if args.type_stats:
+        simpl_typestats.report(args.type_stats)
+    if args.memory_stats:
+        simpl_memory.report(args.memory_stats)
 
 
 if __name__ == "__main__":
-    if len(sys.argv) > 1:
+    if len(sys.argv) == 2 and not sys.argv[1].startswith("-"):
         run(sys.argv[1])
     else:
-        print("no input file")
+        main(sys.argv[1:])
@@ -0,0 +1,354 @@
+import sys
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor
+from itertools import count
+from simpl_parser import Lexer, Parser
+from simpl_interpreter import *
+from simpl_typing import *
+from simpl_ast import apply
+from simpl_lib import initial_runtime_env, initial_type_env, items, to_list
+from simpl_specialize import specialize
+from simpl_memo import MemoTable, memoize, strip, unwrap
+from simpl_infer import infer
+from simpl_escape import scalarize
+from simpl_licm import hoist
+from simpl_fuse import fuse
+from simpl_memory import MemoryLimitError, limit, phase
+
+RECURSION_LIMIT = 10000
+DEEP_RECURSION_LIMIT = 10 ** 6
+STACK_SIZE = 64 * 1024 * 1024
+STACK_LOCK = threading.Lock()
+
+
+class LinkError(Exception):
+    pass
+
+
+class SimplError(Exception):
+    def __init__(self, category, detail=""):
+        super().__init__(f"{category}: {detail}" if detail else category)
+        self.category = category
+        self.detail = detail
+
+
+@dataclass
+class Result:
+    value: object = None
+    type: str = None
+    error: str = None
+    detail: str = ""
+
+    def unwrap(self):
+        if self.error:
+            raise SimplError(self.error, self.detail)
+        return self.value
+
+
+def to_value(x):
+    if isinstance(x, Value):
+        return x
+    if isinstance(x, bool):
+        return BoolValue(x)
+    if isinstance(x, int):
+        return IntValue(x)
+    if x is None or x == ():
+        return Value.UNIT
+    if isinstance(x, tuple) and len(x) == 2:
+        return PairValue(to_value(x[0]), to_value(x[1]))
+    if isinstance(x, list):
+        return to_list([to_value(v) for v in x])
+    raise TypeError(f"no SimPL value for {type(x).__name__}")
+
+
+def from_value(v):
+    if isinstance(v, IntValue):
+        return v.n
+    if isinstance(v, BoolValue):
+        return v.b
+    if isinstance(v, UnitValue):
+        return None
+    if isinstance(v, PairValue):
+        return from_value(v.v1), from_value(v.v2)
+    if isinstance(v, (ConsValue, NilValue)):
+        return [from_value(x) for x in items(v)]
+    return v
+
+
+def type_of(x):
+    if isinstance(x, Value):
+        return TypeVar(False)
+    if isinstance(x, bool):
+        return Type.BOOL
+    if isinstance(x, int):
+        return Type.INT
+    if x is None or x == ():
+        return Type.UNIT
+    if isinstance(x, tuple) and len(x) == 2:
+        return PairType(type_of(x[0]), type_of(x[1]))
+    if isinstance(x, list):
+        t = TypeVar(False)
+        for v in x:
+            t = t.unify(type_of(v)).apply(t)
+        return ListType(t)
+    raise TypeError(f"no SimPL type for {type(x).__name__}")
+
+
+def backend(workers=0, jit=False, checkpoint=None, vm=False):
+    return ("machine" if checkpoint else "workers" if workers else "vm" if vm else
+            "jit" if jit else "tree")
+
+
+class Program:
+    def __init__(self, interpreter, program, t):
+        self.interpreter = interpreter
+        self.program = program
+        self.type = t
+
+    def __str__(self): return str(self.type)
+
+    def check(self, args):
+        t = self.type
+        for x in args:
+            r = TypeVar(False)
+            t = ArrowType(type_of(x), r).unify(t).apply(r)
+        return t
+
+    def call(self, *args):
+        it = self.interpreter
+        with it.context():
+            try:
+                t = self.check(args)
+                with it.limit():
+                    s = it.state()
+                    v = self.program.eval(s)
+                    for x in args:
+                        v = apply(v, to_value(x), s)
+                    return Result(from_value(v), str(t))
+            except MemoryLimitError as e:
+                return Result(error="memory limit", detail=str(e))
+            except RuntimeError as e:
+                return Result(error="runtime error", detail=str(e))
+            except RecursionError as e:
+                return Result(error="runtime error", detail="recursion limit exceeded")
+            except TypeError as e:
+                return Result(error="type error", detail=str(e))
+
+    def __call__(self, *args):
+        return self.call(*args).unwrap()
+
+
+class Interpreter:
+    def __init__(self, workers=0, jit=False, vm=False, base=None,
+                 recursion_limit=RECURSION_LIMIT, stack_size=STACK_SIZE, profiler=None,
+                 memory_limit=None, telemetry=None, deep=False, events=None):
+        if vm and memory_limit is not None:
+            raise ValueError("memory_limit is not accounted on the vm backend")
+        self.workers = workers
+        self.jit = jit
+        self.vm = vm
+        self.base = base or "."
+        self.recursion_limit = recursion_limit
+        self.stack_size = stack_size
+        self.profiler = profiler
+        self.memory_limit = memory_limit
+        self.telemetry = telemetry
+        self.deep = deep
+        self.events = events
+        self.record = {}
+        self.supply = count(1)
+        self.memos = MemoTable()
+        self.modules = {}
+        self.M = None
+        self.p = None
+
+    def clone(self):
+        return Interpreter(self.workers, self.jit, self.vm, self.base,
+                           self.recursion_limit, self.stack_size, memory_limit=self.memory_limit,
+                           telemetry=self.telemetry, deep=self.deep, events=self.events)
+
+    @contextmanager
+    def context(self):
+        saved = sys.getrecursionlimit()
+        wanted = max(self.recursion_limit, DEEP_RECURSION_LIMIT) if self.deep else self.recursion_limit
+        if saved < wanted:
+            sys.setrecursionlimit(wanted)
+        token = tv_supply.set(self.supply)
+        try:
+            yield self
+        finally:
+            tv_supply.reset(token)
+            if self.deep:
+                sys.setrecursionlimit(saved)
+
+    def call(self, f, *args):
+        def run():
+            with self.context():
+                return f(*args)
+        if not self.deep:
+            return run()
+        with STACK_LOCK:
+            old = threading.stack_size(self.stack_size)
+            try:
+                pool = ThreadPoolExecutor(1)
+                future = pool.submit(run)
+            finally:
+                threading.stack_size(old)
+        pool.shutdown()
+        return future.result()
+
+    @contextmanager
+    def phase(self, name):
+        t0 = time.perf_counter()
+        with phase(name):
+            yield
+        self.record[f"{name}_ms"] = round((time.perf_counter() - t0) * 1000, 3)
+
+    def limit(self):
+        return limit(self.memory_limit) if self.memory_limit is not None else nullcontext()
+
+    def state(self):
+        return InitialState.of(initial_runtime_env(), Mem(), Int(0))
+
+    def interpret(self, content, checkpoint=None, interval=None):
+        self.record = {"backend": backend(self.workers, self.jit, checkpoint, self.vm),
+                       "bytes": len(content)}
+        value, error = self.call(self.attempt, content, checkpoint, interval)
+        if self.telemetry:
+            self.telemetry.emit(self.record, error)
+        return value, error
+
+    def attempt(self, content, checkpoint=None, interval=None):
+        try:
+            with self.limit():
+                return self.evaluate(content, checkpoint, interval), None
+        except MemoryLimitError as e:
+            return None, "memory limit"
+        except RuntimeError as e:
+            return None, "runtime error"
+        except (TypeError, TypeCircularityError) as e:
+            return None, "type error"
+        except LinkError as e:
+            return None, "import error"
+        except RecursionError as e:
+            return None, "runtime error"
+        except Exception as e:
+            return None, "syntax error"
+
+    def compile(self, content):
+        with self.context():
+            try:
+                return Program(self, *self.front(content))
+            except TypeError as e:
+                raise SimplError("type error", str(e)) from e
+            except LinkError as e:
+                raise SimplError("import error", str(e)) from e
+            except RecursionError as e:
+                raise SimplError("runtime error", "recursion limit exceeded") from e
+            except Exception as e:
+                raise SimplError("syntax error", str(e)) from e
+
+    def front(self, content):
+        with self.phase("lex"):
+            lexer = Lexer(content)
+        self.record["tokens"] = len(lexer)
+        with self.phase("parse"):
+            parser = Parser(lexer)
+            program = parser.parse()
+            if parser.imports:
+                from simpl_module import Loader, ModuleError
+                try:
+                    Loader(modules=self.modules).link(parser.imports, self.base)
+                except ModuleError as e:
+                    raise LinkError(str(e))
+        if self.telemetry:
+            from simpl_telemetry import nodes
+            self.record["nodes"] = nodes(program)
+
+        with self.phase("typecheck"):
+            r = self.typecheck(program)
+        with self.phase("optimize"):
+            program = scalarize(specialize(program, r.s))
+            if self.jit:
+                from simpl_jit import tier
+                program = tier(program, self.events)
+            else:
+                program = fuse(hoist(program, self.events))
+        return program, r.s.apply(r.t)
+
+    def typecheck(self, program):
+        E = initial_type_env()
+        if not self.deep:
+            sites = memoize(program, self.memos)
+            try:
+                r = program.typecheck(E)
+                strip(sites)
+                self.record["checker"] = "recursive"
+                return r
+            except RecursionError:
+                unwrap(sites)
+        self.record["checker"] = "infer"
+        return infer(program, E)
+
+    def evaluate(self, content, checkpoint=None, interval=None):
+        program, t = self.front(content)
+        with self.phase("eval"):
+            if self.telemetry and self.telemetry.steps and self.record["backend"] == "tree":
+                from simpl_telemetry import counting
+                with counting() as steps:
+                    v = self.run(program, t, checkpoint, interval)
+                self.record["steps"] = steps.n
+            else:
+                v = self.run(program, t, checkpoint, interval)
+        self.record["cells"] = len(self.M.map)
+        return str(v)
+
+    def run(self, program, t, checkpoint=None, interval=None):
+        s = self.state()
+        self.M, self.p = s.M, s.p
+        if checkpoint:
+            from simpl_machine import Machine, INTERVAL
+            v = Machine(program, s).run(checkpoint, interval or INTERVAL)
+        elif self.workers:
+            from simpl_parallel import evaluate
+            v = evaluate(program, s, self.workers)
+        elif self.vm:
+            from simpl_vm import evaluate
+            v = evaluate(program, s, t)
+        elif self.profiler:
+            v = self.profiler.run(program, s)
+        else:
+            v = program.eval(s)
+        return v
+
+    def resume(self, path, interval=None):
+        from simpl_machine import Machine, INTERVAL
+        with self.context():
+            try:
+                m = Machine.load(path)
+            except Exception as e:
+                return None, "bad checkpoint"
+            try:
+                with self.limit():
+                    return str(m.run(path, interval or INTERVAL)), None
+            except MemoryLimitError as e:
+                return None, "memory limit"
+            except RuntimeError as e:
+                return None, "runtime error"
+            except RecursionError as e:
+                return None, "runtime error"
+            except Exception as e:
+                return None, "bad checkpoint"
+
+    def map(self, contents, threads=4):
+        with ThreadPoolExecutor(threads) as pool:
+            with STACK_LOCK:
+                old = threading.stack_size(self.stack_size)
+                try:
+                    futures = [pool.submit(self.clone().interpret, c) for c in contents]
+                finally:
+                    threading.stack_size(old)
+            return [f.result() for f in futures]
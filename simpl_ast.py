@@ -1,4 +1,5 @@
-from dataclasses import dataclass
+from copy import copy
+from dataclasses import dataclass, is_dataclass, replace
 from simpl_typing import *
 from simpl_interpreter import *
 
@@ -6,33 +7,75 @@ from simpl_interpreter import *
 class Expr:
     def typecheck(self, E): raise NotImplementedError()
     def eval(self, s): raise NotImplementedError()
+    def eval_int(self, s): return self.eval(s).n
+    def eval_bool(self, s): return self.eval(s).b
+
+    def typed(self, s, t):
+        self.type = t
+        return TypeResult.of(s, t)
+
+    def children(self):
+        return [v for v in vars(self).values() if isinstance(v, Expr)]
+
+    def map(self, f):
+        if not is_dataclass(self):
+            return self
+        e = replace(self, **{k: f(v) for k, v in vars(self).items() if isinstance(v, Expr)})
+        for k, v in vars(self).items():
+            if k not in vars(e):
+                setattr(e, k, v)
+        return e
+
+
+def rebuild(program, f, enter=None, context=None):
+    done = {}
+    stack = [(program, context)]
+    while stack:
+        e, c = stack[-1]
+        pending = [(v, enter(e, v, c) if enter else c) for v in e.children() if id(v) not in done]
+        if pending:
+            stack += pending
+            continue
+        stack.pop()
+        if id(e) in done:
+            continue
+        n = e
+        changed = {k: done[id(v)] for k, v in vars(e).items()
+                   if isinstance(v, Expr) and done[id(v)] is not v}
+        if changed:
+            n = copy(e)
+            vars(n).update(changed)
+        done[id(e)] = f(n, c)
+    return done[id(program)]
 
 
 @dataclass
 class IntegerLiteral(Expr):
     n: int
     def __str__(self): return str(self.n)
-    def typecheck(self, E): return TypeResult.of(Identity(), Type.INT)
+    def typecheck(self, E): return self.typed(Identity(), Type.INT)
     def eval(self, s): return IntValue(self.n)
+    def eval_int(self, s): return self.n
 
 
 @dataclass
 class BooleanLiteral(Expr):
     b: bool
     def __str__(self): return str(self.b).lower()
-    def typecheck(self, E): return TypeResult.of(Identity(), Type.BOOL)
+    def typecheck(self, E): return self.typed(Identity(), Type.BOOL)
     def eval(self, s): return BoolValue(self.b)
+    def eval_bool(self, s): return self.b
 
 
 class Unit(Expr):
     def __str__(self): return "()"
-    def typecheck(self, E): return TypeResult.of(Identity(), Type.UNIT)
+    def typecheck(self, E): return self.typed(Identity(), Type.UNIT)
     def eval(self, s): return Value.UNIT
 
 
 class Nil(Expr):
     def __str__(self): return "nil"
-    def typecheck(self, E): return TypeResult.of(
+    def typecheck(self, E): return self.typed(
         Identity(), ListType(TypeVar(True)))
 
     def eval(self, s): return Value.NIL
@@ -47,7 +90,9 @@ class Name(Expr):
         t = E.get(self.x)
         if t is None:
             raise TypeError("name")
-        return TypeResult.of(Identity(), t)
+        if isinstance(t, TypeScheme):
+            t = t.instantiate()
+        return self.typed(Identity(), t)
 
     def eval(self, s):
         v = s.E.get(self.x)
@@ -57,6 +102,22 @@ class Name(Expr):
             return Rec(v.x, v.e).eval(State.of(v.E, s.M, s.p))
         return v
 
+    def eval_int(self, s):
+        v = s.E.get(self.x)
+        if v is None:
+            raise RuntimeError("name")
+        if isinstance(v, RecValue):
+            return self.eval(s).n
+        return v.n
+
+    def eval_bool(self, s):
+        v = s.E.get(self.x)
+        if v is None:
+            raise RuntimeError("name")
+        if isinstance(v, RecValue):
+            return self.eval(s).b
+        return v.b
+
 
 @dataclass
 class BinaryExpr(Expr):
@@ -73,10 +134,13 @@ class Add(BinaryExpr):
         s = r2.s.compose(r1.s)
         s = s.compose(r1.t.unify(Type.INT))
         s = s.compose(r2.t.unify(Type.INT))
-        return TypeResult.of(s, Type.INT)
+        return self.typed(s, Type.INT)
 
     def eval(self, s):
-        return IntValue(self.l.eval(s).n + self.r.eval(s).n)
+        return IntValue(self.l.eval_int(s) + self.r.eval_int(s))
+
+    def eval_int(self, s):
+        return self.l.eval_int(s) + self.r.eval_int(s)
 
 
 class Sub(BinaryExpr):
@@ -88,10 +152,13 @@ class Sub(BinaryExpr):
         s = r2.s.compose(r1.s)
         s = s.compose(r1.t.unify(Type.INT))
         s = s.compose(r2.t.unify(Type.INT))
-        return TypeResult.of(s, Type.INT)
+        return self.typed(s, Type.INT)
 
     def eval(self, s):
-        return IntValue(self.l.eval(s).n - self.r.eval(s).n)
+        return IntValue(self.l.eval_int(s) - self.r.eval_int(s))
+
+    def eval_int(self, s):
+        return self.l.eval_int(s) - self.r.eval_int(s)
 
 
 class Mul(BinaryExpr):
@@ -103,10 +170,13 @@ class Mul(BinaryExpr):
         s = r2.s.compose(r1.s)
         s = s.compose(r1.t.unify(Type.INT))
         s = s.compose(r2.t.unify(Type.INT))
-        return TypeResult.of(s, Type.INT)
+        return self.typed(s, Type.INT)
 
     def eval(self, s):
-        return IntValue(self.l.eval(s).n * self.r.eval(s).n)
+        return IntValue(self.l.eval_int(s) * self.r.eval_int(s))
+
+    def eval_int(self, s):
+        return self.l.eval_int(s) * self.r.eval_int(s)
 
 
 class Div(BinaryExpr):
@@ -118,13 +188,16 @@ class Div(BinaryExpr):
         s = r2.s.compose(r1.s)
         s = s.compose(r1.t.unify(Type.INT))
         s = s.compose(r2.t.unify(Type.INT))
-        return TypeResult.of(s, Type.INT)
+        return self.typed(s, Type.INT)
 
     def eval(self, s):
-        v2 = self.r.eval(s).n
+        return IntValue(self.eval_int(s))
+
+    def eval_int(self, s):
+        v2 = self.r.eval_int(s)
         if v2 == 0:
             raise RuntimeError("division by zero")
-        return IntValue(int(self.l.eval(s).n / v2))
+        return int(self.l.eval_int(s) / v2)
 
 
 class Mod(BinaryExpr):
@@ -136,13 +209,16 @@ class Mod(BinaryExpr):
         s = r2.s.compose(r1.s)
         s = s.compose(r1.t.unify(Type.INT))
         s = s.compose(r2.t.unify(Type.INT))
-        return TypeResult.of(s, Type.INT)
+        return self.typed(s, Type.INT)
 
     def eval(self, s):
-        v2 = self.r.eval(s).n
+        return IntValue(self.eval_int(s))
+
+    def eval_int(self, s):
+        v2 = self.r.eval_int(s)
         if v2 == 0:
             raise RuntimeError("division by zero")
-        return IntValue(self.l.eval(s).n % v2)
+        return self.l.eval_int(s) % v2
 
 
 class Eq(BinaryExpr):
@@ -155,11 +231,14 @@ class Eq(BinaryExpr):
         s = s.compose(r1.t.unify(r2.t))
         if not s.apply(r1.t).is_equality_type():
             raise TypeError("eq")
-        return TypeResult.of(s, Type.BOOL)
+        return self.typed(s, Type.BOOL)
 
     def eval(self, s):
         return BoolValue(self.l.eval(s) == self.r.eval(s))
 
+    def eval_bool(self, s):
+        return self.l.eval(s) == self.r.eval(s)
+
 
 class Neq(BinaryExpr):
     def __str__(self): return f"({self.l} <> {self.r})"
@@ -171,11 +250,14 @@ class Neq(BinaryExpr):
         s = s.compose(r1.t.unify(r2.t))
         if not s.apply(r1.t).is_equality_type():
             raise TypeError("neq")
-        return TypeResult.of(s, Type.BOOL)
+        return self.typed(s, Type.BOOL)
 
     def eval(self, s):
         return BoolValue(not (self.l.eval(s) == self.r.eval(s)))
 
+    def eval_bool(self, s):
+        return not (self.l.eval(s) == self.r.eval(s))
+
 
 class Less(BinaryExpr):
     def __str__(self): return f"({self.l} < {self.r})"
@@ -186,10 +268,13 @@ class Less(BinaryExpr):
         s = r2.s.compose(r1.s)
         s = s.compose(r1.t.unify(Type.INT))
         s = s.compose(r2.t.unify(Type.INT))
-        return TypeResult.of(s, Type.BOOL)
+        return self.typed(s, Type.BOOL)
 
     def eval(self, s):
-        return BoolValue(self.l.eval(s).n < self.r.eval(s).n)
+        return BoolValue(self.l.eval_int(s) < self.r.eval_int(s))
+
+    def eval_bool(self, s):
+        return self.l.eval_int(s) < self.r.eval_int(s)
 
 
 class LessEq(BinaryExpr):
@@ -201,10 +286,13 @@ class LessEq(BinaryExpr):
         s = r2.s.compose(r1.s)
         s = s.compose(r1.t.unify(Type.INT))
         s = s.compose(r2.t.unify(Type.INT))
-        return TypeResult.of(s, Type.BOOL)
+        return self.typed(s, Type.BOOL)
 
     def eval(self, s):
-        return BoolValue(self.l.eval(s).n <= self.r.eval(s).n)
+        return BoolValue(self.l.eval_int(s) <= self.r.eval_int(s))
+
+    def eval_bool(self, s):
+        return self.l.eval_int(s) <= self.r.eval_int(s)
 
 
 class Greater(BinaryExpr):
@@ -216,10 +304,13 @@ class Greater(BinaryExpr):
         s = r2.s.compose(r1.s)
         s = s.compose(r1.t.unify(Type.INT))
         s = s.compose(r2.t.unify(Type.INT))
-        return TypeResult.of(s, Type.BOOL)
+        return self.typed(s, Type.BOOL)
 
     def eval(self, s):
-        return BoolValue(self.l.eval(s).n > self.r.eval(s).n)
+        return BoolValue(self.l.eval_int(s) > self.r.eval_int(s))
+
+    def eval_bool(self, s):
+        return self.l.eval_int(s) > self.r.eval_int(s)
 
 
 class GreaterEq(BinaryExpr):
@@ -231,10 +322,13 @@ class GreaterEq(BinaryExpr):
         s = r2.s.compose(r1.s)
         s = s.compose(r1.t.unify(Type.INT))
         s = s.compose(r2.t.unify(Type.INT))
-        return TypeResult.of(s, Type.BOOL)
+        return self.typed(s, Type.BOOL)
 
     def eval(self, s):
-        return BoolValue(self.l.eval(s).n >= self.r.eval(s).n)
+        return BoolValue(self.l.eval_int(s) >= self.r.eval_int(s))
+
+    def eval_bool(self, s):
+        return self.l.eval_int(s) >= self.r.eval_int(s)
 
 
 class AndAlso(BinaryExpr):
@@ -246,13 +340,13 @@ class AndAlso(BinaryExpr):
         s = r2.s.compose(r1.s)
         s = s.compose(r1.t.unify(Type.BOOL))
         s = s.compose(r2.t.unify(Type.BOOL))
-        return TypeResult.of(s, Type.BOOL)
+        return self.typed(s, Type.BOOL)
 
     def eval(self, s):
-        v1 = self.l.eval(s)
-        if not v1.b:
-            return BoolValue(False)
-        return BoolValue(self.r.eval(s).b)
+        return BoolValue(self.eval_bool(s))
+
+    def eval_bool(self, s):
+        return self.l.eval_bool(s) and self.r.eval_bool(s)
 
 
 class OrElse(BinaryExpr):
@@ -264,13 +358,13 @@ class OrElse(BinaryExpr):
         s = r2.s.compose(r1.s)
         s = s.compose(r1.t.unify(Type.BOOL))
         s = s.compose(r2.t.unify(Type.BOOL))
-        return TypeResult.of(s, Type.BOOL)
+        return self.typed(s, Type.BOOL)
 
     def eval(self, s):
-        v1 = self.l.eval(s)
-        if v1.b:
-            return BoolValue(True)
-        return BoolValue(self.r.eval(s).b)
+        return BoolValue(self.eval_bool(s))
+
+    def eval_bool(self, s):
+        return self.l.eval_bool(s) or self.r.eval_bool(s)
 
 
 class Pair(BinaryExpr):
@@ -279,7 +373,7 @@ class Pair(BinaryExpr):
     def typecheck(self, E):
         r1 = self.l.typecheck(E)
         r2 = self.r.typecheck(r1.s.compose(E))
-        return TypeResult.of(r2.s.compose(r1.s), PairType(r1.t, r2.t))
+        return self.typed(r2.s.compose(r1.s), PairType(r1.t, r2.t))
 
     def eval(self, s):
         return PairValue(self.l.eval(s), self.r.eval(s))
@@ -293,7 +387,7 @@ class Cons(BinaryExpr):
         r2 = self.r.typecheck(r1.s.compose(E))
         s = r2.s.compose(r1.s)
         s = s.compose(r2.t.unify(ListType(r1.t)))
-        return TypeResult.of(s, s.apply(r2.t))
+        return self.typed(s, s.apply(r2.t))
 
     def eval(self, s):
         return ConsValue(self.l.eval(s), self.r.eval(s))
@@ -305,12 +399,20 @@ class Seq(BinaryExpr):
     def typecheck(self, E):
         r1 = self.l.typecheck(E)
         r2 = self.r.typecheck(r1.s.compose(E))
-        return TypeResult.of(r2.s.compose(r1.s), r2.t)
+        return self.typed(r2.s.compose(r1.s), r2.t)
 
     def eval(self, s):
         self.l.eval(s)
         return self.r.eval(s)
 
+    def eval_int(self, s):
+        self.l.eval(s)
+        return self.r.eval_int(s)
+
+    def eval_bool(self, s):
+        self.l.eval(s)
+        return self.r.eval_bool(s)
+
 
 class Assign(BinaryExpr):
     def __str__(self): return f"{self.l} := {self.r}"
@@ -320,7 +422,7 @@ class Assign(BinaryExpr):
         r2 = self.r.typecheck(r1.s.compose(E))
         s = r2.s.compose(r1.s)
         s = s.compose(r1.t.unify(RefType(r2.t)))
-        return TypeResult.of(s, Type.UNIT)
+        return self.typed(s, Type.UNIT)
 
     def eval(self, s):
         ptr = self.l.eval(s)
@@ -339,28 +441,50 @@ class App(BinaryExpr):
         s = r2.s.compose(r1.s)
         s_unify = ArrowType(r2.t, alpha).unify(r1.t)
         s = s_unify.compose(s)
-        return TypeResult.of(s, s.apply(alpha))
+        return self.typed(s, s.apply(alpha))
 
     def eval(self, s):
-        from simpl_lib import fst, snd, hd, tl
         f = self.l.eval(s)
         v = self.r.eval(s)
+        if type(f) is FunValue:
+            return f.e.eval(State.of(Env(f.E, f.x, v), s.M, s.p))
+        return apply(f, v, s)
+
+    def eval_int(self, s):
+        f = self.l.eval(s)
+        v = self.r.eval(s)
+        if type(f) is FunValue:
+            return f.e.eval_int(State.of(Env(f.E, f.x, v), s.M, s.p))
+        return apply(f, v, s).n
+
+    def eval_bool(self, s):
+        f = self.l.eval(s)
+        v = self.r.eval(s)
+        if type(f) is FunValue:
+            return f.e.eval_bool(State.of(Env(f.E, f.x, v), s.M, s.p))
+        return apply(f, v, s).b
 
-        if isinstance(f, fst):
-            return v.v1
-        if isinstance(f, snd):
-            return v.v2
-        if isinstance(f, hd):
-            if isinstance(v, NilValue):
-                raise RuntimeError("hd of nil")
-            return v.v1
-        if isinstance(f, tl):
-            if isinstance(v, NilValue):
-                raise RuntimeError("tl of nil")
-            return v.v2
 
-        new_env = Env(f.E, f.x, v)
-        return f.e.eval(State.of(new_env, s.M, s.p))
+def apply(f, v, s):
+    from simpl_lib import fst, snd, hd, tl, Native
+
+    if isinstance(f, Native):
+        return f.call(v, s)
+    if isinstance(f, fst):
+        return v.v1
+    if isinstance(f, snd):
+        return v.v2
+    if isinstance(f, hd):
+        if isinstance(v, NilValue):
+            raise RuntimeError("hd of nil")
+        return v.v1
+    if isinstance(f, tl):
+        if isinstance(v, NilValue):
+            raise RuntimeError("tl of nil")
+        return v.v2
+
+    new_env = Env(f.E, f.x, v)
+    return f.e.eval(State.of(new_env, s.M, s.p))
 
 
 @dataclass
@@ -374,10 +498,13 @@ class Neg(UnaryExpr):
     def typecheck(self, E):
         r = self.e.typecheck(E)
         s = r.t.unify(Type.INT)
-        return TypeResult.of(s.compose(r.s), Type.INT)
+        return self.typed(s.compose(r.s), Type.INT)
 
     def eval(self, s):
-        return IntValue(-self.e.eval(s).n)
+        return IntValue(-self.e.eval_int(s))
+
+    def eval_int(self, s):
+        return -self.e.eval_int(s)
 
 
 class Not(UnaryExpr):
@@ -386,10 +513,13 @@ class Not(UnaryExpr):
     def typecheck(self, E):
         r = self.e.typecheck(E)
         s = r.t.unify(Type.BOOL)
-        return TypeResult.of(s.compose(r.s), Type.BOOL)
+        return self.typed(s.compose(r.s), Type.BOOL)
 
     def eval(self, s):
-        return BoolValue(not self.e.eval(s).b)
+        return BoolValue(not self.e.eval_bool(s))
+
+    def eval_bool(self, s):
+        return not self.e.eval_bool(s)
 
 
 class Ref(UnaryExpr):
@@ -397,7 +527,7 @@ class Ref(UnaryExpr):
 
     def typecheck(self, E):
         r = self.e.typecheck(E)
-        return TypeResult.of(r.s, RefType(r.t))
+        return self.typed(r.s, RefType(r.t))
 
     def eval(self, s):
         ptr = s.p.get()
@@ -414,7 +544,7 @@ class Deref(UnaryExpr):
         r = self.e.typecheck(E)
         alpha = TypeVar(True)
         s = r.t.unify(RefType(alpha))
-        return TypeResult.of(s.compose(r.s), s.apply(alpha))
+        return self.typed(s.compose(r.s), s.apply(alpha))
 
     def eval(self, s):
         ptr = self.e.eval(s)
@@ -426,8 +556,13 @@ class Deref(UnaryExpr):
 
 class Group(UnaryExpr):
     def __str__(self): return str(self.e)
-    def typecheck(self, E): return self.e.typecheck(E)
+    def typecheck(self, E):
+        r = self.e.typecheck(E)
+        return self.typed(r.s, r.t)
+
     def eval(self, s): return self.e.eval(s)
+    def eval_int(self, s): return self.e.eval_int(s)
+    def eval_bool(self, s): return self.e.eval_bool(s)
 
 
 @dataclass
@@ -445,14 +580,26 @@ class Cond(Expr):
         r3 = self.e3.typecheck(r2.s.compose(env2))
         s2 = r2.t.unify(r2.s.apply(r3.t))
         all_s = s2.compose(r3.s).compose(r2.s).compose(s1).compose(r1.s)
-        return TypeResult.of(all_s, all_s.apply(r2.t))
+        return self.typed(all_s, all_s.apply(r2.t))
 
     def eval(self, s):
-        if self.e1.eval(s).b:
+        if self.e1.eval_bool(s):
             return self.e2.eval(s)
         else:
             return self.e3.eval(s)
 
+    def eval_int(self, s):
+        if self.e1.eval_bool(s):
+            return self.e2.eval_int(s)
+        else:
+            return self.e3.eval_int(s)
+
+    def eval_bool(self, s):
+        if self.e1.eval_bool(s):
+            return self.e2.eval_bool(s)
+        else:
+            return self.e3.eval_bool(s)
+
 
 @dataclass
 class Loop(Expr):
@@ -464,10 +611,10 @@ class Loop(Expr):
         r1 = self.e1.typecheck(E)
         s1 = r1.t.unify(Type.BOOL)
         r2 = self.e2.typecheck(s1.compose(r1.s).compose(E))
-        return TypeResult.of(r2.s.compose(r1.s), Type.UNIT)
+        return self.typed(r2.s.compose(r1.s), Type.UNIT)
 
     def eval(self, s):
-        while self.e1.eval(s).b:
+        while self.e1.eval_bool(s):
             self.e2.eval(s)
         return Value.UNIT
 
@@ -483,12 +630,20 @@ class Let(Expr):
         r1 = self.e1.typecheck(E)
         new_env = ExtendedTypeEnv(E, self.x, r1.t)
         r2 = self.e2.typecheck(new_env)
-        return TypeResult.of(r2.s.compose(r1.s), r2.s.apply(r2.t))
+        return self.typed(r2.s.compose(r1.s), r2.s.apply(r2.t))
 
     def eval(self, s):
         v1 = self.e1.eval(s)
         return self.e2.eval(State.of(Env(s.E, self.x, v1), s.M, s.p))
 
+    def eval_int(self, s):
+        v1 = self.e1.eval(s)
+        return self.e2.eval_int(State.of(Env(s.E, self.x, v1), s.M, s.p))
+
+    def eval_bool(self, s):
+        v1 = self.e1.eval(s)
+        return self.e2.eval_bool(State.of(Env(s.E, self.x, v1), s.M, s.p))
+
 
 @dataclass
 class Fn(Expr):
@@ -500,7 +655,7 @@ class Fn(Expr):
         t = TypeVar(True)
         new_env = ExtendedTypeEnv(E, self.x, t)
         r = self.e.typecheck(new_env)
-        return TypeResult.of(r.s, ArrowType(r.s.apply(t), r.t))
+        return self.typed(r.s, ArrowType(r.s.apply(t), r.t))
 
     def eval(self, s):
         return FunValue(s.E, self.x, self.e)
@@ -517,8 +672,26 @@ class Rec(Expr):
         new_env = ExtendedTypeEnv(E, self.x, alpha)
         r = self.e.typecheck(new_env)
         s = r.s.compose(r.t.unify(r.s.apply(alpha)))
-        return TypeResult.of(s, s.apply(r.t))
+        return self.typed(s, s.apply(r.t))
 
     def eval(self, s):
         rv = RecValue(s.E, self.x, self.e)
         return self.e.eval(State.of(Env(s.E, self.x, rv), s.M, s.p))
+
+
+@dataclass
+class Import(Expr):
+    x: str
+    e: Expr
+    def __str__(self): return f"(import {self.x} in {self.e})"
+
+    def module(self):
+        return self.linked
+
+    def typecheck(self, E):
+        r = self.e.typecheck(ExtendedTypeEnv(E, self.x, self.module().scheme))
+        return self.typed(r.s, r.t)
+
+    def eval(self, s):
+        v = self.module().eval(s)
+        return self.e.eval(State.of(Env(s.E, self.x, v), s.M, s.p))
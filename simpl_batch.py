@@ -0,0 +1,246 @@
+import sys
+from simpl_parser import Lexer, Parser
+from simpl_interpreter import InitialState, Mem, Int, RuntimeError
+from simpl_typing import TypeError
+from simpl_ast import *
+from simpl_lib import initial_runtime_env, initial_type_env, fst, snd, succ, pred, iszero
+from simpl_specialize import specialize
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+EXACT = 2 ** 53
+WIDE = 2.0 ** 62
+
+
+class Unsupported(Exception):
+    pass
+
+
+def _shape(t):
+    if isinstance(t, IntType):
+        return 1
+    if isinstance(t, PairType):
+        return (_shape(t.t1), _shape(t.t2))
+    raise TypeError("batch")
+
+
+def _width(shape):
+    return 1 if shape == 1 else _width(shape[0]) + _width(shape[1])
+
+
+def _columns(shape, cols):
+    if shape == 1:
+        return cols.pop(0)
+    return (_columns(shape[0], cols), _columns(shape[1], cols))
+
+
+def _value(shape, row):
+    if shape == 1:
+        return IntValue(int(row.pop(0)))
+    return PairValue(_value(shape[0], row), _value(shape[1], row))
+
+
+class Batch:
+    def __init__(self, content):
+        program = Parser(Lexer(content)).parse()
+        r = program.typecheck(initial_type_env())
+        t = r.s.apply(r.t)
+        if not isinstance(t, ArrowType) or not isinstance(t.t2, (IntType, BoolType)):
+            raise TypeError("batch")
+        self.shape = _shape(t.t1)
+        self.boolean = isinstance(t.t2, BoolType)
+        self.program = specialize(program, r.s)
+        self.f = self.program.eval(self.state())
+        if type(self.f) is not FunValue:
+            raise TypeError("batch")
+
+    @staticmethod
+    def state():
+        return InitialState.of(initial_runtime_env(), Mem(), Int(0))
+
+    def scalar(self, row):
+        s = self.state()
+        try:
+            v = apply(self.program.eval(s), _value(self.shape, list(row)), s)
+        except RuntimeError:
+            return None
+        return v.b if self.boolean else v.n
+
+    def run(self, xs):
+        if np is None:
+            values = [self.scalar(row if self.shape != 1 else [row]) for row in xs]
+            self.vectorized = 0
+            return values, [v is None for v in values]
+        xs = np.asarray(xs, dtype=np.int64)
+        n = len(xs)
+        cols = [xs] if self.shape == 1 else [xs[:, i] for i in range(_width(self.shape))]
+        lanes = Lanes(n)
+        with np.errstate(all="ignore"):
+            out = lanes.vec(self.f.e, {self.f.x: _columns(self.shape, cols)},
+                            np.ones(n, dtype=bool), self.f.E)
+        values = np.array(np.broadcast_to(out, n), dtype=bool if self.boolean else np.int64)
+        errors = lanes.error & ~lanes.fallback
+        fallback = np.flatnonzero(lanes.fallback)
+        if len(fallback):
+            rows = xs[fallback] if self.shape != 1 else xs[fallback].reshape(-1, 1)
+            results = [self.scalar(row.tolist()) for row in rows]
+            if not self.boolean and any(r is not None and not -2 ** 63 <= r < 2 ** 63
+                                        for r in results):
+                values = values.astype(object)
+            for i, r in zip(fallback, results):
+                if r is None:
+                    errors[i] = True
+                else:
+                    values[i] = r
+        self.vectorized = n - len(fallback)
+        return values, errors
+
+
+class Lanes:
+    def __init__(self, n):
+        self.error = np.zeros(n, dtype=bool)
+        self.fallback = np.zeros(n, dtype=bool)
+
+    def fail(self, mask, active):
+        self.error |= active & mask
+
+    def defer(self, mask, active):
+        self.fallback |= active & mask
+
+    def vec(self, e, env, active, E):
+        active = active & ~(self.error | self.fallback)
+        if not active.any():
+            return np.int64(0)
+        try:
+            return self.node(e, env, active, E)
+        except (Unsupported, OverflowError):
+            self.defer(True, active)
+            return np.int64(0)
+
+    def node(self, e, env, active, E):
+        if isinstance(e, IntegerLiteral):
+            return np.int64(e.n)
+        if isinstance(e, BooleanLiteral):
+            return np.bool_(e.b)
+        if isinstance(e, Name):
+            if e.x in env:
+                return env[e.x]
+            return self.constant(E.get(e.x))
+        if isinstance(e, Group):
+            return self.vec(e.e, env, active, E)
+        if isinstance(e, Let):
+            v = self.vec(e.e1, env, active, E)
+            return self.vec(e.e2, {**env, e.x: v}, active, E)
+        if isinstance(e, Cond):
+            c = self.vec(e.e1, env, active, E)
+            if isinstance(c, tuple):
+                raise Unsupported(e)
+            c = np.asarray(c, dtype=bool)
+            a = self.vec(e.e2, env, active & c, E)
+            b = self.vec(e.e3, env, active & ~c, E)
+            return self.where(c, a, b)
+        if isinstance(e, Pair):
+            return (self.vec(e.l, env, active, E), self.vec(e.r, env, active, E))
+        if isinstance(e, App):
+            return self.app(e, env, active, E)
+        if isinstance(e, (Div, Mod)):
+            b = self.vec(e.r, env, active, E)
+            self.fail(b == 0, active)
+            a = self.vec(e.l, env, active & (b != 0), E)
+            self.defer((np.abs(a) >= EXACT) | (np.abs(b) >= EXACT), active)
+            b = np.where(b == 0, 1, b)
+            if isinstance(e, Mod):
+                return np.remainder(a, b)
+            return np.trunc(np.true_divide(a, b)).astype(np.int64)
+        if isinstance(e, (AndAlso, OrElse)):
+            a = np.asarray(self.vec(e.l, env, active, E), dtype=bool)
+            short = a if isinstance(e, OrElse) else ~a
+            b = self.vec(e.r, env, active & ~short, E)
+            return np.where(short, a, b)
+        if isinstance(e, BinaryExpr) and not isinstance(e, (Cons, Seq, Assign)):
+            a = self.vec(e.l, env, active, E)
+            b = self.vec(e.r, env, active, E)
+            if isinstance(a, tuple) or isinstance(b, tuple):
+                raise Unsupported(e)
+            return self.binary(type(e), a, b, active)
+        if isinstance(e, Neg):
+            a = self.vec(e.e, env, active, E)
+            self.defer(a == -2 ** 63, active)
+            return -a
+        if isinstance(e, Not):
+            return ~np.asarray(self.vec(e.e, env, active, E), dtype=bool)
+        raise Unsupported(e)
+
+    def binary(self, op, a, b, active):
+        if issubclass(op, Add):
+            r = a + b
+            self.defer(((a ^ r) & (b ^ r)) < 0, active)
+            return r
+        if issubclass(op, Sub):
+            r = a - b
+            self.defer(((a ^ b) & (a ^ r)) < 0, active)
+            return r
+        if issubclass(op, Mul):
+            self.defer(np.abs(np.multiply(a, b, dtype=np.float64)) >= WIDE, active)
+            return a * b
+        if issubclass(op, Eq):
+            return a == b
+        if issubclass(op, Neq):
+            return a != b
+        if issubclass(op, Less):
+            return a < b
+        if issubclass(op, LessEq):
+            return a <= b
+        if issubclass(op, Greater):
+            return a > b
+        if issubclass(op, GreaterEq):
+            return a >= b
+        raise Unsupported(op)
+
+    def app(self, e, env, active, E):
+        f = e.l
+        while isinstance(f, Group):
+            f = f.e
+        if not isinstance(f, Name) or f.x in env:
+            raise Unsupported(e)
+        f = E.get(f.x)
+        v = self.vec(e.r, env, active, E)
+        if isinstance(f, (fst, snd)) and isinstance(v, tuple):
+            return v[0] if isinstance(f, fst) else v[1]
+        if isinstance(f, (succ, pred)):
+            return self.binary(Add if isinstance(f, succ) else Sub, v, np.int64(1), active)
+        if isinstance(f, iszero):
+            return v == 0
+        raise Unsupported(e)
+
+    def constant(self, v):
+        if isinstance(v, IntValue):
+            return np.int64(v.n)
+        if isinstance(v, BoolValue):
+            return np.bool_(v.b)
+        if isinstance(v, PairValue):
+            return (self.constant(v.v1), self.constant(v.v2))
+        raise Unsupported(v)
+
+    def where(self, c, a, b):
+        if isinstance(a, tuple) or isinstance(b, tuple):
+            if not (isinstance(a, tuple) and isinstance(b, tuple)):
+                raise Unsupported(c)
+            return (self.where(c, a[0], b[0]), self.where(c, a[1], b[1]))
+        return np.where(c, a, b)
+
+
+def batch(content, xs):
+    return Batch(content).run(xs)
+
+
+if __name__ == "__main__":
+    with open(sys.argv[1]) as f:
+        b = Batch(f.read())
+    rows = [[int(w) for w in line.split()] for line in sys.stdin if line.strip()]
+    values, errors = b.run([r[0] for r in rows] if b.shape == 1 else rows)
+    for v, err in zip(values, errors):
+        print("runtime error" if err else str(v).lower())
@@ -0,0 +1,809 @@
+import os
+import sys
+import time
+from simpl_parser import Lexer, Parser
+from simpl_interpreter import InitialState, Mem, Int
+from simpl_lib import initial_runtime_env, initial_type_env
+sys.setrecursionlimit(10000)
+
+FIB = """
+let plus = rec p =>
+      fn x => fn y => if iszero x then y else p (pred x) (succ y)
+in
+  let fibonacci = rec f =>
+        fn n => if iszero n then 0
+                else if iszero (pred n) then 1
+                else plus (f (pred n)) (f (pred (pred n)))
+  in
+    fibonacci %d
+  end
+end
+"""
+
+
+def load(content):
+    program = Parser(Lexer(content)).parse()
+    program.typecheck(initial_type_env())
+    return program
+
+
+def initial_state():
+    return InitialState.of(initial_runtime_env(), Mem(), Int(0))
+
+
+def timeit(f, repeat=3):
+    best = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        r = f()
+        t = time.perf_counter() - t0
+        best = t if best is None else min(best, t)
+    return best, r
+
+
+def calls(f):
+    import cProfile
+    import pstats
+    prof = cProfile.Profile()
+    prof.runcall(f)
+    return pstats.Stats(prof).total_calls
+
+
+def bench_parallel(n=18):
+    from simpl_parallel import evaluate
+    program = load(FIB % n)
+    base, v = timeit(lambda: program.eval(initial_state()))
+    print(f"fibonacci {n} = {v}")
+    print(f"sequential   {base:8.3f}s")
+    cores = os.cpu_count()
+    jobs = sorted({1, 2, 4, cores, 2 * cores})
+    for j in jobs:
+        t, _ = timeit(lambda: evaluate(program, initial_state(), j))
+        print(f"-j {j:<3} {t:11.3f}s  speedup {base / t:5.2f}x  ({cores} cores)")
+
+
+def bench_server(requests=500, concurrency=8):
+    import asyncio
+    import subprocess
+    import tempfile
+    from simpl_server import loadtest
+    path = "doc/examples/gcd2.spl"
+    with open(path) as f:
+        content = f.read()
+
+    t0 = time.perf_counter()
+    runs = 20
+    for _ in range(runs):
+        subprocess.run([sys.executable, "simpl.py", path], capture_output=True)
+    per_run = (time.perf_counter() - t0) / runs
+    print(f"process per program   {per_run * 1000:8.1f} ms/request  {1 / per_run:8.1f} req/s")
+
+    address = os.path.join(tempfile.mkdtemp(), "simpl.sock")
+    server = subprocess.Popen([sys.executable, "simpl_server.py", "serve", "--address", address])
+    try:
+        while not os.path.exists(address):
+            time.sleep(0.05)
+        stats = asyncio.run(loadtest(address, content, requests, concurrency))
+    finally:
+        server.terminate()
+        server.wait()
+    print(f"server  p50 {stats['p50_ms']:.2f} ms  p99 {stats['p99_ms']:.2f} ms  "
+          f"{stats['throughput']:8.1f} req/s  errors {stats['errors']}")
+
+
+IMPORT_BUDGET_MS = 35.0
+STARTUP_BUDGET_MS = 45.0
+
+
+def bench_startup(runs=20):
+    import subprocess
+    imports = {}
+    for _ in range(5):
+        out = subprocess.run([sys.executable, "-X", "importtime", "-c", "import simpl"],
+                             capture_output=True, text=True).stderr
+        for line in out.splitlines()[1:]:
+            _, self_us, cumulative_us, name = [c.strip() for c in line.replace(":", "|", 1).split("|")]
+            imports[name] = min(int(cumulative_us), imports.get(name, sys.maxsize))
+    for name in sorted((n for n in imports if n.startswith("simpl")), key=imports.get):
+        print(f"import {name:20} {imports[name] / 1000:7.2f} ms")
+    import_ms = imports["simpl"] / 1000
+
+    def wall(argv):
+        times = []
+        for _ in range(runs):
+            t0 = time.perf_counter()
+            subprocess.run([sys.executable] + argv, capture_output=True)
+            times.append(time.perf_counter() - t0)
+        return min(times) * 1000
+
+    startup_ms = wall(["simpl.py", "doc/examples/plus.spl"]) - wall(["-c", "pass"])
+    for what, ms, budget in [("import simpl", import_ms, IMPORT_BUDGET_MS),
+                             ("run plus.spl over bare python", startup_ms, STARTUP_BUDGET_MS)]:
+        verdict = "ok" if ms <= budget else "OVER BUDGET"
+        print(f"{what:32} {ms:7.2f} ms  (budget {budget:.0f} ms) {verdict}")
+
+
+INT_PROGRAMS = {
+    "gcd1.spl": open("doc/examples/gcd1.spl").read().replace("34986 3087", "832040 514229"),
+    "factorial.spl": open("doc/examples/factorial.spl").read().replace("fact 4", "fact 200"),
+    "sum.spl": open("doc/examples/sum.spl").read().replace(
+        "1::2::3::nil", "::".join(str(i) for i in range(300)) + "::nil"),
+}
+
+
+def bench_specialize(repeat=200):
+    from simpl_specialize import specialize
+    for name, content in INT_PROGRAMS.items():
+        generic = load(content)
+        typed = Parser(Lexer(content)).parse()
+        typed = specialize(typed, typed.typecheck(initial_type_env()).s)
+        t1, v1 = timeit(lambda: [generic.eval(initial_state()) for _ in range(repeat)][-1], 7)
+        t2, v2 = timeit(lambda: [typed.eval(initial_state()) for _ in range(repeat)][-1], 7)
+        assert str(v1) == str(v2)
+        c1 = calls(lambda: generic.eval(initial_state()))
+        c2 = calls(lambda: typed.eval(initial_state()))
+        print(f"{name:14} generic {t1 * 1000 / repeat:7.3f} ms {c1:7} calls  "
+              f"specialized {t2 * 1000 / repeat:7.3f} ms {c2:7} calls  {t1 / t2:5.2f}x")
+
+
+def balanced(n):
+    if n == 1:
+        return "1"
+    return f"({balanced(n // 2)} + {balanced(n - n // 2)})"
+
+
+def bench_flat(leaves=1 << 16):
+    import tracemalloc
+    from simpl_flat import FlatAst
+    content = balanced(leaves)
+
+    tracemalloc.start()
+    tokens = Lexer(content)
+    base = tracemalloc.get_traced_memory()[0]
+    tree = Parser(tokens).parse()
+    tree_bytes = tracemalloc.get_traced_memory()[0] - base
+    tokens.idx = 0
+    base = tracemalloc.get_traced_memory()[0]
+    flat = FlatAst()
+    root = Parser(tokens, flat).parse()
+    flat_bytes = tracemalloc.get_traced_memory()[0] - base
+    tracemalloc.stop()
+    n = len(flat)
+    print(f"{n} nodes  tree {tree_bytes / n:6.1f} B/node  flat {flat_bytes / n:6.1f} B/node")
+
+    def tree_count():
+        k, stack = 0, [tree]
+        while stack:
+            k += 1
+            stack.extend(stack.pop().children())
+        return k
+
+    t1, _ = timeit(tree_count)
+    t2, _ = timeit(lambda: sum(1 for op in flat.op))
+    print(f"full traversal  tree {t1 * 1000:8.1f} ms  flat {t2 * 1000:8.1f} ms")
+
+    def run():
+        program = Parser(Lexer(content)).parse()
+        program.typecheck(initial_type_env())
+        return program.eval(initial_state())
+
+    def run_flat():
+        ast = FlatAst()
+        root = Parser(Lexer(content), ast).parse()
+        ast.typecheck(initial_type_env(), root)
+        return ast.eval(initial_state(), root)
+
+    t1, v1 = timeit(run, 1)
+    t2, v2 = timeit(run_flat, 1)
+    assert str(v1) == str(v2) == str(leaves)
+    print(f"parse-to-eval   tree {t1:8.2f} s   flat {t2:8.2f} s")
+
+
+COUNT_LOOP = """
+let i = ref 0 in
+  let s = ref 0 in
+    (while !i < %d do (if !i %% 3 = 0 then s := !s + !i else s := !s - 1); i := !i + 1);
+    !s
+  end
+end
+"""
+
+
+def bench_jit(n=100000):
+    import simpl_jit
+    for name, content in [("count loop", COUNT_LOOP % n),
+                          ("gcd2.spl", open("doc/examples/gcd2.spl").read())]:
+        generic = load(content)
+        events = []
+        tiered = simpl_jit.tier(generic, events)
+        reps = 1 if name == "count loop" else 200
+        t1, v1 = timeit(lambda: [generic.eval(initial_state()) for _ in range(reps)][-1])
+        t2, v2 = timeit(lambda: [tiered.eval(initial_state()) for _ in range(reps)][-1])
+        assert str(v1) == str(v2)
+        print(f"{name:12} generic {t1 * 1000:8.1f} ms  tiered {t2 * 1000:8.1f} ms  {t1 / t2:6.1f}x")
+        simpl_jit.report(events, sys.stdout)
+
+
+def bench_parse(leaves=1 << 15):
+    import tracemalloc
+    content = balanced(leaves)
+    t1, lexer = timeit(lambda: Lexer(content))
+    t2, _ = timeit(lambda: Parser(Lexer(content)).parse())
+    tracemalloc.start()
+    lexer = Lexer(content)
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    n = len(lexer)
+    print(f"{n} tokens  lex {t1 * 1000:7.1f} ms  lex+parse {t2 * 1000:7.1f} ms  "
+          f"{size / n:5.1f} B/token")
+
+
+def bench_checkpoint(n=15, intervals=(1000, 10000, 100000)):
+    import tempfile
+    from simpl_machine import Machine
+    program = load(FIB % n)
+    t0, v = timeit(lambda: program.eval(initial_state()), 1)
+    t1, m = timeit(lambda: _run(Machine(program, initial_state())))
+    assert str(m.v) == str(v)
+    print(f"fibonacci {n} = {v}  {m.steps} steps")
+    print(f"recursive eval {t0 * 1000:8.1f} ms")
+    print(f"machine        {t1 * 1000:8.1f} ms")
+    with tempfile.TemporaryDirectory() as d:
+        path = os.path.join(d, "fib.ck")
+        for k in intervals:
+            t, _ = timeit(lambda: Machine(program, initial_state()).run(path, k))
+            print(f"every {k:6} steps {t * 1000:8.1f} ms  overhead {(t / t1 - 1) * 100:5.1f}%")
+        m = Machine.load(path)
+        save, _ = timeit(lambda: m.save(path), 20)
+        load_, _ = timeit(lambda: Machine.load(path), 20)
+        print(f"snapshot {os.path.getsize(path)} bytes  save {save * 1000:6.2f} ms  "
+              f"resume {load_ * 1000:6.2f} ms")
+
+
+def _run(m):
+    m.run()
+    return m
+
+
+LIST_PROGRAMS = {
+    "length": ("rec len => fn l => if l = nil then 0 else 1 + len (tl l)", "length l"),
+    "append": ("rec app => fn a => fn b => if a = nil then b else hd a :: app (tl a) b",
+               "append l l"),
+    "map": ("rec m => fn f => fn l => if l = nil then nil else f (hd l) :: m f (tl l)",
+            "map (fn x => x + 1) l"),
+    "foldl": ("rec fo => fn f => fn z => fn l => if l = nil then z else fo f (f z (hd l)) (tl l)",
+              "foldl (fn a => fn x => a + x) 0 l"),
+    "rev": ("(rec r => fn a => fn l => if l = nil then a else r (hd l :: a) (tl l)) nil",
+            "rev l"),
+    "nth": ("rec nt => fn l => fn n => if n = 0 then hd l else nt (tl l) (n - 1)",
+            "nth l (n - 1)"),
+}
+
+
+def bench_lists(n=300, repeat=20):
+    init = "let n = %d in let l = (rec r => fn i => if i = 0 then nil else i :: r (i - 1)) n in " % n
+    base = load(init + "l end end")
+    t0, _ = timeit(lambda: [base.eval(initial_state()) for _ in range(repeat)])
+    for name, (definition, body) in LIST_PROGRAMS.items():
+        interpreted = load(f"{init}let {name} = {definition} in {body} end end end")
+        native = load(f"{init}{body} end end")
+        t1, v1 = timeit(lambda: [interpreted.eval(initial_state()) for _ in range(repeat)][-1])
+        t2, v2 = timeit(lambda: [native.eval(initial_state()) for _ in range(repeat)][-1])
+        assert str(v1) == str(v2)
+        t1, t2 = (t1 - t0) / repeat, (t2 - t0) / repeat
+        print(f"{name:7} interpreted {t1 * 1000:7.2f} ms  native {t2 * 1000:7.2f} ms  "
+              f"{t1 / t2:6.1f}x")
+
+
+HELPERS = {
+    "arith": "(fn x => fn y => let d = x - y in if d < 0 then ~d else d end) 7",
+    "lets": "(fn n => let a = n + 1 in let b = a * a in let c = b - a in let d = c * 2 in "
+            "if d < 0 then ~d else d end end end end)",
+    "builder": "(fn n => let build = rec b => fn i => if i = 0 then nil else (i * i) :: b (i - 1) "
+               "in foldl (fn a => fn x => a + x) 0 (map (fn x => x - 1) (build n)) end)",
+}
+
+
+def duplicated(helper, k):
+    terms = [f"({helper} {i})" for i in range(k)]
+    while len(terms) > 1:
+        terms = [f"({a} + {b})" for a, b in zip(terms[::2], terms[1::2])] + terms[len(terms) & ~1:]
+    return terms[0]
+
+
+def bench_memo(sizes=(16, 256, 1024)):
+    import simpl_memo
+    for name, helper in HELPERS.items():
+        for k in sizes:
+            program = Parser(Lexer(duplicated(helper, k))).parse()
+            t1, _ = timeit(lambda: program.typecheck(initial_type_env()))
+
+            table = simpl_memo.MemoTable()
+
+            def memoized():
+                table.principal.clear()
+                sites = simpl_memo.memoize(program, table)
+                r = program.typecheck(initial_type_env())
+                simpl_memo.strip(sites)
+                return r
+
+            t2, _ = timeit(memoized)
+            print(f"{name:8} {k:5} copies  plain {t1 * 1000:8.1f} ms  memo {t2 * 1000:7.1f} ms  "
+                  f"{t1 / t2:6.1f}x")
+
+
+BATCH_PROGRAMS = {
+    "poly": "fn x => x * x + 3 * x - 7",
+    "collatz": "fn x => if x % 2 = 0 then x / 2 else 3 * x + 1",
+    "piecewise": "fn x => let y = x - 50 in if y < 0 then ~y else if y < 25 then y * y else 625 end",
+    "pairs": "fn p => let a = fst p in let b = snd p in if a > b then a - b else b - a end end",
+    "fib": "fn x => if x < 0 then 0 else "
+           "(rec f => fn n => if n < 2 then n else f (n - 1) + f (n - 2)) (x % 8)",
+}
+
+
+def bench_batch(n=100000):
+    import simpl_batch
+    if simpl_batch.np is None:
+        print("numpy not installed; batch mode runs the scalar loop")
+        return
+    np = simpl_batch.np
+    xs = np.arange(-n // 2, n - n // 2, dtype=np.int64)
+    for name, content in BATCH_PROGRAMS.items():
+        b = simpl_batch.Batch(content)
+        inputs = np.stack([xs, xs[::-1]], axis=1) if b.shape != 1 else xs
+        sample = inputs[:: max(1, n // 2000)]
+        t1, _ = timeit(lambda: [b.scalar(row.tolist() if b.shape != 1 else [int(row)])
+                                for row in sample], 1)
+        t2, (values, errors) = timeit(lambda: b.run(inputs))
+        lanes = len(sample) / t1, n / t2
+        print(f"{name:10} scalar {lanes[0]:12,.0f}/s  batch {lanes[1]:12,.0f}/s  "
+              f"{lanes[1] / lanes[0]:7.1f}x  vectorized {b.vectorized / n:6.1%}")
+
+
+def bench_modules(n=40):
+    import tempfile
+    import simpl_module
+
+    def write(d, i, body):
+        with open(os.path.join(d, f"m{i}.spl"), "w") as f:
+            f.write(body)
+
+    def build(d):
+        loader = simpl_module.Loader()
+        t0 = time.perf_counter()
+        m = loader.load(os.path.join(d, f"m{n - 1}.spl"))
+        t1 = time.perf_counter() - t0
+        v = simpl.interpret(f"import m{n - 1} in m{n - 1} 3 end", base=d)[0]
+        return t1, len(loader.built), len(loader.reused), v
+
+    import simpl
+    with tempfile.TemporaryDirectory() as d:
+        write(d, 0, "fn n => n * n + 1")
+        for i in range(1, n):
+            write(d, i, f"import m{i - 1} in fn n => let build = rec b => fn k => "
+                        f"if k = 0 then nil else (m{i - 1} k) :: b (k - 1) in "
+                        f"foldl (fn a => fn x => a + x) {i} (build n) end end")
+        steps = [("cold", None), ("no change", None),
+                 ("edit body of m0", "fn n => n * n + 2"),
+                 ("edit type of m0", "fn n => n"),
+                 ("revert m0", "fn n => n * n + 1")]
+        for name, leaf in steps:
+            if leaf is not None:
+                write(d, 0, leaf)
+            t, built, reused, v = build(d)
+            print(f"{name:16} {t * 1000:8.1f} ms  built {built:3}  reused {reused:3}  -> {v}")
+
+
+REF_PROGRAMS = {
+    "gcd2.spl": open("doc/examples/gcd2.spl").read(),
+    "gcd2 fib": open("doc/examples/gcd2.spl").read().replace("34986 3087", "832040 514229"),
+    "counter": "let s = ref 0 in let i = ref 0 in "
+               "(while !i < 2000 do (s := !s + !i * !i; i := !i + 1)); !s end end",
+}
+
+
+def bench_escape(repeat=50):
+    from simpl_specialize import specialize
+    from simpl_escape import scalarize
+    for name, content in REF_PROGRAMS.items():
+        program = Parser(Lexer(content)).parse()
+        program = specialize(program, program.typecheck(initial_type_env()).s)
+        local = scalarize(program)
+        stores = []
+
+        def run(e):
+            s = initial_state()
+            v = e.eval(s)
+            stores.append(len(s.M.map))
+            return v
+
+        t1, v1 = timeit(lambda: [run(program) for _ in range(repeat)][-1], 5)
+        t2, v2 = timeit(lambda: [run(local) for _ in range(repeat)][-1], 5)
+        assert str(v1) == str(v2)
+        print(f"{name:10} store {t1 * 1000 / repeat:7.3f} ms {stores[0]:3} cells  "
+              f"local {t2 * 1000 / repeat:7.3f} ms {stores[-1]:3} cells  {t1 / t2:5.2f}x")
+
+
+LICM_PROGRAMS = {
+    "scaled": "let n = 37 in let m = 11 in let i = ref 0 in let s = ref 0 in "
+              "(while !i < {n} do (s := !s + (n * m + n / m - m % 3) * 2; i := !i + 1)); !s end end end end",
+    "bound": "let lo = ref 3 in let hi = ref 40 in let i = ref 0 in let s = ref 0 in "
+             "(while !i < {n} do (s := !s + (!hi - !lo) * (!hi + !lo); i := !i + 1)); !s end end end end",
+    "nested": "let k = 9 in let i = ref 0 in let s = ref 0 in (while !i < {n} do "
+              "(let j = ref 0 in (while !j < 10 do (s := !s + k * k + !i * 3; j := !j + 1)) end; "
+              "i := !i + 1)); !s end end end",
+}
+
+
+def bench_licm(n=2000):
+    import simpl_licm
+    from simpl_specialize import specialize
+    from simpl_escape import scalarize
+    for name, content in LICM_PROGRAMS.items():
+        content = content.replace("{n}", str(n))
+        base = Parser(Lexer(content)).parse()
+        base = scalarize(specialize(base, base.typecheck(initial_type_env()).s))
+        t1, v1 = timeit(lambda: base.eval(initial_state()))
+        events = []
+        program = Parser(Lexer(content)).parse()
+        program = simpl_licm.hoist(scalarize(specialize(program, program.typecheck(initial_type_env()).s)),
+                                   events)
+        t2, v2 = timeit(lambda: program.eval(initial_state()))
+        assert str(v1) == str(v2)
+        print(f"{name:8} {t1 * 1e6 / n:7.2f} us/iter  hoisted {t2 * 1e6 / n:7.2f} us/iter  "
+              f"{t1 / t2:5.2f}x  {len(events)} hoisted")
+        for _, _, e in events:
+            print(f"         {e}")
+
+
+def bench_transpile(repeat=20):
+    from simpl_transpile import transpile, load as load_native
+    for name, content in {**INT_PROGRAMS, **REF_PROGRAMS}.items():
+        program = load(content)
+        t0 = time.perf_counter()
+        main = load_native(transpile(content))
+        compile_ms = (time.perf_counter() - t0) * 1000
+        t1, v1 = timeit(lambda: [program.eval(initial_state()) for _ in range(repeat)][-1])
+        t2, v2 = timeit(lambda: [main() for _ in range(repeat)][-1])
+        assert str(v1) == v2
+        print(f"{name:14} eval {t1 * 1000 / repeat:8.3f} ms  transpiled {t2 * 1000 / repeat:8.3f} ms  "
+              f"{t1 / t2:6.1f}x  compile {compile_ms:6.2f} ms")
+
+
+def bench_vm(repeat=5):
+    from simpl_specialize import specialize
+    from simpl_vm import VM, compile_program
+    programs = {**INT_PROGRAMS, **REF_PROGRAMS,
+                "fibonacci": open("doc/examples/pcf.fibonacci.spl").read()}
+    for name, content in programs.items():
+        program = Parser(Lexer(content)).parse()
+        program = specialize(program, program.typecheck(initial_type_env()).s)
+        code = compile_program(program)
+        t1, v1 = timeit(lambda: program.eval(initial_state()), repeat)
+        vm = VM(initial_state())
+        t2, v2 = timeit(lambda: vm.execute(code), repeat)
+        steps = vm.steps // repeat
+        assert str(v1) == str(v2)
+        print(f"{name:14} eval {t1 * 1000:8.2f} ms  vm {t2 * 1000:8.2f} ms  {t1 / t2:5.2f}x  "
+              f"{steps:8} instructions  {steps / t2 / 1e6:5.2f} M/s")
+
+
+def bench_threads(copies=8, threads=(1, 2, 4, 8)):
+    from simpl_api import Interpreter
+    names = ["gcd1.spl", "gcd2.spl", "factorial.spl", "sum.spl", "pcf.factorial.spl",
+             "pcf.minus.spl", "pcf.sum.spl", "true.spl", "max.spl"]
+    contents = [open(f"doc/examples/{f}").read() for f in names] * copies
+    interp = Interpreter()
+    t0 = time.perf_counter()
+    expected = [interp.clone().interpret(c) for c in contents]
+    t1 = time.perf_counter() - t0
+    gil = getattr(sys, "_is_gil_enabled", lambda: True)()
+    print(f"{len(contents)} programs, GIL {'enabled' if gil else 'disabled'}")
+    print(f"sequential   {t1 * 1000:8.1f} ms  {len(contents) / t1:8.1f} programs/s")
+    for n in threads:
+        t0 = time.perf_counter()
+        results = interp.map(contents, n)
+        t2 = time.perf_counter() - t0
+        assert results == expected
+        print(f"{n:2} threads   {t2 * 1000:8.1f} ms  {len(contents) / t2:8.1f} programs/s  "
+              f"{t1 / t2:5.2f}x")
+
+
+def bench_typestats(k=64):
+    import simpl_typestats
+    program = Parser(Lexer(duplicated(HELPERS["builder"], k))).parse()
+    check = lambda: program.typecheck(initial_type_env())
+    t1, _ = timeit(check)
+    simpl_typestats.enable()
+    t2, _ = timeit(check)
+    simpl_typestats.disable()
+    t3, _ = timeit(check)
+    print(f"disabled {t1 * 1000:8.1f} ms  enabled {t2 * 1000:8.1f} ms  "
+          f"after disable {t3 * 1000:8.1f} ms  overhead {t2 / t1 - 1:+.0%}")
+    simpl_typestats.report()
+
+
+def bench_api(n=200):
+    from random import Random
+    from simpl_api import Interpreter
+    source = open("doc/examples/gcd1.spl").read()
+    rng = Random(0)
+    inputs = [(rng.randrange(1, 10 ** 6), rng.randrange(1, 10 ** 6)) for _ in range(n)]
+    interp = Interpreter()
+    t0 = time.perf_counter()
+    expected = [interp.interpret(source.replace("34986 3087", f"{a} {b}"))[0] for a, b in inputs]
+    t1 = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    gcd = interp.compile(source.replace("gcd 34986 3087", "gcd"))
+    compile_ms = (time.perf_counter() - t0) * 1000
+    t0 = time.perf_counter()
+    results = [str(gcd(a, b)) for a, b in inputs]
+    t2 = time.perf_counter() - t0
+    assert results == expected
+    print(f"{n} calls  interpret {t1 * 1e6 / n:8.1f} us/call  compiled {t2 * 1e6 / n:8.1f} us/call  "
+          f"{t1 / t2:5.1f}x  compile {compile_ms:6.2f} ms")
+
+
+def bench_profile(n=18, rates=(100, 1000)):
+    from simpl_profile import Profiler
+    program = load(FIB % n)
+    base, v = timeit(lambda: program.eval(initial_state()))
+    print(f"fibonacci {n} = {v}")
+    print(f"unprofiled   {base * 1000:8.1f} ms")
+    for rate in rates:
+        profilers = []
+
+        def run():
+            profilers.append(Profiler(1 / rate))
+            return profilers[-1].run(program, initial_state())
+        t, _ = timeit(run)
+        prof = profilers[-1]
+        samples = sum(prof.samples.values())
+        print(f"{rate:5} Hz     {t * 1000:8.1f} ms  {samples:6} samples  overhead {t / base - 1:+.1%}  "
+              f"in handler {prof.elapsed * 1000:6.1f} ms ({prof.elapsed / t:.1%})")
+
+
+RUNAWAY = """
+let l = ref nil in
+  while true do l := 1 :: !l
+end
+"""
+
+
+def bench_memory(n=15, budgets=(10 ** 5, 10 ** 6, 10 ** 7)):
+    import simpl_memory
+    from simpl_api import Interpreter
+    program = load(FIB % n)
+    t1, v = timeit(lambda: program.eval(initial_state()))
+    simpl_memory.enable()
+    t2, _ = timeit(lambda: program.eval(initial_state()))
+    stats = simpl_memory.stats
+    simpl_memory.disable()
+    print(f"fibonacci {n} = {v}  accounting off {t1 * 1000:7.1f} ms  on {t2 * 1000:7.1f} ms  "
+          f"overhead {t2 / t1 - 1:+.0%}  peak {stats.peak} B")
+    for budget in budgets:
+        t0 = time.perf_counter()
+        value, error = Interpreter(memory_limit=budget).interpret(RUNAWAY)
+        t = time.perf_counter() - t0
+        print(f"runaway cons  budget {budget:9} B  {error}  after {t * 1000:7.1f} ms")
+
+
+def bench_telemetry(copies=20):
+    import json
+    import tempfile
+    from simpl_api import Interpreter
+    from simpl_telemetry import Telemetry
+    names = ["gcd1.spl", "gcd2.spl", "factorial.spl", "sum.spl", "pcf.factorial.spl", "max.spl"]
+    contents = [open(f"doc/examples/{f}").read() for f in names] * copies
+    with tempfile.TemporaryDirectory() as d:
+        path = os.path.join(d, "runs.jsonl")
+        plain = Interpreter()
+        traced = Interpreter(telemetry=Telemetry(path))
+        t1, _ = timeit(lambda: [plain.interpret(c) for c in contents])
+        t2, _ = timeit(lambda: [traced.interpret(c) for c in contents])
+        records = [json.loads(line) for line in open(path)]
+    print(f"{len(contents)} runs  plain {t1 * 1e6 / len(contents):8.1f} us/run  "
+          f"telemetry {t2 * 1e6 / len(contents):8.1f} us/run  overhead {t2 / t1 - 1:+.1%}")
+    for phase in ("lex", "parse", "typecheck", "optimize", "eval"):
+        ms = sorted(r[f"{phase}_ms"] for r in records)
+        print(f"  {phase:10} p50 {ms[len(ms) // 2]:8.3f} ms  p99 {ms[len(ms) * 99 // 100]:8.3f} ms")
+
+
+FUSE_PROGRAMS = {
+    "fibonacci": FIB % 15,
+    **REF_PROGRAMS,
+    "countdown": "let n = ref 3000 in let s = ref 0 in "
+                 "(while !n <> 0 do (s := !s + !n; n := !n - 1)); !s end end",
+}
+
+
+def bench_fuse():
+    from simpl_specialize import specialize
+    from simpl_escape import scalarize
+    from simpl_licm import hoist
+    from simpl_fuse import fuse
+    from simpl_telemetry import counting
+    for name, content in FUSE_PROGRAMS.items():
+        program = Parser(Lexer(content)).parse()
+        program = hoist(scalarize(specialize(program, program.typecheck(initial_type_env()).s)))
+        fused = fuse(program)
+        with counting() as c1:
+            program.eval(initial_state())
+        with counting() as c2:
+            fused.eval(initial_state())
+        t1, v1 = timeit(lambda: program.eval(initial_state()))
+        t2, v2 = timeit(lambda: fused.eval(initial_state()))
+        assert str(v1) == str(v2)
+        print(f"{name:10} {c1.n:9} evals  fused {c2.n:9} evals ({c2.n / c1.n - 1:+.0%})  "
+              f"{t1 * 1000:8.2f} ms  fused {t2 * 1000:8.2f} ms  {t1 / t2:5.2f}x")
+
+
+def editor_source(n):
+    lines = []
+    for i in range(n):
+        call = f"f{i - 1} c" if i else "c"
+        lines += [f"let f{i} = fn x =>",
+                  f"  let a = x + {i} in",
+                  "  let b = a * 2 in",
+                  "  let c = b - 1 in",
+                  "    if c > 100",
+                  "    then c",
+                  f"    else {call}",
+                  "  end end end",
+                  "in"]
+    lines.append(f"f{n - 1} 1")
+    lines.append(" ".join(["end"] * n))
+    return "\n".join(lines) + "\n"
+
+
+def bench_incremental(n=5500, seed=0):
+    from random import Random
+    from statistics import median
+    from simpl_incremental import Document
+    rng = Random(seed)
+    text = editor_source(n)
+    t0 = time.perf_counter()
+    doc = Document(text)
+    assert doc.check() == []
+    cold = time.perf_counter() - t0
+    print(f"{text.count(chr(10))} lines  {len(doc.bindings)} bindings  "
+          f"cold lex+parse+check {cold * 1000:8.1f} ms")
+
+    def at(k, old):
+        i = doc.text.index(f"let f{k} = ")
+        return doc.text.index(old, i)
+
+    def literal(k):
+        i = at(k, f"x + {k}") + 4
+        yield i, i + len(str(k)), str(k + 1)
+        yield i, i + len(str(k + 1)), str(k)
+
+    def retype(k):
+        i = at(k, "then c") + 5
+        yield i, i + 1, "true"
+        yield i, i + 4, "c"
+
+    def typo(k):
+        i = at(k, "a * 2") + 2
+        yield i, i + 1, "*)"
+        yield i, i + 2, "*"
+
+    def nested(k):
+        i = at(k, "then c") + 5
+        yield i, i + 1, ""
+        for j, c in enumerate("let z = c in z end"):
+            yield i + j, i + j, c
+
+    def insert(k):
+        i = doc.text.index(f"let f{k} = ")
+        yield i, i, f"let g{k} = {k} in\n"
+        yield len(doc.text), len(doc.text), " end"
+
+    kinds = {"literal": literal, "retype": retype, "typo": typo, "nested": nested, "insert": insert}
+    for name, steps in kinds.items():
+        times, broken = [], 0
+        for _ in range(5):
+            k = rng.randrange(n // 2, n)
+            for start, end, new in steps(k):
+                t0 = time.perf_counter()
+                doc.edit(start, end, new)
+                broken += bool(doc.check())
+                times.append(time.perf_counter() - t0)
+        print(f"{name:8} {len(times):3} edits  median {median(times) * 1000:7.2f} ms  "
+              f"max {max(times) * 1000:7.2f} ms  {broken} with diagnostics")
+    fresh = Document(doc.text)
+    assert fresh.check() == doc.check() == [] and fresh.types() == doc.types()
+    print(f"{doc.parsed} bindings parsed, {doc.checked} typechecked over the replay")
+
+
+def deep_program(shape, n):
+    from simpl_ast import Name, IntegerLiteral, Nil, Let, Seq, Cons, Fn, App
+    if shape == "let":
+        e = Name("x0")
+        for i in range(n):
+            e = Let(f"x{i}", IntegerLiteral(i), e)
+    elif shape == "seq":
+        e = Parser(Lexer("; ".join(map(str, range(n))))).parse()
+    elif shape == "cons":
+        e = Nil()
+        for i in range(n):
+            e = Cons(IntegerLiteral(i), e)
+    else:
+        e = Name("x0")
+        for i in range(n):
+            e = App(Fn(f"x{i}", e), IntegerLiteral(i))
+    return e
+
+
+def deep_source(shape, n):
+    if shape == "let":
+        return "".join(f"let x{i} = {i} in " for i in range(n)) + "x0" + " end" * n
+    if shape == "seq":
+        return "; ".join(map(str, range(n)))
+    if shape == "cons":
+        return " :: ".join(map(str, range(n))) + " :: nil"
+    return " + ".join(["1"] * n)
+
+
+def bench_deep(sizes=(10 ** 3, 10 ** 4, 10 ** 5, 10 ** 6), pipeline=(10 ** 3, 10 ** 4, 10 ** 5)):
+    from simpl_infer import infer
+    from simpl_api import Interpreter
+    expected = {"let": "int", "seq": "int", "cons": "int list", "app": "int"}
+    for shape, t in expected.items():
+        for n in sizes:
+            program = deep_program(shape, n)
+            try:
+                t1, _ = timeit(lambda: program.typecheck(initial_type_env()), repeat=1)
+                recursive = f"{t1 * 1000:9.1f} ms"
+            except RecursionError:
+                recursive = "recursion limit"
+            t2, r = timeit(lambda: infer(program, initial_type_env()), repeat=1)
+            assert str(r.s.apply(r.t)) == t
+            print(f"{shape:5} depth {n:8}  recursive {recursive:>15}  stack {t2 * 1000:9.1f} ms  "
+                  f"{t2 / n * 1e6:5.2f} us/level")
+    values = {"let": lambda n: "0", "seq": lambda n: str(n - 1), "cons": lambda n: f"list@{n}", "plus": str}
+    for shape, value in values.items():
+        for n in pipeline:
+            for deep in (False, True)[n > 10 ** 3:]:
+                it = Interpreter(deep=deep)
+                t, r = timeit(lambda: it.interpret(deep_source(shape, n)), repeat=1)
+                assert r == (value(n), None), (shape, n, deep, r)
+                print(f"{shape:5} depth {n:8}  interpret{' --deep' * deep:7} {t * 1000:9.1f} ms  "
+                      f"checker {it.record['checker']}")
+
+
+BENCHMARKS = {
+    "parallel": bench_parallel,
+    "server": bench_server,
+    "startup": bench_startup,
+    "specialize": bench_specialize,
+    "flat": bench_flat,
+    "jit": bench_jit,
+    "parse": bench_parse,
+    "checkpoint": bench_checkpoint,
+    "lists": bench_lists,
+    "memo": bench_memo,
+    "batch": bench_batch,
+    "modules": bench_modules,
+    "typestats": bench_typestats,
+    "escape": bench_escape,
+    "licm": bench_licm,
+    "transpile": bench_transpile,
+    "vm": bench_vm,
+    "threads": bench_threads,
+    "api": bench_api,
+    "profile": bench_profile,
+    "memory": bench_memory,
+    "telemetry": bench_telemetry,
+    "fuse": bench_fuse,
+    "incremental": bench_incremental,
+    "deep": bench_deep,
+}
+
+
+if __name__ == "__main__":
+    names = sys.argv[1:] or list(BENCHMARKS)
+    for name in names:
+        print(f"== {name}")
+        BENCHMARKS[name]()
@@ -0,0 +1,100 @@
+from dataclasses import dataclass
+from simpl_ast import *
+
+
+@dataclass(eq=False)
+class Cell(Value):
+    v: Value
+
+
+class LocalLet(Let):
+    def eval(self, s):
+        s.p.set(s.p.get() + 1)
+        v = self.e1.e.eval(s)
+        return self.e2.eval(State.of(Env(s.E, self.x, Cell(v)), s.M, s.p))
+
+    def eval_int(self, s):
+        s.p.set(s.p.get() + 1)
+        v = self.e1.e.eval(s)
+        return self.e2.eval_int(State.of(Env(s.E, self.x, Cell(v)), s.M, s.p))
+
+    def eval_bool(self, s):
+        s.p.set(s.p.get() + 1)
+        v = self.e1.e.eval(s)
+        return self.e2.eval_bool(State.of(Env(s.E, self.x, Cell(v)), s.M, s.p))
+
+
+class LocalDeref(Deref):
+    def eval(self, s): return s.E.get(self.e.x).v
+    def eval_int(self, s): return s.E.get(self.e.x).v.n
+    def eval_bool(self, s): return s.E.get(self.e.x).v.b
+
+
+class LocalAssign(Assign):
+    def eval(self, s):
+        s.E.get(self.l.x).v = self.r.eval(s)
+        return Value.UNIT
+
+
+def _name(e):
+    while isinstance(e, Group):
+        e = e.e
+    return e.x if isinstance(e, Name) else None
+
+
+def escapes(x, e):
+    stack = [e]
+    while stack:
+        e = stack.pop()
+        if isinstance(e, Name):
+            if e.x == x:
+                return True
+        elif isinstance(e, Deref) and _name(e.e) == x:
+            continue
+        elif isinstance(e, Assign) and _name(e.l) == x:
+            stack.append(e.r)
+        elif isinstance(e, (Fn, Rec, Import)) and e.x == x:
+            continue
+        elif isinstance(e, Let) and e.x == x:
+            stack.append(e.e1)
+        else:
+            stack.extend(e.children())
+    return False
+
+
+def _typed(n, e):
+    if hasattr(e, "type"):
+        n.type = e.type
+    return n
+
+
+def localize(x, e):
+    def enter(e, c, active):
+        if isinstance(e, (Fn, Rec, Import)) and e.x == x:
+            return False
+        if isinstance(e, Let) and e.x == x and c is not e.e1:
+            return False
+        return active
+
+    def exit(e, active):
+        if active and isinstance(e, Deref) and _name(e.e) == x:
+            return _typed(LocalDeref(Name(x)), e)
+        if active and isinstance(e, Assign) and _name(e.l) == x:
+            return _typed(LocalAssign(Name(x), e.r), e)
+        return e
+
+    return rebuild(e, exit, enter, True)
+
+
+def _scalarized(e, c):
+    if type(e) is Let:
+        r = e.e1
+        while isinstance(r, Group):
+            r = r.e
+        if isinstance(r, Ref) and not escapes(e.x, e.e2):
+            return _typed(LocalLet(e.x, r, localize(e.x, e.e2)), e)
+    return e
+
+
+def scalarize(e):
+    return rebuild(e, _scalarized)
@@ -0,0 +1,328 @@
+import operator
+from array import array
+from simpl_ast import *
+from simpl_infer import Solution, RULES, VISIT, CHECK, BIND, UNBIND, EXIT, lookup
+
+NODES = [
+    IntegerLiteral, BooleanLiteral, Unit, Nil, Name,
+    Add, Sub, Mul, Div, Mod, Eq, Neq, Less, LessEq, Greater, GreaterEq,
+    AndAlso, OrElse, Pair, Cons, Seq, Assign, App,
+    Neg, Not, Ref, Deref, Group,
+    Cond, Loop, Let, Fn, Rec, Import,
+]
+OPS = {cls: op for op, cls in enumerate(NODES)}
+
+
+class FlatAst:
+    def __init__(self):
+        self.op = array('B')
+        self.a = array('i')
+        self.b = array('i')
+        self.c = array('i')
+        self.ints = []
+        self.names = []
+        self.name_ids = {}
+        self.bodies = {}
+
+    def __len__(self):
+        return len(self.op)
+
+    def node(self, op, a=-1, b=-1, c=-1):
+        self.op.append(op)
+        self.a.append(a)
+        self.b.append(b)
+        self.c.append(c)
+        return len(self.op) - 1
+
+    def name(self, x):
+        i = self.name_ids.get(x)
+        if i is None:
+            i = self.name_ids[x] = len(self.names)
+            self.names.append(x)
+        return i
+
+    def IntegerLiteral(self, n):
+        self.ints.append(n)
+        return self.node(OPS[IntegerLiteral], len(self.ints) - 1)
+
+    def BooleanLiteral(self, b): return self.node(OPS[BooleanLiteral], int(b))
+    def Unit(self): return self.node(OPS[Unit])
+    def Nil(self): return self.node(OPS[Nil])
+    def Name(self, x): return self.node(OPS[Name], self.name(x))
+    def Cond(self, e1, e2, e3): return self.node(OPS[Cond], e1, e2, e3)
+    def Loop(self, e1, e2): return self.node(OPS[Loop], e1, e2)
+    def Let(self, x, e1, e2): return self.node(OPS[Let], self.name(x), e1, e2)
+    def Fn(self, x, e): return self.node(OPS[Fn], self.name(x), e)
+    def Rec(self, x, e): return self.node(OPS[Rec], self.name(x), e)
+    def Import(self, x, e): return self.node(OPS[Import], self.name(x), e)
+
+    def root(self, root=None):
+        return len(self.op) - 1 if root is None else root
+
+    def body(self, i):
+        b = self.bodies.get(i)
+        if b is None:
+            b = self.bodies[i] = Body(self, i)
+        return b
+
+    def typecheck(self, E, root=None):
+        s = Solution()
+        op, A, B, C, names = self.op, self.a, self.b, self.c, self.names
+        scope, ts = {}, []
+        ops, args = [VISIT], [self.root(root)]
+        while ops:
+            k, j = ops.pop(), args.pop()
+            if k == VISIT:
+                cls = NODES[op[j]]
+                if cls is IntegerLiteral:
+                    ts.append(Type.INT)
+                elif cls is BooleanLiteral:
+                    ts.append(Type.BOOL)
+                elif cls is Name:
+                    ts.append(lookup(names[A[j]], scope.get(A[j]), E))
+                elif cls is Unit:
+                    ts.append(Type.UNIT)
+                elif cls is Nil:
+                    ts.append(ListType(TypeVar(True)))
+                else:
+                    kind = RULES[cls][0]
+                    if kind is Let:
+                        ops += (EXIT, UNBIND, VISIT, BIND, VISIT)
+                        args += (j, A[j], C[j], A[j], B[j])
+                    elif kind is Fn or kind is Rec:
+                        ts.append(TypeVar(True))
+                        ops += (EXIT, UNBIND, VISIT, BIND)
+                        args += (j, A[j], B[j], A[j])
+                    elif kind is Import:
+                        raise TypeError("import")
+                    elif kind is Cond:
+                        ops += (EXIT, VISIT, VISIT, CHECK, VISIT)
+                        args += (j, C[j], B[j], j, A[j])
+                    elif kind is Loop:
+                        ops += (EXIT, VISIT, CHECK, VISIT)
+                        args += (j, B[j], j, A[j])
+                    elif kind is App:
+                        ts.append(TypeVar(False))
+                        ops += (EXIT, VISIT, VISIT)
+                        args += (j, B[j], A[j])
+                    elif kind is UnaryExpr:
+                        ops += (EXIT, VISIT)
+                        args += (j, A[j])
+                    else:
+                        ops += (EXIT, VISIT, VISIT)
+                        args += (j, B[j], A[j])
+            elif k == BIND:
+                scope.setdefault(j, []).append(ts[-1])
+            elif k == UNBIND:
+                scope[j].pop()
+            elif k == CHECK:
+                s.unify(ts[-1], Type.BOOL)
+            else:
+                cls = NODES[op[j]]
+                ts.append(RULES[cls][1](cls, ts, s))
+        return TypeResult.of(s, ts.pop())
+
+    def eval(self, s, root=None):
+        j = self.root(root)
+        return EVAL[self.op[j]](self, j, s)
+
+    def to_expr(self, root=None):
+        nodes = []
+        names, ints = self.names, self.ints
+        for op, a, b, c in zip(self.op, self.a, self.b, self.c):
+            cls = NODES[op]
+            if cls is IntegerLiteral:
+                e = cls(ints[a])
+            elif cls is BooleanLiteral:
+                e = cls(bool(a))
+            elif cls is Name:
+                e = cls(names[a])
+            elif cls in (Unit, Nil):
+                e = cls()
+            elif cls in (Fn, Rec, Import):
+                e = cls(names[a], nodes[b])
+            elif cls is Let:
+                e = cls(names[a], nodes[b], nodes[c])
+            elif cls is Cond:
+                e = cls(nodes[a], nodes[b], nodes[c])
+            elif issubclass(cls, UnaryExpr):
+                e = cls(nodes[a])
+            else:
+                e = cls(nodes[a], nodes[b])
+            nodes.append(e)
+        return nodes[self.root(root)]
+
+
+class Body(Expr):
+    def __init__(self, flat, i):
+        self.flat = flat
+        self.i = i
+
+    def __str__(self): return str(self.flat.to_expr(self.i))
+    def eval(self, s): return EVAL[self.flat.op[self.i]](self.flat, self.i, s)
+
+
+def _build(op):
+    return lambda self, *children: self.node(op, *children)
+
+
+for _cls in NODES:
+    if issubclass(_cls, (BinaryExpr, UnaryExpr)):
+        setattr(FlatAst, _cls.__name__, _build(OPS[_cls]))
+
+
+def _int(f, j, s): return IntValue(f.ints[f.a[j]])
+def _bool(f, j, s): return BoolValue(bool(f.a[j]))
+def _unit(f, j, s): return Value.UNIT
+def _nil(f, j, s): return Value.NIL
+
+
+def _name(f, j, s):
+    v = s.E.get(f.names[f.a[j]])
+    if v is None:
+        raise RuntimeError("name")
+    if isinstance(v, RecValue):
+        return Rec(v.x, v.e).eval(State.of(v.E, s.M, s.p))
+    return v
+
+
+def _binary(fn, box, unbox):
+    def ev(f, j, s):
+        l, r = f.a[j], f.b[j]
+        v1 = EVAL[f.op[l]](f, l, s)
+        v2 = EVAL[f.op[r]](f, r, s)
+        return box(fn(unbox(v1), unbox(v2)))
+    return ev
+
+
+def _divide(fn):
+    def ev(f, j, s):
+        l, r = f.a[j], f.b[j]
+        v2 = EVAL[f.op[r]](f, r, s).n
+        if v2 == 0:
+            raise RuntimeError("division by zero")
+        return IntValue(fn(EVAL[f.op[l]](f, l, s).n, v2))
+    return ev
+
+
+def _pair(f, j, s):
+    l, r = f.a[j], f.b[j]
+    return PairValue(EVAL[f.op[l]](f, l, s), EVAL[f.op[r]](f, r, s))
+
+
+def _cons(f, j, s):
+    l, r = f.a[j], f.b[j]
+    return ConsValue(EVAL[f.op[l]](f, l, s), EVAL[f.op[r]](f, r, s))
+
+
+def _andalso(f, j, s):
+    l, r = f.a[j], f.b[j]
+    return BoolValue(EVAL[f.op[l]](f, l, s).b and EVAL[f.op[r]](f, r, s).b)
+
+
+def _orelse(f, j, s):
+    l, r = f.a[j], f.b[j]
+    return BoolValue(EVAL[f.op[l]](f, l, s).b or EVAL[f.op[r]](f, r, s).b)
+
+
+def _seq(f, j, s):
+    l, r = f.a[j], f.b[j]
+    EVAL[f.op[l]](f, l, s)
+    return EVAL[f.op[r]](f, r, s)
+
+
+def _assign(f, j, s):
+    l, r = f.a[j], f.b[j]
+    ptr = EVAL[f.op[l]](f, l, s)
+    s.M.put(ptr.p, EVAL[f.op[r]](f, r, s))
+    return Value.UNIT
+
+
+def _app(f, j, s):
+    l, r = f.a[j], f.b[j]
+    fv = EVAL[f.op[l]](f, l, s)
+    v = EVAL[f.op[r]](f, r, s)
+    if type(fv) is FunValue and type(fv.e) is Body and fv.e.flat is f:
+        i = fv.e.i
+        return EVAL[f.op[i]](f, i, State.of(Env(fv.E, fv.x, v), s.M, s.p))
+    return apply(fv, v, s)
+
+
+def _unary(fn, box, unbox):
+    def ev(f, j, s):
+        e = f.a[j]
+        return box(fn(unbox(EVAL[f.op[e]](f, e, s))))
+    return ev
+
+
+def _ref(f, j, s):
+    ptr = s.p.get()
+    s.p.set(ptr + 1)
+    e = f.a[j]
+    s.M.put(ptr, EVAL[f.op[e]](f, e, s))
+    return RefValue(ptr)
+
+
+def _deref(f, j, s):
+    e = f.a[j]
+    v = s.M.get(EVAL[f.op[e]](f, e, s).p)
+    if v is None:
+        raise RuntimeError("deref")
+    return v
+
+
+def _group(f, j, s):
+    e = f.a[j]
+    return EVAL[f.op[e]](f, e, s)
+
+
+def _cond(f, j, s):
+    e = f.a[j]
+    e = f.b[j] if EVAL[f.op[e]](f, e, s).b else f.c[j]
+    return EVAL[f.op[e]](f, e, s)
+
+
+def _loop(f, j, s):
+    e1, e2 = f.a[j], f.b[j]
+    while EVAL[f.op[e1]](f, e1, s).b:
+        EVAL[f.op[e2]](f, e2, s)
+    return Value.UNIT
+
+
+def _let(f, j, s):
+    e1, e2 = f.b[j], f.c[j]
+    v1 = EVAL[f.op[e1]](f, e1, s)
+    return EVAL[f.op[e2]](f, e2, State.of(Env(s.E, f.names[f.a[j]], v1), s.M, s.p))
+
+
+def _fn(f, j, s):
+    return FunValue(s.E, f.names[f.a[j]], f.body(f.b[j]))
+
+
+def _rec(f, j, s):
+    x, e = f.names[f.a[j]], f.b[j]
+    rv = RecValue(s.E, x, f.body(e))
+    return EVAL[f.op[e]](f, e, State.of(Env(s.E, x, rv), s.M, s.p))
+
+
+def _import(f, j, s):
+    raise RuntimeError("import")
+
+
+_n = operator.attrgetter("n")
+_b = operator.attrgetter("b")
+_v = lambda v: v
+EVAL = [{
+    IntegerLiteral: _int, BooleanLiteral: _bool, Unit: _unit, Nil: _nil, Name: _name,
+    Add: _binary(operator.add, IntValue, _n), Sub: _binary(operator.sub, IntValue, _n),
+    Mul: _binary(operator.mul, IntValue, _n),
+    Div: _divide(lambda a, b: int(a / b)), Mod: _divide(operator.mod),
+    Eq: _binary(operator.eq, BoolValue, _v), Neq: _binary(lambda a, b: not a == b, BoolValue, _v),
+    Less: _binary(operator.lt, BoolValue, _n), LessEq: _binary(operator.le, BoolValue, _n),
+    Greater: _binary(operator.gt, BoolValue, _n), GreaterEq: _binary(operator.ge, BoolValue, _n),
+    AndAlso: _andalso, OrElse: _orelse, Pair: _pair,
+    Cons: _cons, Seq: _seq, Assign: _assign, App: _app,
+    Neg: _unary(operator.neg, IntValue, _n), Not: _unary(operator.not_, BoolValue, _b),
+    Ref: _ref, Deref: _deref, Group: _group,
+    Cond: _cond, Loop: _loop, Let: _let, Fn: _fn, Rec: _rec, Import: _import,
+}[cls] for cls in NODES]
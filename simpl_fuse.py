@@ -0,0 +1,170 @@
+from simpl_ast import *
+from simpl_escape import LocalDeref, LocalAssign
+from simpl_specialize import IntEq, IntNeq
+
+
+class AddAssign(Assign):
+    def eval(self, s):
+        M = s.M
+        p = s.E.get(self.l.x).p
+        v = M.get(p)
+        if v is None:
+            raise RuntimeError("deref")
+        M.put(p, IntValue(v.n + self.sign * self.r.r.eval_int(s)))
+        return Value.UNIT
+
+
+class CellAddAssign(LocalAssign):
+    def eval(self, s):
+        c = s.E.get(self.l.x)
+        c.v = IntValue(c.v.n + self.sign * self.r.r.eval_int(s))
+        return Value.UNIT
+
+
+def _load(s, x):
+    v = s.M.get(s.E.get(x).p)
+    if v is None:
+        raise RuntimeError("deref")
+    return v.n
+
+
+class DerefEq(IntEq):
+    def eval(self, s): return BoolValue(_load(s, self.l.e.x) == self.r.n)
+    def eval_bool(self, s): return _load(s, self.l.e.x) == self.r.n
+
+
+class DerefNeq(IntNeq):
+    def eval(self, s): return BoolValue(_load(s, self.l.e.x) != self.r.n)
+    def eval_bool(self, s): return _load(s, self.l.e.x) != self.r.n
+
+
+class CellEq(IntEq):
+    def eval(self, s): return BoolValue(s.E.get(self.l.e.x).v.n == self.r.n)
+    def eval_bool(self, s): return s.E.get(self.l.e.x).v.n == self.r.n
+
+
+class CellNeq(IntNeq):
+    def eval(self, s): return BoolValue(s.E.get(self.l.e.x).v.n != self.r.n)
+    def eval_bool(self, s): return s.E.get(self.l.e.x).v.n != self.r.n
+
+
+class Offset(App):
+    def eval(self, s): return IntValue(self.r.eval_int(s) + self.d)
+    def eval_int(self, s): return self.r.eval_int(s) + self.d
+
+
+class OffsetApp(App):
+    def eval(self, s):
+        f = self.l.eval(s)
+        v = IntValue(self.r.r.eval_int(s) + self.r.d)
+        if type(f) is FunValue:
+            return f.e.eval(State.of(Env(f.E, f.x, v), s.M, s.p))
+        return apply(f, v, s)
+
+    def eval_int(self, s):
+        f = self.l.eval(s)
+        v = IntValue(self.r.r.eval_int(s) + self.r.d)
+        if type(f) is FunValue:
+            return f.e.eval_int(State.of(Env(f.E, f.x, v), s.M, s.p))
+        return apply(f, v, s).n
+
+    def eval_bool(self, s):
+        f = self.l.eval(s)
+        v = IntValue(self.r.r.eval_int(s) + self.r.d)
+        if type(f) is FunValue:
+            return f.e.eval_bool(State.of(Env(f.E, f.x, v), s.M, s.p))
+        return apply(f, v, s).b
+
+
+class IsZero(App):
+    def eval(self, s): return BoolValue(self.r.eval_int(s) == 0)
+    def eval_bool(self, s): return self.r.eval_int(s) == 0
+
+
+class IsOne(App):
+    def eval(self, s): return BoolValue(self.r.r.eval_int(s) == 1)
+    def eval_bool(self, s): return self.r.r.eval_int(s) == 1
+
+
+class ZeroCond(Cond):
+    def eval(self, s):
+        return (self.e2 if self.e1.r.eval_int(s) == 0 else self.e3).eval(s)
+
+    def eval_int(self, s):
+        return (self.e2 if self.e1.r.eval_int(s) == 0 else self.e3).eval_int(s)
+
+    def eval_bool(self, s):
+        return (self.e2 if self.e1.r.eval_int(s) == 0 else self.e3).eval_bool(s)
+
+
+OFFSETS = {"pred": -1, "succ": 1}
+BUILTINS = {"iszero", *OFFSETS}
+TESTS = {(Deref, IntEq): DerefEq, (Deref, IntNeq): DerefNeq,
+         (LocalDeref, IntEq): CellEq, (LocalDeref, IntNeq): CellNeq}
+
+
+def _strip(e):
+    while type(e) is Group:
+        e = e.e
+    return e
+
+
+def _typed(n, e, **attrs):
+    if hasattr(e, "type"):
+        n.type = e.type
+    for k, v in attrs.items():
+        setattr(n, k, v)
+    return n
+
+
+def _builtin(e, bound):
+    e = _strip(e)
+    if type(e) is Name and e.x not in bound:
+        return e.x
+    return None
+
+
+def _deref(e):
+    e = _strip(e)
+    if type(e) in (Deref, LocalDeref):
+        x = _strip(e.e)
+        if type(x) is Name:
+            return _typed(type(e)(x), e)
+    return None
+
+
+def _fused(e, bound):
+    cls = type(e)
+    if cls in (Assign, LocalAssign):
+        l, r = _strip(e.l), _strip(e.r)
+        if type(l) is Name and type(r) in (Add, Sub):
+            d = _deref(r.l)
+            if d is not None and d.e.x == l.x and (type(d) is LocalDeref) == (cls is LocalAssign):
+                fused = CellAddAssign if cls is LocalAssign else AddAssign
+                return _typed(fused(l, _typed(type(r)(d, r.r), r)), e, sign=1 if type(r) is Add else -1)
+    elif cls in (IntEq, IntNeq):
+        d, r = _deref(e.l), _strip(e.r)
+        if d is not None and type(r) is IntegerLiteral:
+            return _typed(TESTS[type(d), cls](d, r), e)
+    elif cls is App:
+        f, r = _builtin(e.l, bound), _strip(e.r)
+        if f == "iszero":
+            if type(r) is Offset and r.d == -1:
+                return _typed(IsOne(e.l, r), e)
+            return _typed(IsZero(e.l, r), e)
+        if f in OFFSETS:
+            return _typed(Offset(e.l, r), e, d=OFFSETS[f])
+        if type(r) is Offset:
+            return _typed(OffsetApp(e.l, r), e)
+    elif cls is Cond and type(e.e1) is IsZero:
+        return _typed(ZeroCond(e.e1, e.e2, e.e3), e)
+    return e
+
+
+def _scope(e, c, bound):
+    binds = isinstance(e, (Fn, Rec, Import)) or isinstance(e, Let) and c is e.e2
+    return bound | {e.x} if binds and e.x in BUILTINS else bound
+
+
+def fuse(e, bound=frozenset()):
+    return rebuild(e, _fused, _scope, bound)
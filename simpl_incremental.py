@@ -0,0 +1,354 @@
+import heapq
+from bisect import bisect_left, bisect_right
+from dataclasses import dataclass, field
+from simpl_parser import *
+from simpl_lib import initial_type_env
+
+
+@dataclass
+class Diagnostic:
+    start: int
+    end: int
+    category: str
+    message: str
+
+
+@dataclass(eq=False)
+class Binding:
+    name: str
+    start: int
+    end: int
+    source: str
+    head: int = 0
+    index: int = 0
+    ast: Expr = None
+    free: tuple = ()
+    error: Diagnostic = None
+    providers: tuple = ()
+    users: set = field(default_factory=set)
+    deps: tuple = None
+    result: TypeResult = None
+    failure: Diagnostic = None
+    ok: bool = False
+    t: Type = None
+
+    def exported(self):
+        return self.result.t if self.ok else None
+
+
+def free(e):
+    out, stack = set(), [(e, frozenset())]
+    while stack:
+        e, bound = stack.pop()
+        if isinstance(e, Name):
+            if e.x not in bound:
+                out.add(e.x)
+        elif isinstance(e, (Fn, Rec, Import)):
+            stack.append((e.e, bound | {e.x}))
+        elif isinstance(e, Let):
+            stack.append((e.e1, bound))
+            stack.append((e.e2, bound | {e.x}))
+        else:
+            stack.extend((c, bound) for c in e.children())
+    return tuple(sorted(out))
+
+
+def ground(t):
+    if isinstance(t, TypeVar):
+        return False
+    return all(ground(v) for v in vars(t).values() if isinstance(v, Type))
+
+
+def balanced(lexer):
+    depth = 0
+    for i, k in enumerate(lexer.kinds):
+        if k == LET or lexer.is_import(i):
+            depth += 1
+        elif k == END:
+            depth -= 1
+            if depth < 0:
+                return False
+        elif k == IN and depth == 0:
+            return False
+    return depth == 0
+
+
+def closed(source):
+    i, n = source.find("(*"), len(source)
+    while i >= 0:
+        depth, i = 1, i + 2
+        while depth and i < n:
+            if source.startswith("(*", i):
+                depth, i = depth + 1, i + 2
+            elif source.startswith("*)", i):
+                depth, i = depth - 1, i + 2
+            else:
+                i += 1
+        if depth:
+            return False
+        i = source.find("(*", i)
+    return True
+
+
+def chain(lx, offset=0):
+    k, starts, ends = lx.kinds, lx.starts, lx.ends
+    spans, i = [], 0
+    while k[i] == LET and k[i + 1] in NAMES and k[i + 2] == EQ:
+        j, depth = i + 3, 0
+        while k[j] != EOF and not (k[j] == IN and depth == 0):
+            if k[j] == LET or lx.is_import(j):
+                depth += 1
+            elif k[j] == END:
+                depth -= 1
+            j += 1
+        if k[j] != IN:
+            break
+        spans.append((lx.names[lx.ids[i + 1]], offset + starts[i], offset + ends[i + 2], offset + starts[j]))
+        i = j + 1
+    return spans, i
+
+
+def segment(text):
+    lx = Lexer(text)
+    spans, i = chain(lx)
+    if not spans:
+        return [(None, 0, 0, len(text))]
+    k, j, depth = lx.kinds, i, 0
+    while k[j] != EOF and not (k[j] == END and depth == 0):
+        if k[j] == LET or lx.is_import(j):
+            depth += 1
+        elif k[j] == END:
+            depth -= 1
+        j += 1
+    body = lx.ends[i - 1]
+    return spans + [(None, body, body, lx.starts[j])]
+
+
+class Document:
+    def __init__(self, text):
+        self.text = text
+        self.E = initial_type_env()
+        self.bindings = []
+        self.cache = {}
+        self.dirty = set()
+        self.broken = set()
+        self.parsed = 0
+        self.checked = 0
+        self.rebuild()
+
+    def make(self, spans, pool):
+        out = []
+        for name, head, start, end in spans:
+            source = self.text[start:end]
+            reuse = pool.get((name, source))
+            if reuse:
+                b = reuse.pop()
+            else:
+                b = Binding(name, start, end, source)
+                self.parse(b, Lexer(source))
+            b.head, b.start, b.end = head, start, end
+            out.append(b)
+        return out
+
+    def rebuild(self):
+        spans = segment(self.text)
+        pool = {}
+        for b in self.cache.values():
+            pool.setdefault((b.name, b.source), []).append(b)
+        self.bindings = self.make(spans, pool)
+        if len(spans) > 1 or not self.cache:
+            self.cache = {id(b): b for b in self.bindings}
+        self.index()
+        for b in self.bindings:
+            b.users = set()
+        for b in self.bindings:
+            self.link(b)
+        self.dirty = set(self.bindings)
+        self.broken = set()
+
+    def index(self):
+        self.starts = [b.start for b in self.bindings]
+        self.heads = [b.head for b in self.bindings]
+        self.positions = {}
+        for i, b in enumerate(self.bindings):
+            b.index = i
+            if b.name is not None:
+                self.positions.setdefault(b.name, []).append(i)
+
+    def link(self, b):
+        for _, p in b.providers:
+            p.users.discard(b)
+        providers = []
+        for y in b.free:
+            indices = self.positions.get(y)
+            k = bisect_left(indices, b.index) - 1 if indices else -1
+            if k >= 0:
+                p = self.bindings[indices[k]]
+                providers.append((y, p))
+                p.users.add(b)
+        changed = tuple(p for _, p in providers) != tuple(p for _, p in b.providers)
+        b.providers = tuple(providers)
+        return changed
+
+    def parse(self, b, lexer):
+        b.ast, b.free, b.error = None, (), None
+        b.deps, b.failure = None, None
+        if lexer is None:
+            b.error = Diagnostic(b.start, b.end, "syntax error", "unbalanced let/in/end or comment")
+            return
+        self.parsed += 1
+        try:
+            ast = Parser(lexer).parse()
+            if lexer.peek() != EOF:
+                raise lexer.error("unexpected token")
+        except Exception as e:
+            b.error = Diagnostic(b.start, b.end, "syntax error", str(e))
+            return
+        b.ast, b.free = ast, free(ast)
+
+    def find(self, start, end):
+        i = bisect_left(self.starts, start + 1) - 1
+        if i >= 0 and end <= self.bindings[i].end:
+            return i
+        return None
+
+    def shift(self, i, delta):
+        for j in range(i, len(self.bindings)):
+            c = self.bindings[j]
+            c.head += delta
+            c.start += delta
+            c.end += delta
+            self.heads[j] += delta
+            self.starts[j] += delta
+
+    def edit(self, start, end, text):
+        self.text = self.text[:start] + text + self.text[end:]
+        delta = len(text) - (end - start)
+        i = self.find(start, end)
+        b = self.bindings[i] if i is not None else None
+        if b is not None and b.start < start and end < b.end and len(self.bindings) > 1:
+            source = b.source[:start - b.start] + text + b.source[end - b.start:]
+            lexer = Lexer(source)
+            if not (closed(source) and balanced(lexer)):
+                if not self.resegment(start, end, delta):
+                    self.update(i, source, delta, None)
+                return
+            if b.name is not None or not chain(lexer)[0]:
+                self.update(i, source, delta, lexer)
+                return
+        if self.ignored(start) or self.resegment(start, end, delta):
+            return
+        self.rebuild()
+
+    def update(self, i, source, delta, lexer):
+        b = self.bindings[i]
+        b.source = source
+        b.end += delta
+        self.shift(i + 1, delta)
+        self.parse(b, lexer)
+        self.link(b)
+        self.dirty.add(b)
+
+    def ignored(self, start):
+        body = self.bindings[-1]
+        if body.name is not None or start < body.end + 3 or len(self.bindings) == 1:
+            return False
+        c = self.text[body.end + 3:body.end + 4]
+        return self.text.startswith("end", body.end) and not (c.isalnum() or c and c in "_'")
+
+    def resegment(self, start, end, delta):
+        i = bisect_right(self.heads, start) - 1
+        j = bisect_right(self.heads, end)
+        if i < 0 or j >= len(self.bindings) or self.bindings[i].name is None:
+            return False
+        a, z = self.heads[i], self.heads[j] + delta
+        window = self.text[a:z]
+        if not (a == 0 or self.text[a - 1].isspace()) or not self.text[z - 1].isspace() or not closed(window):
+            return False
+        lexer = Lexer(window)
+        spans, k = chain(lexer, a)
+        if not spans or lexer.kinds[k] != EOF:
+            return False
+        old = self.bindings[i:j]
+        pool = {}
+        for b in old:
+            pool.setdefault((b.name, b.source), []).append(b)
+        new = self.make(spans, pool)
+        self.shift(j, delta)
+        self.bindings[i:j] = new
+        kept, prior = set(new), set(old)
+        for b in old:
+            if b not in kept:
+                del self.cache[id(b)]
+                for _, p in b.providers:
+                    p.users.discard(b)
+                self.dirty.discard(b)
+                self.broken.discard(b)
+        for b in new:
+            if id(b) not in self.cache:
+                self.cache[id(b)] = b
+                b.users = set()
+        self.index()
+        names = {b.name for b in old if b not in kept} | {b.name for b in new if b not in prior}
+        for b in new:
+            self.link(b)
+            self.dirty.add(b)
+        for b in self.bindings[i + len(new):]:
+            if names.intersection(b.free) and self.link(b):
+                self.dirty.add(b)
+        return True
+
+    def infer(self, b):
+        if b.error:
+            b.ok = False
+            return
+        deps = tuple((y, p.exported()) for y, p in b.providers)
+        if b.deps is not None and len(deps) == len(b.deps) and \
+                all(t is u for (_, t), (_, u) in zip(deps, b.deps)):
+            b.ok = b.failure is None
+            return
+        self.checked += 1
+        E = self.E
+        for y, t in deps:
+            E = ExtendedTypeEnv(E, y, TypeVar(False) if t is None else t)
+        b.deps = deps
+        try:
+            r = b.ast.typecheck(E)
+        except TypeError as e:
+            b.failure, b.ok = Diagnostic(b.start, b.end, "type error", str(e)), False
+            return
+        if b.t is not None and ground(r.t) and ground(b.t) and str(r.t) == str(b.t):
+            r = TypeResult.of(r.s, b.t)
+        b.result, b.failure, b.ok, b.t = r, None, True, r.t
+
+    def check(self):
+        queue = [(b.index, b) for b in self.dirty]
+        heapq.heapify(queue)
+        queued = set(self.dirty)
+        while queue:
+            _, b = heapq.heappop(queue)
+            before = b.exported()
+            self.infer(b)
+            if b.error or b.failure:
+                self.broken.add(b)
+            else:
+                self.broken.discard(b)
+            if b.exported() is not before:
+                for u in b.users:
+                    if u not in queued:
+                        queued.add(u)
+                        heapq.heappush(queue, (u.index, u))
+        self.dirty = set()
+        return [Diagnostic(b.start, b.end, d.category, d.message)
+                for b in sorted(self.broken, key=lambda b: b.index) for d in [b.error or b.failure]]
+
+    def types(self):
+        return {b.name: str(b.result.t) for b in self.bindings if b.name is not None and b.ok}
+
+    def result(self):
+        if self.check() or not all(b.ok for b in self.bindings):
+            return None
+        r = self.bindings[-1].result
+        for b in reversed(self.bindings[:-1]):
+            r = TypeResult.of(r.s.compose(b.result.s), r.s.apply(r.t))
+        return r
@@ -0,0 +1,316 @@
+from simpl_ast import *
+
+VISIT, CHECK, BIND, UNBIND, EXIT = range(5)
+ARITH = (Add, Sub, Mul, Div, Mod)
+COMPARE = (Less, LessEq, Greater, GreaterEq)
+LOGIC = (AndAlso, OrElse)
+
+
+class Solution(Substitution):
+    def __init__(self):
+        self.links = {}
+
+    def find(self, t):
+        links = self.links
+        if type(t) is not TypeVar or t not in links:
+            return t
+        path = []
+        while type(t) is TypeVar and t in links:
+            path.append(t)
+            t = links[t]
+        for a in path[:-1]:
+            links[a] = t
+        return t
+
+    def occurs(self, a, t):
+        stack = [t]
+        while stack:
+            t = self.find(stack.pop())
+            if t is a:
+                return True
+            if isinstance(t, (ArrowType, PairType)):
+                stack.append(t.t1)
+                stack.append(t.t2)
+            elif isinstance(t, (ListType, RefType)):
+                stack.append(t.t)
+        return False
+
+    def bind(self, a, t):
+        if type(t) is not TypeVar and self.occurs(a, t):
+            raise TypeCircularityError()
+        self.links[a] = t
+
+    def unify(self, t1, t2):
+        stack = [(t1, t2)]
+        while stack:
+            a, b = stack.pop()
+            a, b = self.find(a), self.find(b)
+            if a is b:
+                continue
+            if isinstance(a, TypeVar):
+                self.bind(a, b)
+            elif isinstance(b, TypeVar):
+                self.bind(b, a)
+            elif type(a) is not type(b):
+                raise TypeMismatchError()
+            elif isinstance(a, (ArrowType, PairType)):
+                stack.append((a.t2, b.t2))
+                stack.append((a.t1, b.t1))
+            elif isinstance(a, (ListType, RefType)):
+                stack.append((a.t, b.t))
+
+    def equality(self, t):
+        stack = [t]
+        while stack:
+            t = self.find(stack.pop())
+            if isinstance(t, TypeVar):
+                if not t.equality_type:
+                    return False
+            elif isinstance(t, (ArrowType, UnitType)):
+                return False
+            elif isinstance(t, PairType):
+                stack.append(t.t1)
+                stack.append(t.t2)
+            elif isinstance(t, ListType):
+                stack.append(t.t)
+        return True
+
+    def apply(self, t):
+        if not self.links:
+            return t
+        out, stack = {}, [t]
+        while stack:
+            u = stack[-1]
+            if id(u) in out:
+                stack.pop()
+            elif isinstance(u, TypeVar):
+                v = self.links.get(u)
+                if v is None:
+                    out[id(u)] = u
+                    stack.pop()
+                elif id(v) in out:
+                    out[id(u)] = self.links[u] = out[id(v)]
+                    stack.pop()
+                else:
+                    stack.append(v)
+            elif isinstance(u, (ArrowType, PairType)):
+                if id(u.t1) not in out:
+                    stack.append(u.t1)
+                elif id(u.t2) not in out:
+                    stack.append(u.t2)
+                else:
+                    t1, t2 = out[id(u.t1)], out[id(u.t2)]
+                    out[id(u)] = u if t1 is u.t1 and t2 is u.t2 else type(u)(t1, t2)
+                    stack.pop()
+            elif isinstance(u, (ListType, RefType)):
+                if id(u.t) not in out:
+                    stack.append(u.t)
+                else:
+                    c = out[id(u.t)]
+                    out[id(u)] = u if c is u.t else type(u)(c)
+                    stack.pop()
+            else:
+                out[id(u)] = u
+                stack.pop()
+        return out[id(t)]
+
+
+def rule(cls):
+    for base in cls.__mro__:
+        if base in RULES:
+            RULES[cls] = RULES[base]
+            return RULES[cls]
+    raise TypeError(f"no rule for {cls.__name__}")
+
+
+def lookup(x, types, E):
+    t = types[-1] if types else E.get(x)
+    if t is None:
+        raise TypeError("name")
+    return t.instantiate() if isinstance(t, TypeScheme) else t
+
+
+def infer(program, E):
+    s = Solution()
+    unify = s.unify
+    scope = {}
+    ts = []
+    ops, args = [VISIT], [program]
+    while ops:
+        op, e = ops.pop(), args.pop()
+        if op == VISIT:
+            cls = type(e)
+            if cls is IntegerLiteral:
+                e.type = Type.INT
+            elif cls is BooleanLiteral:
+                e.type = Type.BOOL
+            elif cls is Name:
+                e.type = lookup(e.x, scope.get(e.x), E)
+            elif cls is Unit:
+                e.type = Type.UNIT
+            elif cls is Nil:
+                e.type = ListType(TypeVar(True))
+            else:
+                kind = (RULES.get(cls) or rule(cls))[0]
+                if kind is Let:
+                    ops += (EXIT, UNBIND, VISIT, BIND, VISIT)
+                    args += (e, e.x, e.e2, e.x, e.e1)
+                elif kind is Fn or kind is Rec or kind is Import:
+                    ts.append(e.module().scheme if kind is Import else TypeVar(True))
+                    ops += (EXIT, UNBIND, VISIT, BIND)
+                    args += (e, e.x, e.e, e.x)
+                elif kind is Cond:
+                    ops += (EXIT, VISIT, VISIT, CHECK, VISIT)
+                    args += (e, e.e3, e.e2, e, e.e1)
+                elif kind is Loop:
+                    ops += (EXIT, VISIT, CHECK, VISIT)
+                    args += (e, e.e2, e, e.e1)
+                elif kind is App:
+                    ts.append(TypeVar(False))
+                    ops += (EXIT, VISIT, VISIT)
+                    args += (e, e.r, e.l)
+                elif kind is UnaryExpr:
+                    ops += (EXIT, VISIT)
+                    args += (e, e.e)
+                else:
+                    ops += (EXIT, VISIT, VISIT)
+                    args += (e, e.r, e.l)
+                continue
+            ts.append(e.type)
+        elif op == BIND:
+            scope.setdefault(e, []).append(ts[-1])
+        elif op == UNBIND:
+            scope[e].pop()
+        elif op == CHECK:
+            unify(ts[-1], Type.BOOL)
+        else:
+            ts.append(RULES[type(e)][1](type(e), ts, s))
+            e.type = ts[-1]
+    return TypeResult.of(s, ts.pop())
+
+
+def _arith(cls, ts, s):
+    t2, t1 = ts.pop(), ts.pop()
+    s.unify(t1, Type.INT)
+    s.unify(t2, Type.INT)
+    return Type.INT
+
+
+def _compare(cls, ts, s):
+    _arith(cls, ts, s)
+    return Type.BOOL
+
+
+def _logic(cls, ts, s):
+    t2, t1 = ts.pop(), ts.pop()
+    s.unify(t1, Type.BOOL)
+    s.unify(t2, Type.BOOL)
+    return Type.BOOL
+
+
+def _eq(cls, ts, s):
+    t2, t1 = ts.pop(), ts.pop()
+    s.unify(t1, t2)
+    if not s.equality(t1):
+        raise TypeError("eq" if issubclass(cls, Eq) else "neq")
+    return Type.BOOL
+
+
+def _pair(cls, ts, s):
+    t2, t1 = ts.pop(), ts.pop()
+    return PairType(t1, t2)
+
+
+def _cons(cls, ts, s):
+    t2, t1 = ts.pop(), ts.pop()
+    s.unify(t2, ListType(t1))
+    return t2
+
+
+def _seq(cls, ts, s):
+    t2 = ts.pop()
+    ts.pop()
+    return t2
+
+
+def _assign(cls, ts, s):
+    t2, t1 = ts.pop(), ts.pop()
+    s.unify(t1, RefType(t2))
+    return Type.UNIT
+
+
+def _app(cls, ts, s):
+    t2, t1, alpha = ts.pop(), ts.pop(), ts.pop()
+    s.unify(ArrowType(t2, alpha), t1)
+    return alpha
+
+
+def _neg(cls, ts, s):
+    s.unify(ts.pop(), Type.INT)
+    return Type.INT
+
+
+def _not(cls, ts, s):
+    s.unify(ts.pop(), Type.BOOL)
+    return Type.BOOL
+
+
+def _ref(cls, ts, s):
+    return RefType(ts.pop())
+
+
+def _deref(cls, ts, s):
+    alpha = TypeVar(True)
+    s.unify(ts.pop(), RefType(alpha))
+    return alpha
+
+
+def _group(cls, ts, s):
+    return ts.pop()
+
+
+def _cond(cls, ts, s):
+    t3, t2 = ts.pop(), ts.pop()
+    ts.pop()
+    s.unify(t2, t3)
+    return t2
+
+
+def _loop(cls, ts, s):
+    ts.pop()
+    ts.pop()
+    return Type.UNIT
+
+
+def _let(cls, ts, s):
+    t2 = ts.pop()
+    ts.pop()
+    return t2
+
+
+def _fn(cls, ts, s):
+    t, a = ts.pop(), ts.pop()
+    return ArrowType(a, t)
+
+
+def _rec(cls, ts, s):
+    t, alpha = ts.pop(), ts.pop()
+    s.unify(t, alpha)
+    return t
+
+
+def _import(cls, ts, s):
+    t = ts.pop()
+    ts.pop()
+    return t
+
+
+RULES = {cls: (BinaryExpr, _arith) for cls in ARITH}
+RULES.update({cls: (BinaryExpr, _compare) for cls in COMPARE})
+RULES.update({cls: (BinaryExpr, _logic) for cls in LOGIC})
+RULES.update({Eq: (BinaryExpr, _eq), Neq: (BinaryExpr, _eq), Pair: (BinaryExpr, _pair),
+              Cons: (BinaryExpr, _cons), Seq: (BinaryExpr, _seq), Assign: (BinaryExpr, _assign),
+              Neg: (UnaryExpr, _neg), Not: (UnaryExpr, _not), Ref: (UnaryExpr, _ref),
+              Deref: (UnaryExpr, _deref), Group: (UnaryExpr, _group),
+              App: (App, _app), Cond: (Cond, _cond), Loop: (Loop, _loop), Let: (Let, _let),
+              Fn: (Fn, _fn), Rec: (Rec, _rec), Import: (Import, _import)})
@@ -46,11 +46,10 @@ class ConsValue(Value):
     def __str__(self): return f"list@{self.length()}"
 
     def length(self):
-        if isinstance(self.v2, NilValue):
-            return 1
-        if isinstance(self.v2, ConsValue):
-            return 1 + self.v2.length()
-        return 1
+        n, l = 1, self.v2
+        while isinstance(l, ConsValue):
+            n, l = n + 1, l.v2
+        return n
 
 
 @dataclass
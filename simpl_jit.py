@@ -0,0 +1,232 @@
+import sys
+from simpl_ast import *
+from simpl_escape import Cell
+
+HOT = 50
+
+
+class Unsupported(Exception):
+    pass
+
+
+def _div(a, b):
+    if b == 0:
+        raise RuntimeError("division by zero")
+    return int(a / b)
+
+
+def _mod(a, b):
+    if b == 0:
+        raise RuntimeError("division by zero")
+    return a % b
+
+
+ARITH = {Add: "+", Sub: "-", Mul: "*"}
+COMPARE = {Less: "<", LessEq: "<=", Greater: ">", GreaterEq: ">="}
+BOXES = {int: IntValue, bool: BoolValue}
+
+
+class LoopCompiler:
+    def __init__(self, s):
+        self.s = s
+        self.params = {}
+        self.cells = {}
+
+    def name(self, x):
+        if x not in self.params:
+            v = self.s.E.get(x)
+            if type(v) not in (IntValue, BoolValue, RefValue, Cell):
+                raise Unsupported(x)
+            self.params[x] = (f"v{len(self.params)}", type(v))
+        return self.params[x]
+
+    def cell(self, e):
+        while isinstance(e, Group):
+            e = e.e
+        if not isinstance(e, Name):
+            raise Unsupported(e)
+        var, cls = self.name(e.x)
+        if cls is not RefValue and cls is not Cell:
+            raise Unsupported(e)
+        if e.x not in self.cells:
+            v = self.s.E.get(e.x)
+            v = v.v if cls is Cell else self.s.M.get(v.p)
+            kind = {IntValue: int, BoolValue: bool}.get(type(v))
+            if kind is None:
+                raise Unsupported(e)
+            slot = f"{var}.v" if cls is Cell else f"M[{var}]"
+            self.cells[e.x] = [f"r{len(self.cells)}", slot, kind, False]
+        return self.cells[e.x]
+
+    def expr(self, e):
+        if isinstance(e, Group):
+            return self.expr(e.e)
+        if isinstance(e, IntegerLiteral):
+            return repr(e.n), int
+        if isinstance(e, BooleanLiteral):
+            return repr(e.b), bool
+        if isinstance(e, Name):
+            var, cls = self.name(e.x)
+            if cls is RefValue or cls is Cell:
+                raise Unsupported(e)
+            return var, int if cls is IntValue else bool
+        if isinstance(e, Deref):
+            local, _, kind, _ = self.cell(e.e)
+            return local, kind
+        if type(e) in ARITH or type(e) in COMPARE:
+            l, r = self.operand(e.l, int), self.operand(e.r, int)
+            if type(e) in ARITH:
+                return f"({l} {ARITH[type(e)]} {r})", int
+            return f"({l} {COMPARE[type(e)]} {r})", bool
+        if isinstance(e, (Div, Mod)):
+            fn = "_div" if isinstance(e, Div) else "_mod"
+            return f"{fn}({self.operand(e.l, int)}, {self.operand(e.r, int)})", int
+        if isinstance(e, (Eq, Neq)):
+            l, kind = self.expr(e.l)
+            r = self.operand(e.r, kind)
+            return f"({l} {'==' if isinstance(e, Eq) else '!='} {r})", bool
+        if isinstance(e, (AndAlso, OrElse)):
+            op = "and" if isinstance(e, AndAlso) else "or"
+            return f"({self.operand(e.l, bool)} {op} {self.operand(e.r, bool)})", bool
+        if isinstance(e, Not):
+            return f"(not {self.operand(e.e, bool)})", bool
+        if isinstance(e, Neg):
+            return f"(-{self.operand(e.e, int)})", int
+        if isinstance(e, Cond):
+            c = self.operand(e.e1, bool)
+            a, kind = self.expr(e.e2)
+            b = self.operand(e.e3, kind)
+            return f"({a} if {c} else {b})", kind
+        raise Unsupported(e)
+
+    def operand(self, e, kind):
+        code, k = self.expr(e)
+        if k is not kind:
+            raise Unsupported(e)
+        return code
+
+    def stmt(self, e, indent):
+        pad = "    " * indent
+        if isinstance(e, Group):
+            return self.stmt(e.e, indent)
+        if isinstance(e, Seq):
+            return self.stmt(e.l, indent) + self.stmt(e.r, indent)
+        if isinstance(e, Unit):
+            return [pad + "pass"]
+        if isinstance(e, Assign):
+            c = self.cell(e.l)
+            code = self.operand(e.r, c[2])
+            c[3] = True
+            return [f"{pad}{c[0]} = {code}"]
+        if isinstance(e, Cond):
+            return ([f"{pad}if {self.operand(e.e1, bool)}:"] + self.stmt(e.e2, indent + 1) +
+                    [f"{pad}else:"] + self.stmt(e.e3, indent + 1))
+        if isinstance(e, Loop):
+            return [f"{pad}while {self.operand(e.e1, bool)}:"] + self.stmt(e.e2, indent + 1)
+        return [pad + self.expr(e)[0]]
+
+    def compile(self, loop):
+        body = self.stmt(Loop(loop.e1, loop.e2), 2)
+        params = [var for var, _ in self.params.values()]
+        lines = [f"def loop(M, {', '.join(params)}):"]
+        for local, slot, kind, _ in self.cells.values():
+            lines.append(f"    {local} = {slot}.{'n' if kind is int else 'b'}")
+        lines.append("    try:")
+        lines.extend(body)
+        lines.append("    finally:")
+        lines.extend([f"        {slot} = {BOXES[kind].__name__}({local})"
+                      for local, slot, kind, assigned in self.cells.values() if assigned]
+                     or ["        pass"])
+        source = "\n".join(lines)
+        scope = {"_div": _div, "_mod": _mod, "IntValue": IntValue, "BoolValue": BoolValue}
+        exec(compile(source, f"<loop {id(loop):x}>", "exec"), scope)
+        return CompiledLoop(scope["loop"], source, list(self.params.items()),
+                            {x: c[2] for x, c in self.cells.items()})
+
+
+class CompiledLoop:
+    def __init__(self, fn, source, params, cells):
+        self.fn = fn
+        self.source = source
+        self.params = params
+        self.cells = cells
+
+    def enter(self, s):
+        args = [s.M.map]
+        ptrs = set()
+        for x, (_, cls) in self.params:
+            v = s.E.get(x)
+            if type(v) is not cls:
+                return None
+            if cls is RefValue:
+                kind = self.cells.get(x)
+                if kind is not None and type(s.M.get(v.p)) is not BOXES[kind]:
+                    return None
+                if v.p in ptrs:
+                    return None
+                ptrs.add(v.p)
+                args.append(v.p)
+            elif cls is Cell:
+                kind = self.cells.get(x)
+                if kind is not None and type(v.v) is not BOXES[kind]:
+                    return None
+                args.append(v)
+            else:
+                args.append(v.n if cls is IntValue else v.b)
+        return args
+
+
+class HotLoop(Loop):
+    def eval(self, s):
+        code = getattr(self, "code", None)
+        if code:
+            args = code.enter(s)
+            if args is not None:
+                code.fn(*args)
+                return Value.UNIT
+        count = getattr(self, "count", 0)
+        while self.e1.eval_bool(s):
+            self.e2.eval(s)
+            count += 1
+            if count == HOT and code is None:
+                self.count = count
+                code = self.tier_up(s)
+                args = code.enter(s) if code else None
+                if args is not None:
+                    code.fn(*args)
+                    return Value.UNIT
+        self.count = count
+        return Value.UNIT
+
+    def tier_up(self, s):
+        try:
+            self.code = LoopCompiler(s).compile(self)
+            self.log("tier-up", self.count)
+        except Unsupported as e:
+            self.code = False
+            self.log("unsupported", str(e))
+        return self.code
+
+    def log(self, kind, detail):
+        if self.events is not None:
+            self.events.append((kind, str(self), detail))
+
+
+def _hot(e, events):
+    if type(e) is Loop:
+        n = HotLoop(e.e1, e.e2)
+        n.events = events
+        if hasattr(e, "type"):
+            n.type = e.type
+        return n
+    return e
+
+
+def tier(e, events=None):
+    return rebuild(e, _hot, context=events)
+
+
+def report(events, out=sys.stderr):
+    for kind, loop, detail in events:
+        if kind in ("tier-up", "unsupported"):
+            print(f"jit: {kind} {loop} ({detail})", file=out)
@@ -1,3 +1,4 @@
+from functools import cache
 from simpl_interpreter import *
 from simpl_ast import *
 from simpl_typing import *
@@ -38,6 +39,93 @@ class iszero(FunValue):
         super().__init__(None, "x", Eq(Name("x"), IntegerLiteral(0)))
 
 
+class Native(FunValue):
+    def __init__(self, name, arity, fn, args=()):
+        super().__init__(None, "x", Name("x"))
+        self.name = name
+        self.arity = arity
+        self.fn = fn
+        self.args = args
+
+    def call(self, v, s):
+        args = self.args + (v,)
+        if len(args) < self.arity:
+            return Native(self.name, self.arity, self.fn, args)
+        return self.fn(s, *args)
+
+
+def items(l):
+    while isinstance(l, ConsValue):
+        yield l.v1
+        l = l.v2
+
+
+def to_list(vs, l=Value.NIL):
+    for v in reversed(vs):
+        l = ConsValue(v, l)
+    return l
+
+
+def _length(s, l):
+    n = 0
+    for _ in items(l):
+        n += 1
+    return IntValue(n)
+
+
+def _append(s, l1, l2): return to_list(list(items(l1)), l2)
+def _map(s, f, l): return to_list([apply(f, v, s) for v in items(l)])
+
+
+def _foldl(s, f, z, l):
+    for v in items(l):
+        z = apply(apply(f, z, s), v, s)
+    return z
+
+
+def _rev(s, l):
+    r = Value.NIL
+    for v in items(l):
+        r = ConsValue(v, r)
+    return r
+
+
+def _nth(s, l, n):
+    i = n.n
+    if i >= 0:
+        for v in items(l):
+            if i == 0:
+                return v
+            i -= 1
+    raise RuntimeError("nth")
+
+
+NATIVES = {
+    "length": (1, _length),
+    "append": (2, _append),
+    "map": (2, _map),
+    "foldl": (3, _foldl),
+    "rev": (1, _rev),
+    "nth": (2, _nth),
+}
+
+
+def native_types():
+    a = TypeVar.prelude(True)
+    b = TypeVar.prelude(True)
+    la, lb = ListType(a), ListType(b)
+    return {
+        "length": TypeScheme((a,), ArrowType(la, Type.INT)),
+        "append": TypeScheme((a,), ArrowType(la, ArrowType(la, la))),
+        "map": TypeScheme((a, b), ArrowType(ArrowType(a, b), ArrowType(la, lb))),
+        "foldl": TypeScheme((a, b), ArrowType(ArrowType(b, ArrowType(a, b)),
+                                               ArrowType(b, ArrowType(la, b)))),
+        "rev": TypeScheme((a,), ArrowType(la, la)),
+        "nth": TypeScheme((a,), ArrowType(la, ArrowType(Type.INT, a))),
+    }
+
+
+@cache
 def initial_runtime_env():
     E = Env.empty()
     E = Env(E, "fst", fst())
@@ -47,13 +135,16 @@ def initial_runtime_env():
     E = Env(E, "succ", succ())
     E = Env(E, "pred", pred())
     E = Env(E, "iszero", iszero())
+    for x, (arity, fn) in NATIVES.items():
+        E = Env(E, x, Native(x, arity, fn))
     return E
 
 
+@cache
 def initial_type_env():
     E = TypeEnv.empty()
-    a = TypeVar(True)
-    b = TypeVar(True)
+    a = TypeVar.prelude(True)
+    b = TypeVar.prelude(True)
     E = ExtendedTypeEnv(E, "fst", ArrowType(PairType(a, b), a))
     E = ExtendedTypeEnv(E, "snd", ArrowType(PairType(a, b), b))
     E = ExtendedTypeEnv(E, "hd", ArrowType(ListType(a), a))
@@ -61,4 +152,6 @@ def initial_type_env():
     E = ExtendedTypeEnv(E, "iszero", ArrowType(Type.INT, Type.BOOL))
     E = ExtendedTypeEnv(E, "pred", ArrowType(Type.INT, Type.INT))
     E = ExtendedTypeEnv(E, "succ", ArrowType(Type.INT, Type.INT))
+    for x, t in native_types().items():
+        E = ExtendedTypeEnv(E, x, t)
     return E
@@ -0,0 +1,136 @@
+import sys
+from dataclasses import dataclass
+from itertools import count
+from simpl_ast import *
+from simpl_escape import LocalDeref, LocalAssign
+from simpl_memo import clone
+
+frames = count(1)
+
+
+@dataclass
+class Hoisted(Group):
+    frame: str
+    i: int
+
+    def eval(self, s):
+        slots = s.E.get(self.frame)
+        v = slots[self.i]
+        if v is None:
+            v = slots[self.i] = self.e.eval(s)
+        return v
+
+    def eval_int(self, s): return self.eval(s).n
+    def eval_bool(self, s): return self.eval(s).b
+
+
+@dataclass
+class HoistedLoop(Loop):
+    frame: str
+    size: int
+
+    def eval(self, s):
+        s = State.of(Env(s.E, self.frame, [None] * self.size), s.M, s.p)
+        while self.e1.eval_bool(s):
+            self.e2.eval(s)
+        return Value.UNIT
+
+
+def _trivial(e):
+    while isinstance(e, Group) and not isinstance(e, Hoisted):
+        e = e.e
+    return isinstance(e, (IntegerLiteral, BooleanLiteral, Nil, Unit, Name, Hoisted))
+
+
+class LoopHoister:
+    def __init__(self, loop, events=None):
+        self.loop = loop
+        self.events = events
+        self.name = str(loop) if events is not None else None
+        self.frame = f"%loop{next(frames)}"
+        self.size = 0
+        self.calls = False
+        self.stores = False
+        self.assigned = set()
+        stack = [loop.e1, loop.e2]
+        while stack:
+            e = stack.pop()
+            if isinstance(e, App):
+                self.calls = True
+            elif isinstance(e, LocalAssign):
+                self.assigned.add(e.l.x)
+            elif isinstance(e, Assign):
+                self.stores = True
+            stack.extend(e.children())
+
+    def readable(self, e):
+        if self.calls:
+            return False
+        if isinstance(e, LocalDeref):
+            return e.e.x not in self.assigned
+        return not self.stores
+
+    def visit(self, e, bound):
+        if isinstance(e, (IntegerLiteral, BooleanLiteral, Nil, Unit)):
+            return True
+        if isinstance(e, Name):
+            return e.x not in bound
+        if isinstance(e, (Fn, Rec, Import)):
+            return False
+        if isinstance(e, Let):
+            self.child(e, "e1", bound)
+            self.child(e, "e2", bound | {e.x})
+            return False
+        names = [k for k, v in vars(e).items() if isinstance(v, Expr)]
+        flags = [self.visit(getattr(e, k), bound) for k in names]
+        if all(flags) and self.pure(e):
+            return True
+        for k, ok in zip(names, flags):
+            if ok:
+                self.hoist(e, k)
+        return False
+
+    def child(self, e, k, bound):
+        if self.visit(getattr(e, k), bound):
+            self.hoist(e, k)
+
+    def pure(self, e):
+        if isinstance(e, Deref):
+            return self.readable(e)
+        if isinstance(e, (App, Assign, Ref, Loop)):
+            return False
+        return isinstance(e, (BinaryExpr, UnaryExpr, Cond))
+
+    def hoist(self, e, k):
+        v = getattr(e, k)
+        if _trivial(v):
+            return
+        n = Hoisted(v, self.frame, self.size)
+        if hasattr(v, "type"):
+            n.type = v.type
+        setattr(e, k, n)
+        self.size += 1
+        if self.events is not None:
+            self.events.append(("hoisted", self.name, str(v)))
+
+    def run(self):
+        loop = self.loop
+        self.loop = clone(loop)
+        self.child(self.loop, "e1", frozenset())
+        self.child(self.loop, "e2", frozenset())
+        if not self.size:
+            return loop
+        n = HoistedLoop(self.loop.e1, self.loop.e2, self.frame, self.size)
+        if hasattr(loop, "type"):
+            n.type = loop.type
+        return n
+
+
+def hoist(program, events=None):
+    return rebuild(program, lambda e, c: LoopHoister(e, events).run() if type(e) is Loop else e)
+
+
+def report(events, out=sys.stderr):
+    for kind, loop, e in events:
+        if kind == "hoisted":
+            print(f"licm: hoisted {e} out of {loop}", file=out)
@@ -0,0 +1,362 @@
+import io
+import os
+import pickle
+import zlib
+from simpl_ast import *
+from simpl_lib import fst, snd, hd, tl, Native
+
+INTERVAL = 100000
+MAGIC = b"SPLK2"
+OBJECT = {}
+
+
+def _div(a, b): return IntValue(int(a.n / b.n))
+def _mod(a, b): return IntValue(a.n % b.n)
+
+
+COMBINE = {
+    Add: lambda a, b: IntValue(a.n + b.n),
+    Sub: lambda a, b: IntValue(a.n - b.n),
+    Mul: lambda a, b: IntValue(a.n * b.n),
+    Div: _div,
+    Mod: _mod,
+    Eq: lambda a, b: BoolValue(a == b),
+    Neq: lambda a, b: BoolValue(not (a == b)),
+    Less: lambda a, b: BoolValue(a.n < b.n),
+    LessEq: lambda a, b: BoolValue(a.n <= b.n),
+    Greater: lambda a, b: BoolValue(a.n > b.n),
+    GreaterEq: lambda a, b: BoolValue(a.n >= b.n),
+    Pair: PairValue,
+    Cons: ConsValue,
+}
+
+
+class Machine:
+    FIELDS = ("e", "v", "E", "M", "p", "K", "steps")
+
+    def __init__(self, program, s):
+        self.e = program
+        self.v = None
+        self.E = s.E
+        self.M = s.M
+        self.p = s.p
+        self.K = []
+        self.steps = 0
+
+    def value(self, v):
+        self.e = None
+        self.v = v
+
+    def push(self, *frame):
+        self.K.append(frame)
+
+    def run(self, checkpoint=None, interval=INTERVAL):
+        K = self.K
+        handlers = HANDLERS
+        next_save = self.steps + interval
+        while True:
+            e = self.e
+            if e is not None:
+                h = handlers.get(type(e))
+                if h is None:
+                    h = handlers[type(e)] = _handler(type(e))
+                h(self, e)
+            elif K:
+                frame = K.pop()
+                frame[0](self, *frame[1:])
+            else:
+                return self.v
+            self.steps += 1
+            if checkpoint is not None and self.steps >= next_save:
+                self.save(checkpoint)
+                next_save += interval
+
+    def save(self, path):
+        state = tuple(getattr(self, f) for f in self.FIELDS)
+        buf = io.BytesIO()
+        Writer(buf).write(state)
+        data = zlib.compress(buf.getvalue(), 1)
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(MAGIC)
+            f.write(data)
+        os.replace(tmp, path)
+
+    @staticmethod
+    def load(path):
+        with open(path, "rb") as f:
+            data = f.read()
+        if not data.startswith(MAGIC):
+            raise ValueError(f"{path}: not a SimPL checkpoint")
+        m = Machine.__new__(Machine)
+        for f, x in zip(Machine.FIELDS, Reader(io.BytesIO(zlib.decompress(data[len(MAGIC):]))).read()):
+            setattr(m, f, x)
+        return m
+
+
+def _shell(t):
+    return t.__new__(t)
+
+
+class Writer(pickle.Pickler):
+    def __init__(self, f):
+        super().__init__(f, pickle.HIGHEST_PROTOCOL)
+        self.queue = []
+
+    def reducer_override(self, x):
+        t = type(x)
+        k = OBJECT.get(t)
+        if k is None:
+            k = OBJECT[t] = t.__module__.startswith("simpl") and t.__dictoffset__ != 0 and t is not type
+        if not k:
+            return NotImplemented
+        self.queue.append(x)
+        return _shell, (t,)
+
+    def write(self, root):
+        self.dump(root)
+        done = 0
+        while done < len(self.queue):
+            batch = self.queue[done:]
+            done = len(self.queue)
+            self.dump([vars(x) for x in batch])
+
+
+class Reader(pickle.Unpickler):
+    def __init__(self, f):
+        super().__init__(f)
+        self.objs = []
+
+    def find_class(self, module, name):
+        if module == __name__ and name == "_shell":
+            return self.shell
+        return super().find_class(module, name)
+
+    def shell(self, t):
+        x = t.__new__(t)
+        self.objs.append(x)
+        return x
+
+    def read(self):
+        root = self.load()
+        n = 0
+        while n < len(self.objs):
+            for d in self.load():
+                vars(self.objs[n]).update(d)
+                n += 1
+        return root
+
+
+def _handler(cls):
+    for base in cls.__mro__:
+        if base in HANDLERS:
+            return HANDLERS[base]
+    raise RuntimeError(f"no machine rule for {cls.__name__}")
+
+
+def ev_literal(m, e): m.value(e.eval(None))
+def ev_fn(m, e): m.value(FunValue(m.E, e.x, e.e))
+
+
+def ev_name(m, e):
+    v = m.E.get(e.x)
+    if v is None:
+        raise RuntimeError("name")
+    if isinstance(v, RecValue):
+        m.e = Rec(v.x, v.e)
+        m.E = v.E
+    else:
+        m.value(v)
+
+
+def ev_rec(m, e):
+    m.E = Env(m.E, e.x, RecValue(m.E, e.x, e.e))
+    m.e = e.e
+
+
+def ev_binary(m, e):
+    m.push(k_left, e, m.E)
+    m.e = e.l
+
+
+def k_left(m, e, E):
+    m.push(k_right, e, m.v)
+    m.e = e.r
+    m.E = E
+
+
+def k_right(m, e, v1):
+    m.value(_combine(type(e))(v1, m.v))
+
+
+def ev_divide(m, e):
+    m.push(k_divisor, e, m.E)
+    m.e = e.r
+
+
+def k_divisor(m, e, E):
+    if m.v.n == 0:
+        raise RuntimeError("division by zero")
+    m.push(k_dividend, e, m.v)
+    m.e = e.l
+    m.E = E
+
+
+def k_dividend(m, e, v2):
+    m.value(_combine(type(e))(m.v, v2))
+
+
+def ev_short(m, e):
+    m.push(k_short, e, m.E)
+    m.e = e.l
+
+
+def k_short(m, e, E):
+    if m.v.b == isinstance(e, OrElse):
+        m.value(BoolValue(m.v.b))
+    else:
+        m.e = e.r
+        m.E = E
+
+
+def ev_seq(m, e):
+    m.push(k_seq, e, m.E)
+    m.e = e.l
+
+
+def k_seq(m, e, E):
+    m.e = e.r
+    m.E = E
+
+
+def ev_assign(m, e):
+    m.push(k_target, e, m.E)
+    m.e = e.l
+
+
+def k_target(m, e, E):
+    m.push(k_assign, m.v)
+    m.e = e.r
+    m.E = E
+
+
+def k_assign(m, ptr):
+    m.M.put(ptr.p, m.v)
+    m.value(Value.UNIT)
+
+
+def ev_app(m, e):
+    m.push(k_operator, e, m.E)
+    m.e = e.l
+
+
+def k_operator(m, e, E):
+    m.push(k_apply, m.v)
+    m.e = e.r
+    m.E = E
+
+
+def k_apply(m, f):
+    if isinstance(f, (fst, snd, hd, tl, Native)):
+        m.value(apply(f, m.v, State.of(m.E, m.M, m.p)))
+    else:
+        m.e = f.e
+        m.E = Env(f.E, f.x, m.v)
+
+
+def ev_unary(m, e):
+    m.push(k_unary, e)
+    m.e = e.e
+
+
+def k_unary(m, e):
+    v = m.v
+    if isinstance(e, Neg):
+        m.value(IntValue(-v.n))
+    elif isinstance(e, Not):
+        m.value(BoolValue(not v.b))
+    else:
+        v = m.M.get(v.p)
+        if v is None:
+            raise RuntimeError("deref")
+        m.value(v)
+
+
+def ev_ref(m, e):
+    ptr = m.p.get()
+    m.p.set(ptr + 1)
+    m.push(k_ref, ptr)
+    m.e = e.e
+
+
+def k_ref(m, ptr):
+    m.M.put(ptr, m.v)
+    m.value(RefValue(ptr))
+
+
+def ev_group(m, e): m.e = e.e
+
+
+def ev_cond(m, e):
+    m.push(k_cond, e, m.E)
+    m.e = e.e1
+
+
+def k_cond(m, e, E):
+    m.e = e.e2 if m.v.b else e.e3
+    m.E = E
+
+
+def ev_loop(m, e):
+    m.push(k_loop, e, m.E)
+    m.e = e.e1
+
+
+def k_loop(m, e, E):
+    if m.v.b:
+        m.push(k_body, e, E)
+        m.e = e.e2
+        m.E = E
+    else:
+        m.value(Value.UNIT)
+
+
+def k_body(m, e, E):
+    m.E = E
+    ev_loop(m, e)
+
+
+def ev_import(m, e):
+    v = e.module().eval(State.of(m.E, m.M, m.p))
+    m.E = Env(m.E, e.x, v)
+    m.e = e.e
+
+
+def ev_let(m, e):
+    m.push(k_let, e, m.E)
+    m.e = e.e1
+
+
+def k_let(m, e, E):
+    m.e = e.e2
+    m.E = Env(E, e.x, m.v)
+
+
+def _combine(cls):
+    f = COMBINE.get(cls)
+    if f is None:
+        f = COMBINE[cls] = next(COMBINE[base] for base in cls.__mro__ if base in COMBINE)
+    return f
+
+
+HANDLERS = {
+    IntegerLiteral: ev_literal, BooleanLiteral: ev_literal, Unit: ev_literal, Nil: ev_literal,
+    Name: ev_name, Fn: ev_fn, Rec: ev_rec,
+    AndAlso: ev_short, OrElse: ev_short, Seq: ev_seq,
+    Div: ev_divide, Mod: ev_divide,
+    App: ev_app, Assign: ev_assign,
+    Neg: ev_unary, Not: ev_unary, Deref: ev_unary, Ref: ev_ref, Group: ev_group,
+    Cond: ev_cond, Loop: ev_loop, Let: ev_let, Import: ev_import,
+}
+for _cls in COMBINE:
+    HANDLERS.setdefault(_cls, ev_binary)
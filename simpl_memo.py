@@ -0,0 +1,179 @@
+from dataclasses import dataclass, is_dataclass
+from itertools import count
+from simpl_ast import *
+from simpl_lib import initial_type_env
+from simpl_specialize import resolve
+
+MIN_SIZE = 4
+MAX_KEYS = 1 << 16
+
+
+class MemoTable:
+    def __init__(self, size=MAX_KEYS):
+        self.size = size
+        self.keys = {}
+        self.serial = count()
+        self.principal = {}
+
+    def trim(self):
+        if len(self.keys) > self.size:
+            self.keys.clear()
+            self.principal.clear()
+
+
+@dataclass
+class Memo(Group):
+    key: int
+    principal: dict
+
+    def typecheck(self, E):
+        entry = self.principal.get(self.key)
+        if entry is None:
+            r = self.e.typecheck(initial_type_env())
+            resolve(self.e, r.s)
+            t = r.s.apply(r.t)
+            entry = self.principal[self.key] = (TypeScheme(tuple(type_vars(t)), t), self.e)
+        return self.typed(Identity(), entry[0].instantiate())
+
+
+def type_vars(t, acc=None):
+    acc = [] if acc is None else acc
+    if isinstance(t, TypeVar):
+        if t not in acc:
+            acc.append(t)
+    elif is_dataclass(t):
+        for v in vars(t).values():
+            if isinstance(v, Type):
+                type_vars(v, acc)
+    return acc
+
+
+def ground(t):
+    return isinstance(t, TypeScheme) or not type_vars(t)
+
+
+def analyze(program, table):
+    keys, serial = table.keys, table.serial
+    ids = {}
+    reps = {}
+    counts = {}
+    binders = set()
+    order, stack = [], [program]
+    while stack:
+        e = stack.pop()
+        order.append(e)
+        stack.extend(e.children())
+    for e in reversed(order):
+        cls = type(e)
+        if isinstance(e, BinaryExpr):
+            key = (cls, ids[id(e.l)], ids[id(e.r)])
+        elif isinstance(e, UnaryExpr):
+            key = (cls, ids[id(e.e)])
+        elif cls is Name:
+            key = (cls, e.x)
+        elif cls is IntegerLiteral:
+            key = (cls, e.n)
+        elif cls is BooleanLiteral:
+            key = (cls, e.b)
+        elif cls is Cond:
+            key = (cls, ids[id(e.e1)], ids[id(e.e2)], ids[id(e.e3)])
+        elif cls is Let:
+            binders.add(e.x)
+            key = (cls, e.x, ids[id(e.e1)], ids[id(e.e2)])
+        elif cls is Fn or cls is Rec:
+            binders.add(e.x)
+            key = (cls, e.x, ids[id(e.e)])
+        elif cls is Import:
+            binders.add(e.x)
+            key = (cls, e.x, e.path, e.module().interface, ids[id(e.e)])
+        elif cls is Loop:
+            key = (cls, ids[id(e.e1)], ids[id(e.e2)])
+        else:
+            key = (cls,)
+        k = keys.get(key)
+        if k is None:
+            k = keys.setdefault(key, next(serial))
+        n = counts.get(k)
+        if n is None:
+            reps[k] = e
+            counts[k] = 1
+        else:
+            counts[k] = n + 1
+        ids[id(e)] = k
+    return ids, reps, counts, binders
+
+
+def free_vars(root, ids, cache):
+    order, stack = [], [root]
+    while stack:
+        e = stack.pop()
+        if ids[id(e)] not in cache:
+            order.append(e)
+            stack.extend(e.children())
+    for e in reversed(order):
+        k = ids[id(e)]
+        if k in cache:
+            continue
+        fv = frozenset().union(*(cache[ids[id(c)]][0] for c in e.children()))
+        if isinstance(e, Name):
+            fv = frozenset((e.x,))
+        elif isinstance(e, (Fn, Rec, Import)):
+            fv = fv - {e.x}
+        elif isinstance(e, Let):
+            fv = cache[ids[id(e.e1)]][0] | (cache[ids[id(e.e2)]][0] - {e.x})
+        cache[k] = (fv, 1 + sum(cache[ids[id(c)]][1] for c in e.children()))
+    return cache[ids[id(root)]]
+
+
+def memoize(program, table):
+    table.trim()
+    ids, reps, counts, binders = analyze(program, table)
+    E = initial_type_env()
+    cache = {}
+    closed = {}
+
+    def eligible(k):
+        if k not in closed:
+            fv, size = free_vars(reps[k], ids, cache)
+            closed[k] = size >= MIN_SIZE and all(
+                x not in binders and E.get(x) is not None and ground(E.get(x)) for x in fv)
+        return closed[k]
+
+    sites = []
+    stack = [program]
+    while stack:
+        e = stack.pop()
+        for name, v in vars(e).items():
+            if isinstance(v, Expr):
+                k = ids[id(v)]
+                if counts[k] > 1 and eligible(k):
+                    setattr(e, name, Memo(v, k, table.principal))
+                    sites.append((e, name))
+                else:
+                    stack.append(v)
+    return sites
+
+
+def strip(sites):
+    for e, name in sites:
+        m = getattr(e, name)
+        setattr(e, name, clone(m.principal[m.key][1]))
+
+
+def clone(e):
+    root = object.__new__(type(e))
+    vars(root).update(vars(e))
+    stack = [root]
+    while stack:
+        d = vars(stack.pop())
+        for name, v in d.items():
+            if isinstance(v, Expr):
+                c = d[name] = object.__new__(type(v))
+                vars(c).update(vars(v))
+                stack.append(c)
+    return root
+
+
+def unwrap(sites):
+    for e, name in sites:
+        setattr(e, name, getattr(e, name).e)
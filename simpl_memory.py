@@ -0,0 +1,206 @@
+import sys
+import json
+import threading
+import tracemalloc
+from contextlib import contextmanager
+from functools import wraps
+from simpl_interpreter import *
+from simpl_escape import Cell
+
+patched = []
+users = 0
+lock = threading.Lock()
+CELL = 3 * 8 + sys.getsizeof(1)
+
+
+class MemoryLimitError(Exception):
+    pass
+
+
+class Kind:
+    def __init__(self, size):
+        self.size = size
+        self.count = 0
+        self.live = 0
+        self.peak = 0
+
+    def as_dict(self):
+        return {"count": self.count, "live": self.live, "peak": self.peak, "bytes": self.size}
+
+
+class Local(threading.local):
+    budget = None
+
+
+local = Local()
+
+
+class Budget:
+    def __init__(self, limit):
+        self.limit = limit
+        self.live = 0
+
+    def add(self, size):
+        self.live += size
+        if self.live > self.limit:
+            raise MemoryLimitError(f"{self.live} bytes exceeds budget of {self.limit}")
+
+
+class Stats:
+    def __init__(self):
+        self.kinds = {}
+        self.cells = Kind(CELL)
+        self.live = 0
+        self.peak = 0
+        self.phases = {}
+
+    def alloc(self, o):
+        k = self.kinds.get(type(o))
+        if k is None:
+            k = self.kinds[type(o)] = Kind(sys.getsizeof(o) + 8 * (len(vars(o)) + 2))
+        self.add(k)
+
+    def add(self, k):
+        k.count += 1
+        k.live += 1
+        k.peak = max(k.peak, k.live)
+        self.live += k.size
+        self.peak = max(self.peak, self.live)
+        if local.budget is not None:
+            local.budget.add(k.size)
+
+    def free(self, o):
+        k = self.kinds.get(type(o))
+        if k is not None and k.live > 0:
+            k.live -= 1
+            self.live -= k.size
+            if local.budget is not None:
+                local.budget.live -= k.size
+
+    def as_dict(self):
+        groups = {"frames": {}, "values": {}, "closures": {}}
+        for c, k in self.kinds.items():
+            group = "frames" if c is Env else "closures" if issubclass(c, (FunValue, RecValue)) else "values"
+            groups[group][c.__name__] = k.as_dict()
+        return {
+            "live": self.live,
+            "peak": self.peak,
+            **groups,
+            "cells": self.cells.as_dict(),
+            "phases": self.phases,
+        }
+
+
+stats = Stats()
+
+
+def count_init(original):
+    def __init__(self, *args, **kwargs):
+        original(self, *args, **kwargs)
+        stats.alloc(self)
+    return __init__
+
+
+def count_del(self):
+    stats.free(self)
+
+
+def count_put(original):
+    def put(self, p, v):
+        if p not in self.map:
+            stats.add(stats.cells)
+        original(self, p, v)
+    return put
+
+
+def enable(trace=False):
+    global users
+    with lock:
+        users += 1
+        if users == 1:
+            patch()
+        if trace and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            patched.append((tracemalloc, "stop", None))
+
+
+def patch():
+    global stats
+    stats = Stats()
+    for cls in (Env, IntValue, BoolValue, PairValue, ConsValue, RefValue, FunValue, RecValue, Cell):
+        original = cls.__dict__["__init__"]
+        patched.append((cls, "__init__", original))
+        setattr(cls, "__init__", wraps(original)(count_init(original)))
+        patched.append((cls, "__del__", None))
+        cls.__del__ = count_del
+    original = Mem.__dict__["put"]
+    patched.append((Mem, "put", original))
+    Mem.put = wraps(original)(count_put(original))
+
+
+def disable():
+    global users
+    with lock:
+        users = max(users - 1, 0)
+        if users == 0:
+            unpatch()
+
+
+def unpatch():
+    while patched:
+        cls, name, original = patched.pop()
+        if cls is tracemalloc:
+            tracemalloc.stop()
+        elif original is None:
+            delattr(cls, name)
+        else:
+            setattr(cls, name, original)
+
+
+@contextmanager
+def limit(budget):
+    enable()
+    saved = local.budget
+    local.budget = Budget(budget)
+    try:
+        yield stats
+    finally:
+        local.budget = saved
+        disable()
+
+
+@contextmanager
+def phase(name):
+    if not patched:
+        yield
+        return
+    tracing = tracemalloc.is_tracing()
+    if tracing:
+        tracemalloc.reset_peak()
+    outer = stats.peak
+    stats.peak = stats.live
+    try:
+        yield
+    finally:
+        p = stats.phases[name] = {"peak": stats.peak, "final": stats.live}
+        if tracing:
+            p["heap_final"], p["heap_peak"] = tracemalloc.get_traced_memory()
+        stats.peak = max(outer, stats.peak)
+
+
+def report(fmt="text", out=sys.stderr):
+    d = stats.as_dict()
+    if fmt == "json":
+        print(json.dumps(d), file=out)
+        return
+    print(f"accounted bytes     live {d['live']}  peak {d['peak']}", file=out)
+    for group in ("frames", "values", "closures"):
+        for name, k in d[group].items():
+            print(f"  {group:9} {name:10} {k['count']:10} allocated  {k['live']:8} live  "
+                  f"{k['peak']:8} peak  {k['bytes']:4} B", file=out)
+    k = d["cells"]
+    print(f"  {'cells':9} {'Mem':10} {k['count']:10} allocated  {k['live']:8} live  "
+          f"{k['peak']:8} peak  {k['bytes']:4} B", file=out)
+    for name, p in d["phases"].items():
+        heap = f"  heap peak {p['heap_peak']}  final {p['heap_final']}" if "heap_peak" in p else ""
+        print(f"phase {name:13} peak {p['peak']}  final {p['final']}{heap}", file=out)
@@ -0,0 +1,168 @@
+import io
+import os
+import hashlib
+import pickle
+from simpl_parser import Lexer, Parser
+from simpl_ast import *
+from simpl_lib import initial_runtime_env, initial_type_env
+from simpl_specialize import specialize
+from simpl_memo import type_vars
+from simpl_escape import scalarize
+from simpl_licm import hoist
+from simpl_fuse import fuse
+
+CACHE = "__simplcache__"
+EXT = ".spl"
+VERSION = 4
+
+
+class ModuleError(Exception):
+    pass
+
+
+def is_value(e):
+    while isinstance(e, Group):
+        e = e.e
+    if isinstance(e, (Pair, Cons)):
+        return is_value(e.l) and is_value(e.r)
+    return isinstance(e, (Fn, Rec, IntegerLiteral, BooleanLiteral, Nil, Unit))
+
+
+def render(t, names):
+    if isinstance(t, TypeVar):
+        return names[t]
+    args = [render(v, names) for v in vars(t).values() if isinstance(v, Type)]
+    return f"{type(t).__name__}({', '.join(args)})" if args else str(t)
+
+
+def interface(scheme):
+    t, vs = (scheme.t, scheme.vs) if isinstance(scheme, TypeScheme) else (scheme, ())
+    names = {a: f"'{'' if a in vs else '_'}{i}{'=' if a.equality_type else ''}"
+             for i, a in enumerate(type_vars(t))}
+    return hashlib.sha256(render(t, names).encode()).hexdigest()
+
+
+class Module:
+    def __init__(self, path, digest, scheme, deps, ast):
+        self.path = path
+        self.digest = digest
+        self.scheme = scheme
+        self.deps = deps
+        self.interface = interface(scheme)
+        self.ast = ast
+
+    def eval(self, s):
+        return self.ast.eval(State.of(initial_runtime_env(), s.M, s.p))
+
+
+class Writer(pickle.Pickler):
+    def __init__(self, f):
+        super().__init__(f, pickle.HIGHEST_PROTOCOL)
+
+    def persistent_id(self, x):
+        return x.path if isinstance(x, Module) else None
+
+
+class Reader(pickle.Unpickler):
+    def __init__(self, f, loader, active):
+        super().__init__(f)
+        self.loader = loader
+        self.active = active
+
+    def persistent_load(self, path):
+        return self.loader.load(path, self.active)
+
+
+def artifact(path):
+    d, name = os.path.split(path)
+    return os.path.join(d, CACHE, os.path.splitext(name)[0] + ".splc")
+
+
+class Loader:
+    def __init__(self, search=(), cache=True, modules=None):
+        self.search = list(search)
+        self.cache = cache
+        self.modules = {} if modules is None else modules
+        self.built = []
+        self.reused = []
+        self.session = {}
+
+    def find(self, name, base):
+        for d in [base] + self.search:
+            path = os.path.join(d, name + EXT)
+            if os.path.exists(path):
+                return os.path.abspath(path)
+        raise ModuleError(f"no module {name}")
+
+    def link(self, imports, base, active=()):
+        deps = []
+        for node in imports:
+            path = self.find(node.x, base)
+            if path in active:
+                raise ModuleError(f"import cycle through {node.x}")
+            node.path = path
+            node.linked = self.load(path, active)
+            deps.append((path, node.linked.interface))
+        return deps
+
+    def load(self, path, active=()):
+        if path in self.session:
+            return self.session[path]
+        with open(path, "rb") as f:
+            content = f.read()
+        digest = hashlib.sha256(content).hexdigest()
+        m = self.modules.get(path)
+        if m is None or m.digest != digest or not self.fresh(m.deps, active + (path,)):
+            m = self.read(path, digest, active + (path,))
+            if m is None:
+                m = self.build(path, content.decode(), digest, active + (path,))
+            self.modules[path] = m
+        self.session[path] = m
+        return m
+
+    def fresh(self, deps, active):
+        for path, iface in deps:
+            if path in active:
+                raise ModuleError(f"import cycle through {path}")
+            if not os.path.exists(path) or self.load(path, active).interface != iface:
+                return False
+        return True
+
+    def read(self, path, digest, active):
+        if not self.cache:
+            return None
+        try:
+            with open(artifact(path), "rb") as f:
+                version, stored, scheme, deps = pickle.load(f)
+                if version != VERSION or stored != digest:
+                    return None
+                data = f.read()
+        except (OSError, EOFError, pickle.UnpicklingError, ValueError):
+            return None
+        if not self.fresh(deps, active):
+            return None
+        try:
+            ast = Reader(io.BytesIO(data), self, active).load()
+        except (EOFError, pickle.UnpicklingError, ValueError):
+            return None
+        self.reused.append(path)
+        return Module(path, digest, scheme, deps, ast)
+
+    def build(self, path, content, digest, active):
+        parser = Parser(Lexer(content))
+        program = parser.parse()
+        deps = self.link(parser.imports, os.path.dirname(path), active)
+        r = program.typecheck(initial_type_env())
+        t = r.s.apply(r.t)
+        scheme = TypeScheme(tuple(type_vars(t)), t) if is_value(program) else t
+        program = fuse(hoist(scalarize(specialize(program, r.s))))
+        self.built.append(path)
+        m = Module(path, digest, scheme, deps, program)
+        if self.cache:
+            out = artifact(path)
+            os.makedirs(os.path.dirname(out), exist_ok=True)
+            with open(out + ".tmp", "wb") as f:
+                pickle.dump((VERSION, digest, scheme, deps), f, pickle.HIGHEST_PROTOCOL)
+                Writer(f).dump(program)
+            os.replace(out + ".tmp", out)
+        return m
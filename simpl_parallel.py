@@ -0,0 +1,104 @@
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from contextvars import ContextVar
+from simpl_ast import *
+
+APP_COST = 10
+THRESHOLD = 20
+
+pools = ContextVar("pools", default=None)
+
+
+def is_pure(e):
+    stack = [e]
+    while stack:
+        e = stack.pop()
+        if isinstance(e, (Ref, Deref, Assign)):
+            return False
+        stack.extend(e.children())
+    return True
+
+
+def parallelize(program, threshold=THRESHOLD):
+    costs = {}
+
+    def split(e, c):
+        n = (APP_COST if isinstance(e, App) else 1) + sum(costs[id(v)] for v in e.children())
+        if type(e) in PARALLEL and costs[id(e.l)] >= threshold and costs[id(e.r)] >= threshold:
+            e = PARALLEL[type(e)](e.l, e.r)
+        costs[id(e)] = n
+        return e
+
+    return rebuild(program, split)
+
+
+def _init_worker(limit):
+    pools.set(None)
+    sys.setrecursionlimit(limit)
+
+
+def _remote(e, E):
+    return e.eval(State.of(E, Mem(), Int(0)))
+
+
+class Pool:
+    def __init__(self, executor, slots):
+        self.executor = executor
+        self.slots = slots
+
+    def spawn(self, e, s):
+        if self.slots == 0:
+            return None
+        self.slots -= 1
+        return self.executor.submit(_remote, e, s.E)
+
+    def join(self, fut):
+        try:
+            return fut.result()
+        finally:
+            self.slots += 1
+
+
+class Spawn(BinaryExpr):
+    def eval(self, s):
+        pool = pools.get()
+        fut = pool.spawn(self.r, s) if pool is not None else None
+        if fut is None:
+            return super().eval(s)
+        v1 = self.l.eval(s)
+        return self.combine(v1, pool.join(fut), s)
+
+
+class ParApp(Spawn, App):
+    def combine(self, f, v, s): return apply(f, v, s)
+
+
+class ParPair(Spawn, Pair):
+    def combine(self, v1, v2, s): return PairValue(v1, v2)
+
+
+class ParCons(Spawn, Cons):
+    def combine(self, v1, v2, s): return ConsValue(v1, v2)
+
+
+PARALLEL = {App: ParApp, Pair: ParPair, Cons: ParCons}
+
+
+def evaluate(program, s, workers=None, threshold=THRESHOLD):
+    if not is_pure(program):
+        return program.eval(s)
+    program = parallelize(program, threshold)
+    workers = workers or os.cpu_count()
+    executor = ProcessPoolExecutor(workers, initializer=_init_worker,
+                                   initargs=(sys.getrecursionlimit(),))
+    token = pools.set(Pool(executor, workers))
+    try:
+        v = program.eval(s)
+    except BaseException:
+        executor.shutdown(cancel_futures=True)
+        raise
+    finally:
+        pools.reset(token)
+    executor.shutdown()
+    return v
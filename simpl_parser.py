@@ -1,80 +1,139 @@
 import re
+from array import array
+import simpl_ast
 from simpl_ast import *
 
 
+TOKENS = [
+    'EOF', 'MISC', 'NUM', 'ID',
+    'true', 'false', 'nil', 'not', 'ref', 'andalso', 'orelse',
+    'let', 'in', 'end', 'if', 'then', 'else', 'while', 'do', 'fn', 'rec',
+    ':=', '::', '<=', '>=', '<>', '=>', '->',
+    '-', '+', '*', '/', '%', '~', '=', '<', '>', '!', ';', ',', '(', ')',
+]
+(EOF, MISC, NUM, ID,
+ TRUE, FALSE, NIL, NOT, REF, ANDALSO, ORELSE,
+ LET, IN, END, IF, THEN, ELSE, WHILE, DO, FN, REC,
+ ASSIGN, DCOLON, LE, GE, NE, DARROW, ARROW,
+ MINUS, PLUS, STAR, SLASH, PERCENT, TILDE, EQ, LT, GT, BANG, SEMI, COMMA, LPAREN, RPAREN) = range(len(TOKENS))
+KINDS = {t: k for k, t in enumerate(TOKENS) if k > ID}
+
+NAMES = range(ID, ORELSE + 1)
+APP_START = [NUM <= k <= ORELSE or k in (LPAREN, TILDE, BANG) for k in range(len(TOKENS))]
+COMPARISONS = {EQ: 'Eq', NE: 'Neq', LT: 'Less', LE: 'LessEq', GT: 'Greater', GE: 'GreaterEq'}
+
+TOKEN = re.compile(r"""[ \t\r\n]*(?:
+    (?P<COMMENT>\(\*)
+  | (?P<NUM>\d+)
+  | (?P<ID>[a-zA-Z_][a-zA-Z0-9_']*)
+  | (?P<SYMBOL>:=|::|<=|>=|<>|=>|->|[-+*/%~=<>!;,()])
+  | (?P<MISC>[^ \t\r\n]))
+""", re.VERBOSE)
+T_COMMENT, T_NUM, T_ID, T_SYMBOL, T_MISC = range(1, 6)
+
+
+class ParseError(Exception):
+    def __init__(self, msg, text, pos):
+        line = text.count("\n", 0, pos) + 1
+        col = pos - text.rfind("\n", 0, pos)
+        super().__init__(f"{msg} at {line}:{col}")
+        self.pos = pos
+
+
 class Lexer:
     def __init__(self, text):
         self.text = text
-        self.pos = 0
-        self.tokens = self.tokenize()
+        self.names = []
+        self.name_ids = {}
+        self.tokenize()
         self.idx = 0
 
     def tokenize(self):
-        keywords = {'let', 'in', 'end', 'if', 'then',
-                    'else', 'while', 'do', 'fn', 'rec'}
-
-        token_specs = [
-            ('COMMENT', r'\(\*.*?\*\)'),
-            ('NUM', r'\d+'),
-            ('ID', r'[a-zA-Z_][a-zA-Z0-9_\']*'),
-            ('SYMBOLS', r':=|::|<=|>=|<>|=>|->|[-+*/%~=<>!;,()]'),
-            ('SKIP', r'[ \t\r\n]+'),
-            ('MISC', r'.'),
-        ]
-        tokens = []
-        i = 0
-        while i < len(self.text):
-            if self.text[i:i+2] == '(*':
-                depth = 1
-                i += 2
-                while i < len(self.text) and depth > 0:
-                    if self.text[i:i+2] == '(*':
-                        depth += 1
-                        i += 2
-                    elif self.text[i:i+2] == '*)':
-                        depth -= 1
-                        i += 2
-                    else:
-                        i += 1
-                continue
-
-            match = None
-            for type, regex in token_specs:
-                if type == 'COMMENT':
-                    continue
-                regex_compiled = re.compile(regex)
-                m = regex_compiled.match(self.text, i)
-                if m:
-                    match = m
-                    val = m.group(0)
-                    if type == 'ID' and val in keywords:
-                        tokens.append(('KEYWORD', val))
-                    elif type != 'SKIP':
-                        tokens.append((type, val))
-                    i = m.end()
+        text = self.text
+        kinds, starts, ends, ids = [], [], [], []
+        intern = self.intern
+        i, n = 0, len(text)
+        while i < n:
+            for m in TOKEN.finditer(text, i):
+                g = m.lastindex
+                if g == T_COMMENT:
+                    i = m.start(g)
                     break
-            if not match:
-                i += 1
-        return tokens
+                s, e = m.span(g)
+                if g == T_ID:
+                    word = m.group(g)
+                    kind = KINDS.get(word, ID)
+                    ids.append(intern(word) if kind <= ORELSE else -1)
+                else:
+                    kind = NUM if g == T_NUM else KINDS[m.group(g)] if g == T_SYMBOL else MISC
+                    ids.append(-1)
+                kinds.append(kind)
+                starts.append(s)
+                ends.append(e)
+            else:
+                break
+            depth = 1
+            i += 2
+            while i < n and depth > 0:
+                if text.startswith('(*', i):
+                    depth += 1
+                    i += 2
+                elif text.startswith('*)', i):
+                    depth -= 1
+                    i += 2
+                else:
+                    i += 1
+        self.kinds = array('B', kinds + [EOF])
+        self.starts = array('i', starts + [n])
+        self.ends = array('i', ends + [n])
+        self.ids = array('i', ids + [-1])
+
+    def intern(self, word):
+        k = self.name_ids.get(word)
+        if k is None:
+            k = self.name_ids[word] = len(self.names)
+            self.names.append(word)
+        return k
+
+    def __len__(self):
+        return len(self.kinds) - 1
 
     def peek(self):
-        if self.idx < len(self.tokens):
-            return self.tokens[self.idx]
-        return ('EOF', None)
-
-    def consume(self, type=None, val=None):
-        t = self.peek()
-        if type and t[0] != type:
-            return None
-        if val and t[1] != val:
-            return None
+        return self.kinds[self.idx]
+
+    def advance(self):
+        self.idx += 1
+        return self.idx - 1
+
+    def expect(self, kind):
+        if self.kinds[self.idx] == kind:
+            self.idx += 1
+
+    def name(self):
+        i = self.idx
+        if self.kinds[i] not in NAMES:
+            raise self.error("expected a name")
         self.idx += 1
-        return t
+        return self.names[self.ids[i]]
+
+    def is_import(self, i):
+        return (self.kinds[i] == ID and self.names[self.ids[i]] == "import"
+                and self.kinds[i + 1] in NAMES and self.kinds[i + 2] == IN)
+
+    def value(self, i):
+        return self.text[self.starts[i]:self.ends[i]]
+
+    def error(self, msg, i=None):
+        i = self.idx if i is None else i
+        tok = self.value(i) if self.kinds[i] != EOF else 'end of input'
+        return ParseError(f"{msg}: {tok!r}", self.text, self.starts[i])
 
 
 class Parser:
-    def __init__(self, lexer):
+    def __init__(self, lexer, ast=simpl_ast):
         self.lexer = lexer
+        self.ast = ast
+        self.imports = []
 
     def parse(self):
         return self.expr()
@@ -83,122 +142,131 @@ class Parser:
         return self.parse_let()
 
     def parse_let(self):
-        t = self.lexer.peek()
-        if t[1] == 'let':
-            self.lexer.consume()
-            name = self.lexer.consume('ID')[1]
-            self.lexer.consume(val='=')
-            e1 = self.expr()
-            self.lexer.consume(val='in')
-            e2 = self.expr()
-            self.lexer.consume(val='end')
-            return Let(name, e1, e2)
-        return self.parse_cond()
+        lx = self.lexer
+        heads = []
+        while True:
+            k = lx.peek()
+            if k == LET:
+                lx.advance()
+                name = lx.name()
+                lx.expect(EQ)
+                e1 = self.expr()
+                lx.expect(IN)
+                heads.append((name, e1))
+            elif lx.is_import(lx.idx):
+                lx.advance()
+                name = lx.name()
+                lx.expect(IN)
+                heads.append((name, None))
+            else:
+                break
+        e = self.parse_cond()
+        for name, e1 in reversed(heads):
+            lx.expect(END)
+            if e1 is None:
+                e = self.ast.Import(name, e)
+                self.imports.append(e)
+            else:
+                e = self.ast.Let(name, e1, e)
+        return e
 
     def parse_cond(self):
-        t = self.lexer.peek()
-        if t[1] == 'if':
-            self.lexer.consume()
+        lx = self.lexer
+        k = lx.peek()
+        if k == IF:
+            lx.advance()
             e1 = self.expr()
-            self.lexer.consume(val='then')
+            lx.expect(THEN)
             e2 = self.expr()
-            self.lexer.consume(val='else')
+            lx.expect(ELSE)
             e3 = self.expr()
-            return Cond(e1, e2, e3)
-        if t[1] == 'while':
-            self.lexer.consume()
+            return self.ast.Cond(e1, e2, e3)
+        if k == WHILE:
+            lx.advance()
             e1 = self.expr()
-            self.lexer.consume(val='do')
+            lx.expect(DO)
             e2 = self.expr()
-            return Loop(e1, e2)
+            return self.ast.Loop(e1, e2)
         return self.parse_fn()
 
     def parse_fn(self):
-        t = self.lexer.peek()
-        if t[1] == 'fn':
-            self.lexer.consume()
-            x = self.lexer.consume('ID')[1]
-            self.lexer.consume(val='=>')
+        lx = self.lexer
+        k = lx.peek()
+        if k == FN:
+            lx.advance()
+            x = lx.name()
+            lx.expect(DARROW)
             e = self.expr()
-            return Fn(x, e)
-        if t[1] == 'rec':
-            self.lexer.consume()
-            x = self.lexer.consume('ID')[1]
-            self.lexer.consume(val='=>')
+            return self.ast.Fn(x, e)
+        if k == REC:
+            lx.advance()
+            x = lx.name()
+            lx.expect(DARROW)
             e = self.expr()
-            return Rec(x, e)
+            return self.ast.Rec(x, e)
         return self.parse_seq()
 
     def parse_seq(self):
         left = self.parse_assign()
-        while self.lexer.peek()[1] == ';':
-            self.lexer.consume()
+        while self.lexer.peek() == SEMI:
+            self.lexer.advance()
             right = self.parse_assign()
-            left = Seq(left, right)
+            left = self.ast.Seq(left, right)
         return left
 
     def parse_assign(self):
         left = self.parse_orelse()
-        while self.lexer.peek()[1] == ':=':
-            self.lexer.consume()
+        while self.lexer.peek() == ASSIGN:
+            self.lexer.advance()
             right = self.parse_orelse()
-            left = Assign(left, right)
+            left = self.ast.Assign(left, right)
         return left
 
     def parse_orelse(self):
         left = self.parse_andalso()
-        while self.lexer.peek()[1] == 'orelse':
-            self.lexer.consume()
+        while self.lexer.peek() == ORELSE:
+            self.lexer.advance()
             right = self.parse_andalso()
-            left = OrElse(left, right)
+            left = self.ast.OrElse(left, right)
         return left
 
     def parse_andalso(self):
         left = self.parse_comp()
-        while self.lexer.peek()[1] == 'andalso':
-            self.lexer.consume()
+        while self.lexer.peek() == ANDALSO:
+            self.lexer.advance()
             right = self.parse_comp()
-            left = AndAlso(left, right)
+            left = self.ast.AndAlso(left, right)
         return left
 
     def parse_comp(self):
         left = self.parse_cons()
-        t = self.lexer.peek()[1]
-        if t in ['=', '<>', '<', '<=', '>', '>=']:
-            op = self.lexer.consume()[1]
+        op = COMPARISONS.get(self.lexer.peek())
+        if op is not None:
+            self.lexer.advance()
             right = self.parse_cons()
-            if op == '=':
-                return Eq(left, right)
-            if op == '<>':
-                return Neq(left, right)
-            if op == '<':
-                return Less(left, right)
-            if op == '<=':
-                return LessEq(left, right)
-            if op == '>':
-                return Greater(left, right)
-            if op == '>=':
-                return GreaterEq(left, right)
+            return getattr(self.ast, op)(left, right)
         return left
 
     def parse_cons(self):
-        left = self.parse_arith()
-        if self.lexer.peek()[1] == '::':
-            self.lexer.consume()
-            right = self.parse_cons()
-            return Cons(left, right)
-        return left
+        items = [self.parse_arith()]
+        while self.lexer.peek() == DCOLON:
+            self.lexer.advance()
+            items.append(self.parse_arith())
+        right = items.pop()
+        while items:
+            right = self.ast.Cons(items.pop(), right)
+        return right
 
     def parse_arith(self):
         left = self.parse_term()
         while True:
-            t = self.lexer.peek()[1]
-            if t == '+':
-                self.lexer.consume()
-                left = Add(left, self.parse_term())
-            elif t == '-':
-                self.lexer.consume()
-                left = Sub(left, self.parse_term())
+            k = self.lexer.peek()
+            if k == PLUS:
+                self.lexer.advance()
+                left = self.ast.Add(left, self.parse_term())
+            elif k == MINUS:
+                self.lexer.advance()
+                left = self.ast.Sub(left, self.parse_term())
             else:
                 break
         return left
@@ -206,70 +274,71 @@ class Parser:
     def parse_term(self):
         left = self.parse_app()
         while True:
-            t = self.lexer.peek()[1]
-            if t == '*':
-                self.lexer.consume()
-                left = Mul(left, self.parse_app())
-            elif t == '/':
-                self.lexer.consume()
-                left = Div(left, self.parse_app())
-            elif t == '%':
-                self.lexer.consume()
-                left = Mod(left, self.parse_app())
+            k = self.lexer.peek()
+            if k == STAR:
+                self.lexer.advance()
+                left = self.ast.Mul(left, self.parse_app())
+            elif k == SLASH:
+                self.lexer.advance()
+                left = self.ast.Div(left, self.parse_app())
+            elif k == PERCENT:
+                self.lexer.advance()
+                left = self.ast.Mod(left, self.parse_app())
             else:
                 break
         return left
 
     def parse_app(self):
         left = self.parse_unary()
-        while True:
-            t = self.lexer.peek()
-            if t[0] in ['NUM', 'ID'] or t[1] in ['(', 'true', 'false', 'nil', 'ref', 'not', '~', '!']:
-                right = self.parse_unary()
-                left = App(left, right)
-            else:
-                break
+        while APP_START[self.lexer.peek()]:
+            right = self.parse_unary()
+            left = self.ast.App(left, right)
         return left
 
     def parse_unary(self):
-        t = self.lexer.peek()
-        if t[1] == 'not':
-            self.lexer.consume()
-            return Not(self.parse_unary())
-        if t[1] == '~':
-            self.lexer.consume()
-            return Neg(self.parse_unary())
-        if t[1] == '!':
-            self.lexer.consume()
-            return Deref(self.parse_unary())
-        if t[1] == 'ref':
-            self.lexer.consume()
-            return Ref(self.parse_unary())
+        lx = self.lexer
+        k = lx.peek()
+        if k == NOT:
+            lx.advance()
+            return self.ast.Not(self.parse_unary())
+        if k == TILDE:
+            lx.advance()
+            return self.ast.Neg(self.parse_unary())
+        if k == BANG:
+            lx.advance()
+            return self.ast.Deref(self.parse_unary())
+        if k == REF:
+            lx.advance()
+            return self.ast.Ref(self.parse_unary())
         return self.parse_atom()
 
     def parse_atom(self):
-        t = self.lexer.consume()
-        if t[0] == 'NUM':
-            return IntegerLiteral(int(t[1]))
-        if t[0] == 'ID':
-            if t[1] == 'true':
-                return BooleanLiteral(True)
-            if t[1] == 'false':
-                return BooleanLiteral(False)
-            if t[1] == 'nil':
-                return Nil()
-            return Name(t[1])
-        if t[1] == '(':
-            if self.lexer.peek()[1] == ')':
-                self.lexer.consume()
-                return Unit()
+        lx = self.lexer
+        k = lx.peek()
+        if k == EOF:
+            raise lx.error("unexpected token")
+        i = lx.advance()
+        if k == NUM:
+            return self.ast.IntegerLiteral(int(lx.value(i)))
+        if k in NAMES:
+            if k == TRUE:
+                return self.ast.BooleanLiteral(True)
+            if k == FALSE:
+                return self.ast.BooleanLiteral(False)
+            if k == NIL:
+                return self.ast.Nil()
+            return self.ast.Name(lx.names[lx.ids[i]])
+        if k == LPAREN:
+            if lx.peek() == RPAREN:
+                lx.advance()
+                return self.ast.Unit()
             e = self.expr()
-            if self.lexer.peek()[1] == ',':
-                self.lexer.consume()
+            if lx.peek() == COMMA:
+                lx.advance()
                 e2 = self.expr()
-                self.lexer.consume(val=')')
-                return Pair(e, e2)
-            self.lexer.consume(val=')')
-            return Group(e)
+                lx.expect(RPAREN)
+                return self.ast.Pair(e, e2)
+            lx.expect(RPAREN)
+            return self.ast.Group(e)
 
-        raise Exception(f"Unexpected token: {t}")
+        raise lx.error("unexpected token", i)
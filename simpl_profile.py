@@ -0,0 +1,85 @@
+import sys
+import signal
+import time
+from collections import Counter
+from simpl_ast import *
+from simpl_ast import apply
+from simpl_lib import Native
+from simpl_fuse import OffsetApp
+
+INTERVAL = 0.01
+APP = {getattr(cls, name).__code__ for cls in (App, OffsetApp) for name in ("eval", "eval_int", "eval_bool")}
+APPLY = apply.__code__
+
+
+def label(program, names):
+    stack = [(program, None)]
+    while stack:
+        e, name = stack.pop()
+        if isinstance(e, Group):
+            stack.append((e.e, name))
+        elif isinstance(e, Fn):
+            names[id(e.e)] = name or f"fn {e.x}"
+            body = e.e
+            while isinstance(body, Group):
+                body = body.e
+            stack.append((e.e, names[id(e.e)] if isinstance(body, Fn) else None))
+        elif isinstance(e, Rec):
+            stack.append((e.e, e.x))
+        elif isinstance(e, Let):
+            stack.append((e.e2, None))
+            stack.append((e.e1, e.x))
+        else:
+            stack.extend((c, None) for c in e.children())
+    return names
+
+
+class Profiler:
+    def __init__(self, interval=INTERVAL):
+        self.interval = interval
+        self.samples = Counter()
+        self.names = {}
+        self.elapsed = 0.0
+
+    def name(self, f):
+        if isinstance(f, Native):
+            return f.name
+        if type(f) is not FunValue:
+            return type(f).__name__
+        return self.names.get(id(f.e), "fn")
+
+    def sample(self, signum, frame):
+        t0 = time.perf_counter()
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            if code is APPLY:
+                stack.append(self.name(frame.f_locals["f"]))
+            elif code in APP:
+                local = frame.f_locals
+                if "v" in local and type(local["f"]) is FunValue:
+                    stack.append(self.name(local["f"]))
+            frame = frame.f_back
+        stack.append("main")
+        self.samples[";".join(reversed(stack))] += 1
+        self.elapsed += time.perf_counter() - t0
+
+    def run(self, program, s):
+        label(program, self.names)
+        old = signal.signal(signal.SIGPROF, self.sample)
+        signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+        try:
+            return program.eval(s)
+        finally:
+            signal.setitimer(signal.ITIMER_PROF, 0)
+            signal.signal(signal.SIGPROF, old)
+
+    def collapsed(self):
+        return "".join(f"{stack} {n}\n" for stack, n in sorted(self.samples.items()))
+
+    def write(self, path):
+        if path == "-":
+            sys.stderr.write(self.collapsed())
+        else:
+            with open(path, "w") as f:
+                f.write(self.collapsed())
@@ -0,0 +1,188 @@
+import os
+import sys
+import json
+import signal
+import time
+import asyncio
+import argparse
+import multiprocessing
+import simpl
+
+DEFAULT_ADDRESS = "/tmp/simpl.sock"
+DEFAULT_TIMEOUT = 10.0
+LIMIT = 16 * 1024 * 1024
+
+
+def _worker(conn, parent):
+    simpl.interpret("let x = 1 in x + 1 end")
+    while True:
+        try:
+            if not conn.poll(1.0):
+                if os.getppid() != parent:
+                    return
+                continue
+            content = conn.recv()
+        except EOFError:
+            return
+        conn.send(simpl.interpret(content))
+
+
+class Worker:
+    def __init__(self):
+        self.conn, child = multiprocessing.Pipe()
+        self.proc = multiprocessing.Process(target=_worker, args=(child, os.getpid()), daemon=True)
+        self.proc.start()
+        child.close()
+
+    async def call(self, content):
+        loop = asyncio.get_running_loop()
+        ready = loop.create_future()
+        fd = self.conn.fileno()
+        loop.add_reader(fd, lambda: ready.done() or ready.set_result(None))
+        try:
+            self.conn.send(content)
+            await ready
+        finally:
+            loop.remove_reader(fd)
+        return self.conn.recv()
+
+    def kill(self):
+        self.proc.kill()
+        self.proc.join()
+        self.conn.close()
+
+
+class WorkerPool:
+    def __init__(self, size):
+        self.workers = [Worker() for _ in range(size)]
+        self.idle = asyncio.Queue()
+        for w in self.workers:
+            self.idle.put_nowait(w)
+
+    async def run(self, content, timeout):
+        w = await self.idle.get()
+        try:
+            return await asyncio.wait_for(w.call(content), timeout)
+        except asyncio.TimeoutError:
+            w = self.replace(w)
+            return None, "timeout"
+        except (EOFError, OSError):
+            w = self.replace(w)
+            return None, "worker crashed"
+        finally:
+            self.idle.put_nowait(w)
+
+    def replace(self, w):
+        w.kill()
+        self.workers.remove(w)
+        w = Worker()
+        self.workers.append(w)
+        return w
+
+    def close(self):
+        for w in self.workers:
+            w.kill()
+
+
+async def handle(reader, writer, pool, max_timeout):
+    while line := await reader.readline():
+        rid = None
+        try:
+            req = json.loads(line)
+            rid = req.get("id")
+            timeout = min(float(req.get("timeout", max_timeout)), max_timeout)
+            value, error = await pool.run(req["program"], timeout)
+        except (ValueError, KeyError, TypeError, AttributeError):
+            value, error = None, "bad request"
+        resp = {"id": rid, "value": value} if error is None else {"id": rid, "error": error}
+        writer.write(json.dumps(resp).encode() + b"\n")
+        await writer.drain()
+    writer.close()
+
+
+async def open_connection(address):
+    if ":" in address:
+        host, port = address.rsplit(":", 1)
+        return await asyncio.open_connection(host, int(port), limit=LIMIT)
+    return await asyncio.open_unix_connection(address, limit=LIMIT)
+
+
+async def serve(address=DEFAULT_ADDRESS, workers=None, timeout=DEFAULT_TIMEOUT):
+    pool = WorkerPool(workers or multiprocessing.cpu_count())
+    cb = lambda r, w: handle(r, w, pool, timeout)
+    if ":" in address:
+        host, port = address.rsplit(":", 1)
+        server = await asyncio.start_server(cb, host, int(port), limit=LIMIT)
+    else:
+        server = await asyncio.start_unix_server(cb, address, limit=LIMIT)
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, server.close)
+    try:
+        async with server:
+            await server.serve_forever()
+    except asyncio.CancelledError:
+        pass
+    finally:
+        pool.close()
+
+
+def percentile(xs, p):
+    return xs[min(len(xs) - 1, int(len(xs) * p / 100))]
+
+
+async def loadtest(address, content, requests=1000, concurrency=8):
+    latencies = []
+    errors = {}
+
+    async def client(n):
+        reader, writer = await open_connection(address)
+        msg = json.dumps({"program": content}).encode() + b"\n"
+        for _ in range(n):
+            t0 = time.perf_counter()
+            writer.write(msg)
+            await writer.drain()
+            resp = json.loads(await reader.readline())
+            latencies.append(time.perf_counter() - t0)
+            if "error" in resp:
+                errors[resp["error"]] = errors.get(resp["error"], 0) + 1
+        writer.close()
+
+    per_client = [requests // concurrency + (i < requests % concurrency)
+                  for i in range(concurrency)]
+    t0 = time.perf_counter()
+    await asyncio.gather(*(client(n) for n in per_client))
+    elapsed = time.perf_counter() - t0
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "concurrency": concurrency,
+        "errors": errors,
+        "throughput": len(latencies) / elapsed,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+    }
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(prog="simpl_server.py")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    sp = sub.add_parser("serve", help="serve JSON requests, one per line")
+    sp.add_argument("--address", default=DEFAULT_ADDRESS, help="unix socket path or HOST:PORT")
+    sp.add_argument("--workers", type=int, default=None)
+    sp.add_argument("--timeout", type=float, default=DEFAULT_TIMEOUT)
+    lp = sub.add_parser("loadtest", help="measure latency and throughput of a running server")
+    lp.add_argument("file")
+    lp.add_argument("--address", default=DEFAULT_ADDRESS)
+    lp.add_argument("-n", "--requests", type=int, default=1000)
+    lp.add_argument("-c", "--concurrency", type=int, default=8)
+    args = ap.parse_args()
+
+    if args.cmd == "serve":
+        try:
+            asyncio.run(serve(args.address, args.workers, args.timeout))
+        except KeyboardInterrupt:
+            pass
+    else:
+        with open(args.file) as f:
+            content = f.read()
+        stats = asyncio.run(loadtest(args.address, content, args.requests, args.concurrency))
+        print(json.dumps(stats, indent=2))
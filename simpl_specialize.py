@@ -0,0 +1,85 @@
+from simpl_ast import *
+
+
+class IntEq(Eq):
+    def eval(self, s): return BoolValue(self.l.eval_int(s) == self.r.eval_int(s))
+    def eval_bool(self, s): return self.l.eval_int(s) == self.r.eval_int(s)
+
+
+class IntNeq(Neq):
+    def eval(self, s): return BoolValue(self.l.eval_int(s) != self.r.eval_int(s))
+    def eval_bool(self, s): return self.l.eval_int(s) != self.r.eval_int(s)
+
+
+class BoolEq(Eq):
+    def eval(self, s): return BoolValue(self.l.eval_bool(s) == self.r.eval_bool(s))
+    def eval_bool(self, s): return self.l.eval_bool(s) == self.r.eval_bool(s)
+
+
+class BoolNeq(Neq):
+    def eval(self, s): return BoolValue(self.l.eval_bool(s) != self.r.eval_bool(s))
+    def eval_bool(self, s): return self.l.eval_bool(s) != self.r.eval_bool(s)
+
+
+class NilEq(Eq):
+    def eval(self, s): return BoolValue(self.eval_bool(s))
+
+    def eval_bool(self, s):
+        l, r = self.l.eval(s), self.r.eval(s)
+        return isinstance(l if isinstance(self.r, Nil) else r, NilValue)
+
+
+class NilNeq(Neq):
+    def eval(self, s): return BoolValue(self.eval_bool(s))
+
+    def eval_bool(self, s):
+        l, r = self.l.eval(s), self.r.eval(s)
+        return not isinstance(l if isinstance(self.r, Nil) else r, NilValue)
+
+
+SPECIALIZED = {
+    (Eq, IntType): IntEq,
+    (Neq, IntType): IntNeq,
+    (Eq, BoolType): BoolEq,
+    (Neq, BoolType): BoolNeq,
+    (Eq, ListType): NilEq,
+    (Neq, ListType): NilNeq,
+}
+
+
+def substitute(t, s, cache):
+    if isinstance(t, TypeVar):
+        u = cache.get(t)
+        if u is None:
+            u = cache[t] = s.apply(t)
+        return u
+    changed = {k: u for k, v in vars(t).items()
+               if isinstance(v, Type) and (u := substitute(v, s, cache)) is not v}
+    return replace(t, **changed) if changed else t
+
+
+def resolve(program, s):
+    cache = {}
+    stack = [program]
+    while stack:
+        e = stack.pop()
+        if hasattr(e, "type"):
+            e.type = substitute(e.type, s, cache)
+        stack.extend(e.children())
+
+
+def rewrite(e, c=None):
+    if type(e) in (Eq, Neq) and hasattr(e.l, "type"):
+        cls = SPECIALIZED.get((type(e), type(e.l.type)))
+        if cls in (NilEq, NilNeq) and not (isinstance(e.l, Nil) or isinstance(e.r, Nil)):
+            cls = None
+        if cls is not None:
+            n = cls(e.l, e.r)
+            n.type = e.type
+            return n
+    return e
+
+
+def specialize(program, s):
+    resolve(program, s)
+    return rebuild(program, rewrite)
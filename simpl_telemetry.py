@@ -0,0 +1,79 @@
+import sys
+import json
+import time
+import socket
+import threading
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+from simpl_ast import Expr
+from simpl_typestats import subclasses
+
+
+def nodes(e):
+    n, stack = 0, [e]
+    while stack:
+        e = stack.pop()
+        n += 1
+        stack.extend(e.children())
+    return n
+
+
+class Counter:
+    def __init__(self, codes):
+        self.codes = codes
+        self.n = 0
+
+    def __call__(self, frame, event, arg):
+        if event == "call" and frame.f_code in self.codes:
+            self.n += 1
+
+
+@contextmanager
+def counting():
+    codes = {cls.__dict__[name].__code__ for cls in subclasses(Expr)[1:]
+             for name in ("eval", "eval_int", "eval_bool") if name in cls.__dict__}
+    counter = Counter(codes)
+    old = sys.getprofile()
+    sys.setprofile(counter)
+    try:
+        yield counter
+    finally:
+        sys.setprofile(old)
+
+
+class Telemetry:
+    def __init__(self, target, steps=False):
+        self.target = target
+        self.steps = steps
+        self.lock = threading.Lock()
+        self.sock = None
+        url = urlsplit(target)
+        self.scheme = url.scheme if url.scheme in ("udp", "tcp") else "file"
+        self.address = (url.hostname, url.port)
+
+    def emit(self, record, error):
+        record = {"ts": round(time.time(), 3), **record, "error": error}
+        line = json.dumps(record) + "\n"
+        with self.lock:
+            try:
+                self.send(line.encode())
+            except OSError:
+                self.close()
+
+    def send(self, data):
+        if self.scheme == "file":
+            with open(self.target, "ab") as f:
+                f.write(data)
+        elif self.scheme == "udp":
+            if self.sock is None:
+                self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self.sock.sendto(data, self.address)
+        else:
+            if self.sock is None:
+                self.sock = socket.create_connection(self.address, timeout=1)
+            self.sock.sendall(data)
+
+    def close(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
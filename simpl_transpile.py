@@ -0,0 +1,468 @@
+import os
+import re
+import sys
+import time
+from simpl_parser import Lexer, Parser
+from simpl_ast import *
+from simpl_typing import TypeError, TypeCircularityError
+from simpl_lib import initial_type_env, NATIVES
+
+RUNTIME = '''import sys
+
+
+class SimplError(Exception):
+    pass
+
+
+def _div(a, b):
+    if b == 0:
+        raise SimplError("division by zero")
+    return int(a / b)
+
+
+def _mod(a, b):
+    if b == 0:
+        raise SimplError("division by zero")
+    return a % b
+
+
+def _hd(l):
+    if l is None:
+        raise SimplError("hd of nil")
+    return l[0]
+
+
+def _tl(l):
+    if l is None:
+        raise SimplError("tl of nil")
+    return l[1]
+
+
+def _items(l):
+    while l is not None:
+        yield l[0]
+        l = l[1]
+
+
+def _list(vs, l=None):
+    for v in reversed(vs):
+        l = (v, l)
+    return l
+
+
+def _length(l):
+    n = 0
+    while l is not None:
+        n += 1
+        l = l[1]
+    return n
+
+
+def _append(a, b): return _list(list(_items(a)), b)
+def _map(f, l): return _list([f(v) for v in _items(l)])
+
+
+def _foldl(f, z, l):
+    for v in _items(l):
+        z = f(z)(v)
+    return z
+
+
+def _rev(l):
+    r = None
+    for v in _items(l):
+        r = (v, r)
+    return r
+
+
+def _nth(l, n):
+    if n >= 0:
+        for v in _items(l):
+            if n == 0:
+                return v
+            n -= 1
+    raise SimplError("nth")
+
+
+fst = lambda p: p[0]
+snd = lambda p: p[1]
+hd = _hd
+tl = _tl
+succ = lambda n: n + 1
+pred = lambda n: n - 1
+iszero = lambda n: n == 0
+length = _length
+append = lambda a: lambda b: _append(a, b)
+map = lambda f: lambda l: _map(f, l)
+foldl = lambda f: lambda z: lambda l: _foldl(f, z, l)
+rev = _rev
+nth = lambda l: lambda n: _nth(l, n)
+
+
+def _show(v, t):
+    if t == "int":
+        return str(v)
+    if t == "bool":
+        return "true" if v else "false"
+    if t == "unit":
+        return "unit"
+    if t == "ref":
+        return f"ref@{v}"
+    if t == "fun":
+        return "fun"
+    if t == "list":
+        return "nil" if v is None else f"list@{_length(v)}"
+    if isinstance(t, tuple):
+        return f"pair@{_show(v[0], t[0])}@{_show(v[1], t[1])}"
+    if isinstance(v, bool):
+        return _show(v, "bool")
+    if isinstance(v, int):
+        return str(v)
+    if v is None:
+        return "nil"
+    if v == ():
+        return "unit"
+    if isinstance(v, tuple):
+        return _show(v, (None, None))
+    return "fun"
+'''
+
+MAIN = '''
+
+def main():
+    try:
+        return _show(run([]), {shape!r})
+    except SimplError:
+        return "runtime error"
+
+
+if __name__ == "__main__":
+    sys.setrecursionlimit(10000)
+    print(main())
+'''
+
+UNARY = {"fst": 1, "snd": 1, "hd": 1, "tl": 1, "succ": 1, "pred": 1, "iszero": 1}
+ARITY = {**UNARY, **{x: arity for x, (arity, _) in NATIVES.items()}}
+INLINE = {
+    "fst": "{0}[0]", "snd": "{0}[1]", "hd": "_hd({0})", "tl": "_tl({0})",
+    "succ": "({0} + 1)", "pred": "({0} - 1)", "iszero": "({0} == 0)",
+    "length": "_length({0})", "append": "_append({0}, {1})", "map": "_map({0}, {1})",
+    "foldl": "_foldl({0}, {1}, {2})", "rev": "_rev({0})", "nth": "_nth({0}, {1})",
+}
+OPS = {
+    Add: "+", Sub: "-", Mul: "*", Eq: "==", Neq: "!=",
+    Less: "<", LessEq: "<=", Greater: ">", GreaterEq: ">=",
+}
+ATOM = re.compile(r"\w+|\(\)")
+LITERAL = re.compile(r"\d+|True|False|None|\(\)")
+SPILL = 400
+
+
+class Unsupported(Exception):
+    pass
+
+
+def shape(t):
+    if isinstance(t, IntType):
+        return "int"
+    if isinstance(t, BoolType):
+        return "bool"
+    if isinstance(t, UnitType):
+        return "unit"
+    if isinstance(t, RefType):
+        return "ref"
+    if isinstance(t, ArrowType):
+        return "fun"
+    if isinstance(t, ListType):
+        return "list"
+    if isinstance(t, PairType):
+        return (shape(t.t1), shape(t.t2))
+    return None
+
+
+def free(e, bound=frozenset()):
+    if isinstance(e, Name):
+        return set() if e.x in bound else {e.x}
+    if isinstance(e, (Fn, Rec)):
+        return free(e.e, bound | {e.x})
+    if isinstance(e, Let):
+        return free(e.e1, bound) | free(e.e2, bound | {e.x})
+    return set().union(*(free(c, bound) for c in e.children()))
+
+
+class Transpiler:
+    def __init__(self):
+        self.n = 0
+
+    def fresh(self, x):
+        self.n += 1
+        return f"{x.replace(chr(39), '_q')}_{self.n}"
+
+    def emit(self, out, indent, line):
+        out.append("    " * indent + line)
+
+    def spill(self, code, out, indent):
+        if ATOM.fullmatch(code):
+            return code
+        t = self.fresh("t")
+        self.emit(out, indent, f"{t} = {code}")
+        return t
+
+    def operands(self, es, env, out, indent, loop):
+        codes = []
+        for e in es:
+            buf = []
+            code = self.expr(e, env, buf, indent, loop)
+            if buf:
+                codes = [self.spill(c, out, indent) for c in codes]
+                out.extend(buf)
+            if len(code) > SPILL:
+                code = self.spill(code, out, indent)
+            codes.append(code)
+        return codes
+
+    def branch(self, e, env, indent, loop):
+        buf = []
+        return self.expr(e, env, buf, indent, loop), buf
+
+    def expr(self, e, env, out, indent, loop):
+        while isinstance(e, Group):
+            e = e.e
+        if isinstance(e, IntegerLiteral):
+            return repr(e.n)
+        if isinstance(e, BooleanLiteral):
+            return repr(e.b)
+        if isinstance(e, Unit):
+            return "()"
+        if isinstance(e, Nil):
+            return "None"
+        if isinstance(e, Name):
+            return env.get(e.x, e.x)
+        if isinstance(e, Let):
+            code = self.expr(e.e1, env, out, indent, loop)
+            if not ATOM.fullmatch(code) or loop is not None and not LITERAL.fullmatch(code):
+                x = self.fresh(e.x)
+                self.emit(out, indent, f"{x} = {code}")
+                if loop is not None:
+                    loop.add(x)
+                code = x
+            return self.expr(e.e2, {**env, e.x: code}, out, indent, loop)
+        if isinstance(e, Seq):
+            code = self.expr(e.l, env, out, indent, loop)
+            if not ATOM.fullmatch(code):
+                self.emit(out, indent, code)
+            return self.expr(e.r, env, out, indent, loop)
+        if isinstance(e, Cond):
+            c = self.expr(e.e1, env, out, indent, loop)
+            a, abuf = self.branch(e.e2, env, indent + 1, loop)
+            b, bbuf = self.branch(e.e3, env, indent + 1, loop)
+            if not abuf and not bbuf:
+                return f"({a} if {c} else {b})"
+            t = self.fresh("t")
+            self.emit(out, indent, f"if {c}:")
+            out.extend(abuf)
+            self.emit(out, indent + 1, f"{t} = {a}")
+            self.emit(out, indent, "else:")
+            out.extend(bbuf)
+            self.emit(out, indent + 1, f"{t} = {b}")
+            return t
+        if isinstance(e, (AndAlso, OrElse)):
+            a = self.expr(e.l, env, out, indent, loop)
+            b, buf = self.branch(e.r, env, indent + 1, loop)
+            op = "and" if isinstance(e, AndAlso) else "or"
+            if not buf:
+                return f"({a} {op} {b})"
+            t = self.fresh("t")
+            self.emit(out, indent, f"{t} = {a}")
+            self.emit(out, indent, f"if {'' if op == 'and' else 'not '}{t}:")
+            out.extend(buf)
+            self.emit(out, indent + 1, f"{t} = {b}")
+            return t
+        if isinstance(e, Loop):
+            names = set()
+            c, cbuf = self.branch(e.e1, env, indent + 1, names)
+            body = []
+            code = self.expr(e.e2, env, body, indent + 1, names)
+            if not ATOM.fullmatch(code):
+                self.emit(body, indent + 1, code)
+            if loop is not None:
+                loop.update(names)
+            if cbuf:
+                self.emit(out, indent, "while True:")
+                out.extend(cbuf)
+                self.emit(out, indent + 1, f"if not {c}:")
+                self.emit(out, indent + 2, "break")
+            else:
+                self.emit(out, indent, f"while {c}:")
+            out.extend(body or ["    " * (indent + 1) + "pass"])
+            return "()"
+        if isinstance(e, Fn):
+            return self.function(e, env, out, indent, loop, self.fresh("fn"), env)
+        if isinstance(e, Rec):
+            body = e.e
+            while isinstance(body, Group):
+                body = body.e
+            f = self.fresh(e.x)
+            if isinstance(body, Fn):
+                return self.function(body, env, out, indent, loop, f, {**env, e.x: f}, e)
+            self.emit(out, indent, f"def {f}():")
+            inner = []
+            code = self.expr(body, {**env, e.x: f"{f}()"}, inner, indent + 1, None)
+            out.extend(inner)
+            self.emit(out, indent + 1, f"return {code}")
+            return f"{f}()"
+        if isinstance(e, Ref):
+            t = self.fresh("r")
+            self.emit(out, indent, f"{t} = len(M)")
+            self.emit(out, indent, "M.append(None)")
+            code = self.expr(e.e, env, out, indent, loop)
+            self.emit(out, indent, f"M[{t}] = {code}")
+            return t
+        if isinstance(e, Deref):
+            return f"M[{self.expr(e.e, env, out, indent, loop)}]"
+        if isinstance(e, Assign):
+            l, r = self.operands([e.l, e.r], env, out, indent, loop)
+            l = self.spill(l, out, indent)
+            self.emit(out, indent, f"M[{l}] = {r}")
+            return "()"
+        if isinstance(e, Neg):
+            return f"(-{self.expr(e.e, env, out, indent, loop)})"
+        if isinstance(e, Not):
+            return f"(not {self.expr(e.e, env, out, indent, loop)})"
+        if isinstance(e, (Div, Mod)):
+            fn = "_div" if isinstance(e, Div) else "_mod"
+            r = self.expr(e.r, env, out, indent, loop)
+            l, buf = self.branch(e.l, env, indent, loop)
+            if ATOM.fullmatch(l) and not buf:
+                return f"{fn}({l}, {r})"
+            r = self.spill(r, out, indent)
+            self.emit(out, indent, f"if {r} == 0:")
+            self.emit(out, indent + 1, 'raise SimplError("division by zero")')
+            out.extend(buf)
+            return f"{fn}({l}, {r})"
+        if isinstance(e, App):
+            return self.app(e, env, out, indent, loop)
+        if isinstance(e, (Pair, Cons)):
+            l, r = self.operands([e.l, e.r], env, out, indent, loop)
+            return f"({l}, {r})"
+        if type(e) in OPS or isinstance(e, tuple(OPS)):
+            op = next(op for cls, op in OPS.items() if isinstance(e, cls))
+            l, r = self.operands([e.l, e.r], env, out, indent, loop)
+            return f"({l} {op} {r})"
+        raise Unsupported(type(e).__name__)
+
+    def app(self, e, env, out, indent, loop):
+        args = []
+        f = e
+        while isinstance(f, App):
+            args.append(f.r)
+            f = f.l
+            while isinstance(f, Group):
+                f = f.e
+        args.reverse()
+        if isinstance(f, Name) and f.x not in env and ARITY.get(f.x) == len(args):
+            return INLINE[f.x].format(*self.operands(args, env, out, indent, loop))
+        l, r = self.operands([e.l, e.r], env, out, indent, loop)
+        return f"{l}({r})"
+
+    def function(self, fn, env, out, indent, loop, name, scope, rec=None):
+        x = self.fresh(fn.x)
+        params = [x]
+        if loop:
+            captured = free(rec or fn) & scope.keys()
+            params += [f"{scope[y]}={scope[y]}" for y in sorted(captured) if scope[y] in loop]
+        inner = []
+        code = self.expr(fn.e, {**scope, fn.x: x}, inner, indent + 1, None)
+        if not inner and rec is None:
+            return f"(lambda {', '.join(params)}: {code})"
+        self.emit(out, indent, f"def {name}({', '.join(params)}):")
+        out.extend(inner)
+        self.emit(out, indent + 1, f"return {code}")
+        return name
+
+
+def translate(program, t):
+    tr = Transpiler()
+    body = []
+    code = tr.expr(program, {}, body, 1, None)
+    lines = [RUNTIME, "", "def run(M):"] + body + [f"    return {code}"]
+    return "\n".join(lines) + MAIN.format(shape=shape(t))
+
+
+def transpile(content):
+    program = Parser(Lexer(content)).parse()
+    r = program.typecheck(initial_type_env())
+    return translate(program, r.s.apply(r.t))
+
+
+def load(source, filename="<simpl>"):
+    scope = {"__name__": "simpl_program"}
+    exec(compile(source, filename, "exec"), scope)
+    return scope["main"]
+
+
+def run(content):
+    try:
+        source = transpile(content)
+    except (TypeError, TypeCircularityError):
+        return "type error"
+    except Unsupported:
+        raise
+    except Exception:
+        return "syntax error"
+    return load(source)()
+
+
+def write(content, path):
+    with open(path, "w") as f:
+        f.write(transpile(content))
+
+
+def conform(paths, repeat=3):
+    from simpl import interpret
+    failed = 0
+    for path in paths:
+        with open(path) as f:
+            content = f.read()
+        t0 = time.perf_counter()
+        value, error = interpret(content)
+        t1 = time.perf_counter()
+        expected = error or value
+        try:
+            got = run(content)
+        except Unsupported as e:
+            got = f"unsupported {e}"
+        t2 = time.perf_counter()
+        ok = got == expected
+        failed += not ok
+        print(f"{'ok  ' if ok else 'FAIL'} {os.path.basename(path):24} {expected:12} {got:12} "
+              f"eval {(t1 - t0) * 1000:7.2f} ms  native {(t2 - t1) * 1000:7.2f} ms")
+    return failed
+
+
+def main(argv):
+    import argparse
+    ap = argparse.ArgumentParser(prog="simpl_transpile.py")
+    ap.add_argument("files", nargs="*")
+    ap.add_argument("-o", "--output", metavar="PATH",
+                    help="write the generated Python module to PATH")
+    ap.add_argument("--conform", action="store_true",
+                    help="compare transpiled results with the interpreter (default doc/examples)")
+    args = ap.parse_args(argv)
+    sys.setrecursionlimit(10000)
+    if args.conform:
+        paths = args.files or sorted(
+            os.path.join("doc/examples", f) for f in os.listdir("doc/examples") if f.endswith(".spl"))
+        return 1 if conform(paths) else 0
+    for path in args.files:
+        with open(path) as f:
+            content = f.read()
+        if args.output:
+            write(content, args.output)
+        else:
+            print(run(content))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
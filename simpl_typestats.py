@@ -0,0 +1,180 @@
+import sys
+import json
+import time
+from functools import wraps
+from simpl_typing import Type, TypeVar, Compose
+from simpl_ast import Expr
+
+patched = []
+
+
+class Histogram:
+    def __init__(self):
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def add(self, n):
+        self.count += 1
+        self.total += n
+        self.max = max(self.max, n)
+
+    def as_dict(self):
+        mean = self.total / self.count if self.count else 0.0
+        return {"count": self.count, "total": self.total, "max": self.max, "mean": round(mean, 2)}
+
+
+class Stats:
+    def __init__(self):
+        self.unify = {}
+        self.typevars = 0
+        self.compose = Histogram()
+        self.occurs = Histogram()
+        self.nodes = {}
+        self.visits = 0
+        self.applying = False
+        self.timers = []
+
+    def as_dict(self):
+        return {
+            "unify": dict(sorted(self.unify.items(), key=lambda kv: -kv[1])),
+            "typevars": self.typevars,
+            "compose_chain": self.compose.as_dict(),
+            "occurs_check": self.occurs.as_dict(),
+            "typecheck": {k: {"count": n, "ms": round(t * 1000, 3)}
+                          for k, (n, t) in sorted(self.nodes.items(), key=lambda kv: -kv[1][1])},
+        }
+
+
+stats = Stats()
+
+
+def chain(s):
+    n, stack = 0, [s]
+    while stack:
+        s = stack.pop()
+        if isinstance(s, Compose):
+            stack.append(s.f)
+            stack.append(s.g)
+        else:
+            n += 1
+    return n
+
+
+def patch(cls, name, wrapper):
+    original = cls.__dict__[name]
+    patched.append((cls, name, original))
+    setattr(cls, name, wraps(original)(wrapper(original)))
+
+
+def count_unify(original):
+    def unify(self, t):
+        key = type(self).__name__
+        stats.unify[key] = stats.unify.get(key, 0) + 1
+        return original(self, t)
+    return unify
+
+
+def occurs_unify(original):
+    def unify(self, t):
+        stats.unify["TypeVar"] = stats.unify.get("TypeVar", 0) + 1
+        before = stats.visits
+        try:
+            return original(self, t)
+        finally:
+            if t is not self:
+                stats.occurs.add(stats.visits - before)
+    return unify
+
+
+def count_contains(original):
+    def contains(self, tv):
+        stats.visits += 1
+        return original(self, tv)
+    return contains
+
+
+def count_typevar(original):
+    def __init__(self, equality_type):
+        stats.typevars += 1
+        original(self, equality_type)
+    return __init__
+
+
+def measure_compose(original):
+    def apply(self, t):
+        if stats.applying:
+            return original(self, t)
+        stats.compose.add(chain(self))
+        stats.applying = True
+        try:
+            return original(self, t)
+        finally:
+            stats.applying = False
+    return apply
+
+
+def time_typecheck(original):
+    def typecheck(self, E):
+        timers = stats.timers
+        timers.append(0.0)
+        t0 = time.perf_counter()
+        try:
+            return original(self, E)
+        finally:
+            elapsed = time.perf_counter() - t0
+            inner = timers.pop()
+            if timers:
+                timers[-1] += elapsed
+            key = type(self).__name__
+            n, t = stats.nodes.get(key, (0, 0.0))
+            stats.nodes[key] = (n + 1, t + elapsed - inner)
+    return typecheck
+
+
+def subclasses(cls):
+    out, stack = [], [cls]
+    while stack:
+        c = stack.pop()
+        out.append(c)
+        stack.extend(c.__subclasses__())
+    return out
+
+
+def enable():
+    global stats
+    if patched:
+        return
+    stats = Stats()
+    for cls in subclasses(Type):
+        if "unify" in cls.__dict__:
+            patch(cls, "unify", occurs_unify if cls is TypeVar else count_unify)
+        if "contains" in cls.__dict__:
+            patch(cls, "contains", count_contains)
+    patch(TypeVar, "__init__", count_typevar)
+    patch(Compose, "apply", measure_compose)
+    for cls in subclasses(Expr):
+        if "typecheck" in cls.__dict__:
+            patch(cls, "typecheck", time_typecheck)
+
+
+def disable():
+    while patched:
+        cls, name, original = patched.pop()
+        setattr(cls, name, original)
+
+
+def report(fmt="text", out=sys.stderr):
+    d = stats.as_dict()
+    if fmt == "json":
+        print(json.dumps(d), file=out)
+        return
+    print(f"typevars allocated  {d['typevars']}", file=out)
+    print("unify calls         " + "  ".join(f"{k} {n}" for k, n in d["unify"].items()), file=out)
+    for name in ("compose_chain", "occurs_check"):
+        h = d[name]
+        print(f"{name.replace('_', ' '):19} {h['count']} calls  mean {h['mean']}  max {h['max']}",
+              file=out)
+    print("typecheck self time", file=out)
+    for k, v in d["typecheck"].items():
+        print(f"  {k:16} {v['count']:8}  {v['ms']:10.3f} ms", file=out)
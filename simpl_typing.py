@@ -1,4 +1,16 @@
 from dataclasses import dataclass
+from contextvars import ContextVar
+from itertools import count
+
+tv_supply = ContextVar("tv_supply", default=None)
+prelude_supply = count(1)
+
+def _supply():
+    tvs = tv_supply.get()
+    if tvs is None:
+        tvs = count(1)
+        tv_supply.set(tvs)
+    return tvs
 
 class TypeError(Exception):
     pass
@@ -132,12 +144,13 @@ class UnitType(Type):
     def __str__(self): return "unit"
 
 class TypeVar(Type):
-    _tvcnt = 0
-    
-    def __init__(self, equality_type):
+    def __init__(self, equality_type, name=None):
         self.equality_type = equality_type
-        TypeVar._tvcnt += 1
-        self.name = f"tv{TypeVar._tvcnt}"
+        self.name = name or f"tv{next(_supply())}"
+
+    @staticmethod
+    def prelude(equality_type):
+        return TypeVar(equality_type, f"pv{next(prelude_supply)}")
     
     def is_equality_type(self): return self.equality_type
     
@@ -154,6 +167,21 @@ class TypeVar(Type):
     
     def __str__(self): return self.name
 
+@dataclass
+class TypeScheme(Type):
+    vs: tuple
+    t: Type
+
+    def instantiate(self):
+        t = self.t
+        for a in self.vs:
+            t = t.replace(a, TypeVar(a.equality_type))
+        return t
+
+    def contains(self, tv): return False
+    def replace(self, a, t): return self
+    def __str__(self): return f"forall {' '.join(map(str, self.vs))}. {self.t}"
+
 @dataclass
 class ArrowType(Type):
     t1: Type
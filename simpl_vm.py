@@ -0,0 +1,486 @@
+import sys
+import time
+import pickle
+from array import array
+from simpl_parser import Lexer, Parser
+from simpl_ast import *
+from simpl_typing import TypeError, TypeCircularityError
+from simpl_lib import initial_type_env, NATIVES
+from simpl_transpile import shape, free
+
+MAGIC = b"SPLB1"
+
+OPS = (
+    "LOCAL", "CONST", "DEREF", "FREE", "JUMP_IF_FALSE", "ASSIGN", "POP", "JUMP", "CALL", "TAIL_CALL",
+    "RETURN", "SELF", "ADD", "SUB", "LT", "EQ", "NE", "LE", "GT", "GE", "MUL", "STORE",
+    "ALLOC", "SETREF", "NONZERO", "DIV", "MOD", "NEG", "NOT", "PAIR", "CONS", "CLOSURE", "HALT",
+)
+(LOCAL, CONST, DEREF, FREE, JUMP_IF_FALSE, ASSIGN, POP, JUMP, CALL, TAIL_CALL,
+ RETURN, SELF, ADD, SUB, LT, EQ, NE, LE, GT, GE, MUL, STORE,
+ ALLOC, SETREF, NONZERO, DIV, MOD, NEG, NOT, PAIR, CONS, CLOSURE, HALT) = range(len(OPS))
+
+BINARY = {Add: ADD, Sub: SUB, Mul: MUL, Eq: EQ, Neq: NE,
+          Less: LT, LessEq: LE, Greater: GT, GreaterEq: GE, Pair: PAIR, Cons: CONS}
+UNIT = ()
+ARITY = {"fst": 1, "snd": 1, "hd": 1, "tl": 1, "succ": 1, "pred": 1, "iszero": 1,
+         **{x: arity for x, (arity, _) in NATIVES.items()}}
+
+
+class Unsupported(Exception):
+    pass
+
+
+class Code:
+    def __init__(self, name, nlocals=0):
+        self.name = name
+        self.ops = array("i")
+        self.consts = []
+        self.nlocals = nlocals
+        self.captures = []
+        self.index = {}
+
+    def emit(self, op, arg=0):
+        self.ops.append(op)
+        self.ops.append(arg)
+        return len(self.ops) - 1
+
+    def const(self, v):
+        key = (type(v), v.name if isinstance(v, Builtin) else v) if not isinstance(v, Code) else None
+        i = self.index.get(key)
+        if i is None:
+            i = len(self.consts)
+            self.consts.append(v)
+            if key is not None:
+                self.index[key] = i
+        return i
+
+    def local(self):
+        self.nlocals += 1
+        return self.nlocals - 1
+
+
+class Closure:
+    __slots__ = ("code", "free")
+
+    def __init__(self, code, free):
+        self.code = code
+        self.free = free
+
+
+class Builtin:
+    __slots__ = ("name", "args")
+
+    def __init__(self, name, args=()):
+        self.name = name
+        self.args = args
+
+    def __eq__(self, other): return self is other
+    def __reduce__(self): return Builtin, (self.name, self.args)
+
+
+class Compiler:
+    def function(self, name, x, body, env, rec=None):
+        code = Code(name, 1)
+        inner = {x: (LOCAL, 0)}
+        if rec is not None:
+            inner[rec] = (SELF, 0)
+        for y in sorted(free(body, frozenset(inner))):
+            if y in env:
+                code.captures.append(env[y])
+                inner[y] = (FREE, len(code.captures) - 1)
+        self.expr(body, code, inner, True)
+        code.emit(RETURN)
+        return code
+
+    def expr(self, e, code, env, tail=False):
+        while isinstance(e, Group):
+            e = e.e
+        if isinstance(e, IntegerLiteral):
+            code.emit(CONST, code.const(e.n))
+        elif isinstance(e, BooleanLiteral):
+            code.emit(CONST, code.const(e.b))
+        elif isinstance(e, Unit):
+            code.emit(CONST, code.const(UNIT))
+        elif isinstance(e, Nil):
+            code.emit(CONST, code.const(None))
+        elif isinstance(e, Name):
+            if e.x in env:
+                code.emit(*env[e.x])
+            elif e.x in ARITY:
+                code.emit(CONST, code.const(Builtin(e.x)))
+            else:
+                raise Unsupported(e.x)
+        elif isinstance(e, Let):
+            self.expr(e.e1, code, env)
+            slot = code.local()
+            code.emit(STORE, slot)
+            self.expr(e.e2, code, {**env, e.x: (LOCAL, slot)}, tail)
+        elif isinstance(e, Seq):
+            self.expr(e.l, code, env)
+            code.emit(POP)
+            self.expr(e.r, code, env, tail)
+        elif isinstance(e, Cond):
+            self.expr(e.e1, code, env)
+            branch = code.emit(JUMP_IF_FALSE)
+            self.expr(e.e2, code, env, tail)
+            end = code.emit(JUMP)
+            code.ops[branch] = len(code.ops)
+            self.expr(e.e3, code, env, tail)
+            code.ops[end] = len(code.ops)
+        elif isinstance(e, (AndAlso, OrElse)):
+            self.expr(Cond(e.l, e.r, BooleanLiteral(False)) if isinstance(e, AndAlso)
+                      else Cond(e.l, BooleanLiteral(True), e.r), code, env, tail)
+        elif isinstance(e, Loop):
+            top = len(code.ops)
+            self.expr(e.e1, code, env)
+            exit = code.emit(JUMP_IF_FALSE)
+            self.expr(e.e2, code, env)
+            code.emit(POP)
+            code.emit(JUMP, top)
+            code.ops[exit] = len(code.ops)
+            code.emit(CONST, code.const(UNIT))
+        elif isinstance(e, (Fn, Rec)):
+            fn, rec = e, None
+            if isinstance(e, Rec):
+                fn, rec = e.e, e.x
+                while isinstance(fn, Group):
+                    fn = fn.e
+                if not isinstance(fn, Fn):
+                    raise Unsupported(e)
+            code.emit(CLOSURE, code.const(self.function(rec or "fn", fn.x, fn.e, env, rec)))
+        elif isinstance(e, App):
+            self.expr(e.l, code, env)
+            self.expr(e.r, code, env)
+            code.emit(TAIL_CALL if tail else CALL)
+        elif isinstance(e, Ref):
+            code.emit(ALLOC)
+            self.expr(e.e, code, env)
+            code.emit(SETREF)
+        elif isinstance(e, Deref):
+            self.expr(e.e, code, env)
+            code.emit(DEREF)
+        elif isinstance(e, Assign):
+            self.expr(e.l, code, env)
+            self.expr(e.r, code, env)
+            code.emit(ASSIGN)
+        elif isinstance(e, (Div, Mod)):
+            self.expr(e.r, code, env)
+            code.emit(NONZERO)
+            self.expr(e.l, code, env)
+            code.emit(DIV if isinstance(e, Div) else MOD)
+        elif isinstance(e, (Neg, Not)):
+            self.expr(e.e, code, env)
+            code.emit(NEG if isinstance(e, Neg) else NOT)
+        elif isinstance(e, BinaryExpr) and not isinstance(e, Seq):
+            op = next((op for cls, op in BINARY.items() if isinstance(e, cls)), None)
+            if op is None:
+                raise Unsupported(e)
+            self.expr(e.l, code, env)
+            self.expr(e.r, code, env)
+            code.emit(op)
+        else:
+            raise Unsupported(e)
+
+
+def compile_program(program):
+    code = Code("main")
+    Compiler().expr(program, code, {})
+    code.emit(HALT)
+    return code
+
+
+def _items(l):
+    while l is not None:
+        yield l[0]
+        l = l[1]
+
+
+def _list(vs, l=None):
+    for v in reversed(vs):
+        l = (v, l)
+    return l
+
+
+class VM:
+    def __init__(self, s):
+        self.M = s.M
+        self.p = s.p
+        self.steps = 0
+
+    def apply(self, f, v):
+        if type(f) is Closure:
+            return self.execute(f.code, f, v)
+        return self.builtin(f, v)
+
+    def builtin(self, f, v):
+        args = f.args + (v,)
+        if len(args) < ARITY[f.name]:
+            return Builtin(f.name, args)
+        name = f.name
+        if name == "fst":
+            return v[0]
+        if name == "snd":
+            return v[1]
+        if name == "hd" or name == "tl":
+            if v is None:
+                raise RuntimeError(f"{name} of nil")
+            return v[0] if name == "hd" else v[1]
+        if name == "succ":
+            return v + 1
+        if name == "pred":
+            return v - 1
+        if name == "iszero":
+            return v == 0
+        if name == "length":
+            return sum(1 for _ in _items(v))
+        if name == "append":
+            return _list(list(_items(args[0])), v)
+        if name == "map":
+            return _list([self.apply(args[0], x) for x in _items(v)])
+        if name == "foldl":
+            z = args[1]
+            for x in _items(v):
+                z = self.apply(self.apply(args[0], z), x)
+            return z
+        if name == "rev":
+            r = None
+            for x in _items(v):
+                r = (x, r)
+            return r
+        if name == "nth":
+            i = v
+            if i >= 0:
+                for x in _items(args[0]):
+                    if i == 0:
+                        return x
+                    i -= 1
+            raise RuntimeError("nth")
+        raise RuntimeError(name)
+
+    def execute(self, code, closure=None, arg=None):
+        M = self.M.map
+        p = self.p
+        ops, consts = code.ops, code.consts
+        local = [None] * code.nlocals
+        if code.nlocals:
+            local[0] = arg
+        stack = []
+        push, pop = stack.append, stack.pop
+        frames = []
+        pc = 0
+        n = 0
+        try:
+            while True:
+                op = ops[pc]
+                arg = ops[pc + 1]
+                pc += 2
+                n += 1
+                if op < RETURN:
+                    if op == LOCAL:
+                        push(local[arg])
+                    elif op == CONST:
+                        push(consts[arg])
+                    elif op == DEREF:
+                        push(M[pop()])
+                    elif op == FREE:
+                        push(closure.free[arg])
+                    elif op == JUMP_IF_FALSE:
+                        if not pop():
+                            pc = arg
+                    elif op == ASSIGN:
+                        v = pop()
+                        M[pop()] = v
+                        push(UNIT)
+                    elif op == POP:
+                        pop()
+                    elif op == JUMP:
+                        pc = arg
+                    else:
+                        v = pop()
+                        f = pop()
+                        if type(f) is Closure:
+                            if op == CALL:
+                                frames.append((ops, consts, pc, local, closure))
+                            closure = f
+                            code = f.code
+                            ops, consts = code.ops, code.consts
+                            local = [None] * code.nlocals
+                            local[0] = v
+                            pc = 0
+                        else:
+                            push(self.builtin(f, v))
+                            if op == TAIL_CALL:
+                                if not frames:
+                                    return pop()
+                                ops, consts, pc, local, closure = frames.pop()
+                elif op == RETURN:
+                    if not frames:
+                        return pop()
+                    ops, consts, pc, local, closure = frames.pop()
+                elif op == SELF:
+                    push(closure)
+                elif op == ADD:
+                    r = pop()
+                    stack[-1] += r
+                elif op == SUB:
+                    r = pop()
+                    stack[-1] -= r
+                elif op == LT:
+                    r = pop()
+                    stack[-1] = stack[-1] < r
+                elif op == EQ:
+                    r = pop()
+                    stack[-1] = stack[-1] == r
+                elif op == NE:
+                    r = pop()
+                    stack[-1] = stack[-1] != r
+                elif op == LE:
+                    r = pop()
+                    stack[-1] = stack[-1] <= r
+                elif op == GT:
+                    r = pop()
+                    stack[-1] = stack[-1] > r
+                elif op == GE:
+                    r = pop()
+                    stack[-1] = stack[-1] >= r
+                elif op == MUL:
+                    r = pop()
+                    stack[-1] *= r
+                elif op == STORE:
+                    local[arg] = pop()
+                elif op == ALLOC:
+                    ptr = p.get()
+                    p.set(ptr + 1)
+                    push(ptr)
+                elif op == SETREF:
+                    v = pop()
+                    M[stack[-1]] = v
+                elif op == NONZERO:
+                    if stack[-1] == 0:
+                        raise RuntimeError("division by zero")
+                elif op == DIV:
+                    l = pop()
+                    stack[-1] = int(l / stack[-1])
+                elif op == MOD:
+                    l = pop()
+                    stack[-1] = l % stack[-1]
+                elif op == NEG:
+                    stack[-1] = -stack[-1]
+                elif op == NOT:
+                    stack[-1] = not stack[-1]
+                elif op == PAIR or op == CONS:
+                    r = pop()
+                    stack[-1] = (stack[-1], r)
+                elif op == CLOSURE:
+                    c = consts[arg]
+                    push(Closure(c, tuple(local[i] if kind == LOCAL else
+                                          closure.free[i] if kind == FREE else closure
+                                          for kind, i in c.captures)))
+                elif op == HALT:
+                    return pop()
+        finally:
+            self.steps += n
+
+
+def show(v, t):
+    if t == "int":
+        return str(v)
+    if t == "bool":
+        return "true" if v else "false"
+    if t == "unit":
+        return "unit"
+    if t == "ref":
+        return f"ref@{v}"
+    if t == "fun":
+        return "fun"
+    if t == "list":
+        return "nil" if v is None else f"list@{sum(1 for _ in _items(v))}"
+    if isinstance(t, tuple):
+        return f"pair@{show(v[0], t[0])}@{show(v[1], t[1])}"
+    if isinstance(v, bool):
+        return show(v, "bool")
+    if isinstance(v, int):
+        return str(v)
+    if v is None:
+        return "nil"
+    if v == UNIT:
+        return "unit"
+    if isinstance(v, tuple):
+        return show(v, (None, None))
+    return "fun"
+
+
+def evaluate(program, s, t):
+    try:
+        code = compile_program(program)
+    except Unsupported:
+        return str(program.eval(s))
+    return show(VM(s).execute(code), shape(t))
+
+
+def dumps(code, t):
+    return MAGIC + pickle.dumps((shape(t), code), pickle.HIGHEST_PROTOCOL)
+
+
+def loads(data):
+    if not data.startswith(MAGIC):
+        raise ValueError("not a SimPL bytecode file")
+    return pickle.loads(data[len(MAGIC):])
+
+
+def dis(code, out=sys.stdout):
+    captures = ", ".join(f"{OPS[kind]} {i}" for kind, i in code.captures)
+    print(f"{code.name}: {code.nlocals} locals, captures [{captures}]", file=out)
+    for pc in range(0, len(code.ops), 2):
+        op, arg = OPS[code.ops[pc]], code.ops[pc + 1]
+        detail = f" ({code.consts[arg]!r})" if op == "CONST" else ""
+        print(f"  {pc:5} {op:14} {arg}{detail}", file=out)
+    for c in code.consts:
+        if isinstance(c, Code):
+            dis(c, out)
+
+
+def main(argv):
+    import argparse
+    from simpl_interpreter import InitialState, Mem, Int
+    from simpl_lib import initial_runtime_env
+    ap = argparse.ArgumentParser(prog="simpl_vm.py")
+    ap.add_argument("file")
+    ap.add_argument("-o", "--output", metavar="PATH", help="write the compiled bytecode to PATH")
+    ap.add_argument("--dis", action="store_true", help="print the bytecode")
+    ap.add_argument("--stats", action="store_true", help="report instructions executed per second")
+    args = ap.parse_args(argv)
+    with open(args.file, "rb") as f:
+        data = f.read()
+    if data.startswith(MAGIC):
+        t, code = loads(data)
+    else:
+        program = Parser(Lexer(data.decode())).parse()
+        try:
+            r = program.typecheck(initial_type_env())
+        except (TypeError, TypeCircularityError):
+            print("type error")
+            return
+        code = compile_program(program)
+        t = shape(r.s.apply(r.t))
+        if args.output:
+            with open(args.output, "wb") as f:
+                f.write(dumps(code, r.s.apply(r.t)))
+            return
+    if args.dis:
+        dis(code)
+        return
+    vm = VM(InitialState.of(initial_runtime_env(), Mem(), Int(0)))
+    t0 = time.perf_counter()
+    try:
+        print(show(vm.execute(code), t))
+    except RuntimeError:
+        print("runtime error")
+    elapsed = time.perf_counter() - t0
+    if args.stats:
+        print(f"vm: {vm.steps} instructions in {elapsed * 1000:.2f} ms "
+              f"({vm.steps / elapsed / 1e6:.2f} M/s)", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])